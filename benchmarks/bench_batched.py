@@ -0,0 +1,66 @@
+"""Benchmark batched MRData objects against lists of single subjects.
+
+Each subject is simulated with MRSigFlash and multiplied with a random bias
+field, either subject by subject or once for a stacked batch. On the cpu,
+batches mainly pay off for small volumes. The unfused signal equation of
+large batches is limited by memory bandwidth, use --compile to fuse it.
+
+Usage: python benchmarks/bench_batched.py --size 32 64 --batch 8 32
+"""
+import argparse
+
+import torch
+from bench_utils import best_time
+
+from inhomcorr.bias_creator.torchio_bias import BiasCreatorTorchio
+from inhomcorr.mrdata import QMRIData
+from inhomcorr.mrsig.flash import MRParamGRE
+from inhomcorr.mrsig.flash import MRSigFlash
+
+
+def main() -> None:
+    """Run the benchmark and print a table of the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, nargs='+', default=[32, 64])
+    parser.add_argument('--batch', type=int, nargs='+', default=[8, 32])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--compile', action='store_true')
+    args = parser.parse_args()
+
+    mrsig = MRSigFlash(compile=args.compile)
+    bias_creator = BiasCreatorTorchio(seed=0)
+    param = MRParamGRE(tr=20e-3, alpha=0.3)
+    print(f'{"size":>6} {"batch":>6} {"list [s]":>10} {"batched [s]":>12} '
+          f'{"speedup":>8}')
+    for size in args.size:
+        for batch_size in args.batch:
+            qmris = [QMRIData(
+                t1=torch.rand((size,) * 3, device=args.device) + 0.1,
+                rho=torch.rand((size,) * 3, device=args.device))
+                for _ in range(batch_size)]
+
+            def run_list():
+                images = []
+                for qmri in qmris:
+                    image = mrsig(qmri, param)
+                    bias = bias_creator.get_bias_field(image)
+                    images.append(image.data * bias.data)
+                return images
+
+            def run_batched():
+                image = mrsig(QMRIData.stack(qmris), param)
+                bias = bias_creator.get_bias_field(image)
+                return (image.data * bias.data).unbind()
+
+            # Fill the basis cache and compile outside of the timing
+            run_list()
+            run_batched()
+            t_list = best_time(run_list, args.repeats)
+            t_batched = best_time(run_batched, args.repeats)
+            print(f'{size:>6} {batch_size:>6} {t_list:>10.4f} '
+                  f'{t_batched:>12.4f} {t_list / t_batched:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
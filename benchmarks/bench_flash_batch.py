@@ -0,0 +1,53 @@
+"""Benchmark batched MRSigFlash against a loop over single parameters.
+
+Usage: python benchmarks/bench_flash_batch.py --size 64 128 --params 16 64
+"""
+import argparse
+
+import torch
+from bench_utils import best_time
+
+from inhomcorr.mrdata import QMRIData
+from inhomcorr.mrsig.flash import MRParamGRE
+from inhomcorr.mrsig.flash import MRSigFlash
+
+
+def main() -> None:
+    """Run the benchmark and print a table of the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, nargs='+', default=[64, 128])
+    parser.add_argument('--params', type=int, nargs='+', default=[16, 64])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+
+    mrsig = MRSigFlash()
+    mrsig_compiled = MRSigFlash(compile=True)
+    print(f'{"size":>6} {"params":>6} {"loop [s]":>10} {"batch [s]":>10} '
+          f'{"compiled [s]":>13} {"speedup":>8}')
+    for size in args.size:
+        qmri = QMRIData(t1=torch.rand((size,) * 3, device=args.device) + 0.1,
+                        rho=torch.rand((size,) * 3, device=args.device))
+        for n_params in args.params:
+            tr = torch.linspace(5e-3, 100e-3, n_params)
+            alpha = torch.linspace(0.1, 0.7, n_params)
+            params = [MRParamGRE(tr=float(t), alpha=float(a))
+                      for t, a in zip(tr, alpha)]
+
+            def loop():
+                return torch.stack([mrsig(qmri, p).data for p in params])
+
+            # Compile outside of the timing
+            mrsig_compiled.signal(qmri, tr, alpha)
+            t_loop = best_time(loop, args.repeats)
+            t_batch = best_time(lambda: mrsig.signal(qmri, tr, alpha),
+                                args.repeats)
+            t_compiled = best_time(
+                lambda: mrsig_compiled.signal(qmri, tr, alpha), args.repeats)
+            print(f'{size:>6} {n_params:>6} {t_loop:>10.4f} {t_batch:>10.4f} '
+                  f'{t_compiled:>13.4f} '
+                  f'{t_loop / min(t_batch, t_compiled):>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Benchmark speed and accuracy of the N4 shrink factor.
+
+Fits the bias field of a synthetic bias corrupted sphere phantom with
+different values of N4Hyperparameters.shrinkFactor and compares runtime and
+bias field against the full resolution fit.
+
+Usage: python benchmarks/bench_n4_shrink.py --size 64 128 --shrink 1 2 4
+"""
+import argparse
+import time
+
+import torch
+from bench_utils import sphere_phantom
+
+from inhomcorr.bias_estimator import N4Estimator
+from inhomcorr.bias_estimator import N4Hyperparameters
+
+
+def normalized(bias: torch.Tensor, mask: torch.Tensor) -> torch.Tensor:
+    """Normalize bias field values inside the mask to a mean of 1."""
+    values = bias[mask]
+    return values / values.mean()
+
+
+def main() -> None:
+    """Run the benchmark and print a table of the results."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, nargs='+', default=[64, 128])
+    parser.add_argument('--shrink', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    print(f'{"size":>6} {"shrink":>6} {"time [s]":>10} {"speedup":>8} '
+          f'{"mean rel. err":>14} {"max rel. err":>13}')
+    for size in args.size:
+        image, mask = sphere_phantom(size)
+        reference = None
+        reference_time = None
+        for shrink in sorted(set(args.shrink) | {1}):
+            estimator = N4Estimator(N4Hyperparameters(shrinkFactor=shrink))
+            start = time.perf_counter()
+            bias = normalized(estimator(image).data, mask)
+            wall_time = time.perf_counter() - start
+            if reference is None:
+                reference, reference_time = bias, wall_time
+            rel_err = (bias - reference).abs() / reference
+            print(f'{size:>6} {shrink:>6} {wall_time:>10.2f} '
+                  f'{reference_time / wall_time:>8.1f} '
+                  f'{rel_err.mean():>14.4f} {rel_err.max():>13.4f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""Benchmark suite of the simulation and correction pipeline.
+
+Times and memory-profiles each stage on synthetic cubic volumes:
+- nifti_load: QMRIDataLoaderNii.load_all of a 4D nifti file
+- mrsig_flash: MRSigFlash simulation of a GRE image
+- bias_creator: BiasCreatorTorchio.get_bias_field with a filled basis cache
+- bias_creator_cold: BiasCreatorTorchio.get_bias_field with an empty cache
+- n4: N4Estimator of the bias corrupted image
+- polynomial: PolynomialEstimator of the bias corrupted image
+- cnn: CNNEstimator of the bias corrupted image (untrained network)
+
+The results are written as JSON for regression tracking. With --compare,
+stages slower than a previous result file by more than --threshold are
+reported and the script exits with status 1.
+
+Usage: python benchmarks/bench_pipeline.py --size 64 128 256 \
+    --output results.json [--compare baseline.json]
+"""
+import argparse
+import json
+import sys
+import tempfile
+from collections.abc import Callable
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import torch
+from bench_utils import environment
+from bench_utils import measure
+from bench_utils import random_qmri
+from bench_utils import set_fixed_mmap_threshold
+
+from inhomcorr.bias_creator.torchio_bias import BiasCreatorTorchio
+from inhomcorr.bias_estimator import CNNEstimator
+from inhomcorr.bias_estimator import N4Estimator
+from inhomcorr.bias_estimator import N4Hyperparameters
+from inhomcorr.bias_estimator import PolynomialEstimator
+from inhomcorr.data_loader.data_loader_nii import QMRIDataLoaderNii
+from inhomcorr.mrdata import ImageData
+from inhomcorr.mrdata import QMRIData
+from inhomcorr.mrsig.flash import MRParamGRE
+from inhomcorr.mrsig.flash import MRSigFlash
+
+STAGES = ('nifti_load', 'mrsig_flash', 'bias_creator', 'bias_creator_cold',
+          'n4', 'polynomial', 'cnn')
+
+
+def stage_functions(qmri: QMRIData, folder: Path, args: argparse.Namespace,
+                    ) -> dict[str, Callable[[], object]]:
+    """Create the benchmarked function of each stage.
+
+    Parameters
+    ----------
+    qmri
+        Synthetic quantitative maps
+    folder
+        Folder for temporary files
+    args
+        Command line arguments
+
+    Returns
+    -------
+        Function without arguments by stage name
+    """
+    mrsig = MRSigFlash()
+    param = MRParamGRE(tr=20e-3, alpha=0.3)
+    image = mrsig(qmri, param)
+    bias_creator = BiasCreatorTorchio(seed=args.seed)
+    corrupted = ImageData(image.data * bias_creator.get_bias_field(image).data)
+    estimator = N4Estimator(N4Hyperparameters(
+        maxNumberIterations=args.n4_iterations,
+        shrinkFactor=args.n4_shrink))
+    polynomial = PolynomialEstimator()
+    cnn = CNNEstimator()
+    cnn.network.to(args.device)
+
+    # (x, y, z, parameter) file with m0 in volume 0 and T1 in volume 2
+    file_nii = folder / f'qmri_{qmri.shape[-1]}{args.nifti_suffix}'
+    maps = torch.stack([qmri.rho, qmri.rho, qmri.t1]).cpu().numpy()
+    nib.save(nib.Nifti1Image(np.ascontiguousarray(maps.T), np.eye(4)),
+             file_nii)
+
+    def nifti_load():
+        QMRIDataLoaderNii.clear_cache()
+        loader = QMRIDataLoaderNii()
+        loader.load_all(file_nii)
+        return loader.get_data().to(args.device)
+
+    def bias_creator_cold():
+        bias_creator.basis_cache.clear()
+        return bias_creator.get_bias_field(image)
+
+    return {'nifti_load': nifti_load,
+            'mrsig_flash': lambda: mrsig(qmri, param),
+            'bias_creator': lambda: bias_creator.get_bias_field(image),
+            'bias_creator_cold': bias_creator_cold,
+            'n4': lambda: estimator(corrupted),
+            'polynomial': lambda: polynomial(corrupted),
+            'cnn': lambda: cnn(corrupted)}
+
+
+def compare(results: list[dict], baseline_file: Path,
+            threshold: float) -> list[str]:
+    """Find stages which are slower than in a baseline.
+
+    Parameters
+    ----------
+    results
+        Results of the current run
+    baseline_file
+        JSON file of a previous run
+    threshold
+        Allowed ratio of the best wall times
+
+    Returns
+    -------
+        Description of each slower stage
+    """
+    with open(baseline_file) as file:
+        baseline = {(r['stage'], r['size'], r['device']): r
+                    for r in json.load(file)['results']}
+    regressions = []
+    for result in results:
+        reference = baseline.get(
+            (result['stage'], result['size'], result['device']))
+        if reference is None:
+            continue
+        ratio = result['best_s'] / reference['best_s']
+        if ratio > threshold:
+            regressions.append(
+                f'{result["stage"]} {result["size"]}^3: '
+                f'{reference["best_s"]:.4f} s -> {result["best_s"]:.4f} s '
+                f'({ratio:.2f}x)')
+    return regressions
+
+
+def main() -> None:
+    """Run the benchmark suite, print a table and write the results."""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--size', type=int, nargs='+', default=[64, 128, 256])
+    parser.add_argument('--stages', nargs='+', choices=STAGES,
+                        default=list(STAGES))
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--nifti-suffix', default='.nii',
+                        choices=['.nii', '.nii.gz'])
+    parser.add_argument('--n4-iterations', type=int, default=10)
+    parser.add_argument('--n4-shrink', type=int, default=2)
+    parser.add_argument('--output', type=Path)
+    parser.add_argument('--compare', type=Path)
+    parser.add_argument('--threshold', type=float, default=1.2)
+    parser.add_argument('--fixed-mmap-threshold', action='store_true',
+                        help='fix the glibc mmap threshold, so memory freed '
+                        'by earlier stages\ndoes not hide the peak memory '
+                        'of later stages.\nChanges the wall times compared '
+                        'to the default allocator.')
+    args = parser.parse_args()
+    if args.fixed_mmap_threshold and not set_fixed_mmap_threshold():
+        print('The mmap threshold can only be fixed with glibc.')
+
+    generator = torch.Generator().manual_seed(args.seed)
+    results = []
+    print(f'{"stage":>18} {"size":>6} {"best [s]":>10} {"median [s]":>11} '
+          f'{"peak [MiB]":>11}')
+    with tempfile.TemporaryDirectory() as folder:
+        for size in args.size:
+            qmri = random_qmri(size, args.device, generator)
+            functions = stage_functions(qmri, Path(folder), args)
+            for stage in args.stages:
+                result = {'stage': stage, 'size': size,
+                          'device': args.device,
+                          **measure(functions[stage], args.repeats,
+                                    args.device)}
+                results.append(result)
+                print(f'{stage:>18} {size:>6} {result["best_s"]:>10.4f} '
+                      f'{result["median_s"]:>11.4f} '
+                      f'{result["peak_memory_bytes"] / 2**20:>11.1f}')
+
+    if args.output is not None:
+        settings = {key: str(value) if isinstance(value, Path) else value
+                    for key, value in vars(args).items()}
+        with open(args.output, 'w') as file:
+            json.dump({'environment': environment(), 'settings': settings,
+                       'results': results}, file, indent=2)
+
+    if args.compare is not None:
+        regressions = compare(results, args.compare, args.threshold)
+        for regression in regressions:
+            print(f'Slower than baseline: {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
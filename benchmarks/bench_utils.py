@@ -0,0 +1,290 @@
+"""Helpers shared by the benchmark scripts."""
+import ctypes
+import ctypes.util
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import torch
+
+from inhomcorr.bias_creator.torchio_bias import BiasCreatorTorchio
+from inhomcorr.mrdata import ImageData
+from inhomcorr.mrdata import QMRIData
+
+
+def best_time(func: Callable[[], object], repeats: int) -> float:
+    """Get the best wall time of several calls of a function.
+
+    Parameters
+    ----------
+    func
+        Function without arguments
+    repeats
+        Number of calls
+
+    Returns
+    -------
+        Minimal wall time in s
+    """
+    return min(wall_times(func, repeats))
+
+
+def wall_times(func: Callable[[], object], repeats: int,
+               device: torch.device | str = 'cpu') -> list[float]:
+    """Get the wall times of several calls of a function.
+
+    Parameters
+    ----------
+    func
+        Function without arguments
+    repeats
+        Number of calls
+    device, optional
+        Device to synchronize before stopping the timer, by default 'cpu'
+
+    Returns
+    -------
+        Wall time in s of each call
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        if torch.device(device).type == 'cuda':
+            torch.cuda.synchronize(device)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _rss_bytes() -> int | None:
+    """Get the resident set size of the process.
+
+    Returns
+    -------
+        Resident memory in bytes or None if /proc is not available
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+# Fixed glibc mmap threshold in bytes, None for the default allocator
+_MMAP_THRESHOLD: int | None = None
+
+
+def set_fixed_mmap_threshold(threshold: int = 128 * 1024) -> bool:
+    """Return freed large allocations of glibc to the system.
+
+    glibc raises its mmap threshold after large blocks are freed, which
+    keeps later tensors on the heap. Freed tensors then remain resident and
+    hide the memory used by later stages in PeakMemory. A fixed threshold
+    disables this for the rest of the process, which also changes the
+    wall times compared to the default allocator. The threshold is
+    recorded by environment().
+
+    Parameters
+    ----------
+    threshold, optional
+        mmap threshold in bytes, by default 128 KiB
+
+    Returns
+    -------
+        True if the threshold was set, False on other platforms
+    """
+    global _MMAP_THRESHOLD
+    libc_name = ctypes.util.find_library('c')
+    if libc_name is None or platform.system() != 'Linux':
+        return False
+    try:
+        libc = ctypes.CDLL(libc_name)
+        M_MMAP_THRESHOLD = -3
+        if not libc.mallopt(M_MMAP_THRESHOLD, threshold):
+            return False
+    except (OSError, AttributeError):
+        return False
+    _MMAP_THRESHOLD = threshold
+    return True
+
+
+class PeakMemory:
+    """Context manager measuring the peak memory increase of a block.
+
+    On the cpu, the resident set size of the process is sampled in a
+    background thread. Without /proc, the increase of the maximal resident
+    set size is used, which misses peaks below earlier maxima. Memory freed
+    before the block may stay resident with the default glibc allocator,
+    see set_fixed_mmap_threshold. On CUDA devices, the peak of allocated
+    tensor memory is used.
+    """
+
+    def __init__(self, device: torch.device | str = 'cpu',
+                 interval: float = 1e-3) -> None:
+        """Create a memory monitor.
+
+        Parameters
+        ----------
+        device, optional
+            Device to monitor, by default 'cpu'
+        interval, optional
+            Sampling interval in s, by default 1e-3
+        """
+        self.device = torch.device(device)
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _sample(self, baseline: int) -> None:
+        """Sample the resident set size until stopped.
+
+        Parameters
+        ----------
+        baseline
+            Resident set size before the block
+        """
+        while not self._stop.is_set():
+            rss = _rss_bytes() or baseline
+            self.peak_bytes = max(self.peak_bytes, rss - baseline)
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> 'PeakMemory':
+        """Start monitoring.
+
+        Returns
+        -------
+            The monitor
+        """
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+            torch.cuda.reset_peak_memory_stats(self.device)
+            self._baseline = torch.cuda.memory_allocated(self.device)
+            return self
+        self._baseline = _rss_bytes()
+        if self._baseline is None:
+            # Maximal resident set size in kB on Linux
+            self._baseline = resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss * 1024
+        else:
+            self._thread = threading.Thread(target=self._sample,
+                                            args=(self._baseline,),
+                                            daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Stop monitoring and store the peak in peak_bytes."""
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+            self.peak_bytes = torch.cuda.max_memory_allocated(
+                self.device) - self._baseline
+        elif self._thread is None:
+            self.peak_bytes = resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss * 1024 - self._baseline
+        else:
+            self._stop.set()
+            self._thread.join()
+            rss = _rss_bytes() or self._baseline
+            self.peak_bytes = max(self.peak_bytes, rss - self._baseline)
+
+
+def measure(func: Callable[[], object], repeats: int,
+            device: torch.device | str = 'cpu') -> dict:
+    """Time a function and measure its peak memory.
+
+    Parameters
+    ----------
+    func
+        Function without arguments
+    repeats
+        Number of timed calls
+    device, optional
+        Device the function runs on, by default 'cpu'
+
+    Returns
+    -------
+        Wall times, their minimum and median in s and the peak memory
+        increase in bytes of a single call
+    """
+    with PeakMemory(device) as memory:
+        func()
+    times = wall_times(func, repeats, device)
+    return {'times_s': times, 'best_s': min(times),
+            'median_s': statistics.median(times),
+            'peak_memory_bytes': memory.peak_bytes}
+
+
+def random_qmri(size: int, device: torch.device | str = 'cpu',
+                generator: torch.Generator | None = None) -> QMRIData:
+    """Create random quantitative maps of a cubic volume.
+
+    Parameters
+    ----------
+    size
+        Number of voxels along each dimension
+    device, optional
+        Device of the maps, by default 'cpu'
+    generator, optional
+        Random number generator, by default the global generator
+
+    Returns
+    -------
+        QMRIData with T1 in [0.1, 1.1] s and rho in [0, 1]
+    """
+    shape = (size,) * 3
+    t1 = torch.rand(shape, generator=generator) + 0.1
+    rho = torch.rand(shape, generator=generator)
+    return QMRIData(t1=t1.to(device), rho=rho.to(device))
+
+
+def sphere_phantom(size: int) -> tuple[ImageData, torch.Tensor]:
+    """Create a bias corrupted sphere phantom.
+
+    Parameters
+    ----------
+    size
+        Number of voxels along each dimension
+
+    Returns
+    -------
+        Bias corrupted image and mask of the sphere
+    """
+    grid = torch.meshgrid(*[torch.linspace(-1, 1, size)] * 3, indexing='ij')
+    mask = sum(g**2 for g in grid) < 0.8
+    obj = mask * (1 + 0.05 * torch.randn((size,) * 3)) + 0.01
+    image = ImageData(obj[None])
+    bias = BiasCreatorTorchio().get_bias_field(image)
+    return ImageData(image.data * bias.data), mask[None]
+
+
+def environment() -> dict:
+    """Describe the environment of a benchmark run.
+
+    Returns
+    -------
+        Versions, hardware, allocator settings and git commit
+    """
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'python': platform.python_version(),
+            'torch': torch.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'torch_threads': torch.get_num_threads(),
+            'cuda': torch.cuda.get_device_name()
+            if torch.cuda.is_available() else None,
+            'fixed_mmap_threshold': _MMAP_THRESHOLD,
+            'git_commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
@@ -1,6 +1,9 @@
 """Interfaces for bias field creators."""
 from abc import ABC
 from abc import abstractmethod
+from collections.abc import Iterator
+
+import torch
 
 from inhomcorr.mrdata import ImageData
 
@@ -44,3 +47,52 @@ class BiasCreator(ABC):
             List of bias field
         """
         pass
+
+    def get_bias_field_tensor(self, image: ImageData, number: int,
+                              device: torch.device | str | None = None,
+                              ) -> torch.Tensor:
+        """Create multiple random bias fields as a single tensor.
+
+        Parameters
+        ----------
+        image
+            Reference image
+        number
+            Number of bias fields
+        device, optional
+            Device of the bias fields, by default the device of the image
+
+        Returns
+        -------
+            Bias fields with shape (number, z, y, x)
+        """
+        if device is None:
+            device = image.device
+        bf_list = self.get_random_bias_fields(image, number)
+        return torch.cat([bf.data.to(device) for bf in bf_list])
+
+    @abstractmethod
+    def manual_seed(self, seed: int) -> None:
+        """Seed the random number generator of the bias field creator.
+
+        Parameters
+        ----------
+        seed
+            Seed of the random number generator
+        """
+        pass
+
+    def stream(self, image: ImageData) -> Iterator[ImageData]:
+        """Infinite iterator of random bias fields.
+
+        Parameters
+        ----------
+        image
+            Reference image
+
+        Returns
+        -------
+            Iterator of bias fields
+        """
+        while True:
+            yield self.get_bias_field(image)
@@ -0,0 +1,106 @@
+"""Iterable dataset of random bias fields."""
+from collections.abc import Iterator
+
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset
+from torch.utils.data import get_worker_info
+
+from inhomcorr.bias_creator.bias_creator_interface import BiasCreator
+from inhomcorr.mrdata import ImageData
+
+
+def worker_seed_sequence(seed: int, epoch: int = 0) -> np.random.SeedSequence:
+    """Get the seed sequence of the current DataLoader worker.
+
+    Parameters
+    ----------
+    seed
+        Root seed shared by all workers
+    epoch, optional
+        Epoch number, by default 0
+
+    Returns
+    -------
+        Independent seed sequence of the worker
+    """
+    worker_info = get_worker_info()
+    if worker_info is None:
+        worker_id, num_workers = 0, 1
+    else:
+        worker_id, num_workers = worker_info.id, worker_info.num_workers
+    root = np.random.SeedSequence([seed, epoch])
+    return root.spawn(num_workers)[worker_id]
+
+
+def seed_from_sequence(seed_sequence: np.random.SeedSequence) -> int:
+    """Draw a non-negative 63 bit seed for torch from a seed sequence.
+
+    Parameters
+    ----------
+    seed_sequence
+        Seed sequence
+
+    Returns
+    -------
+        Seed for torch.Generator.manual_seed
+    """
+    return int(seed_sequence.generate_state(1, dtype=np.uint64)[0] >> 1)
+
+
+class BiasFieldDataset(IterableDataset):
+    """Infinite, reproducible stream of random bias fields.
+
+    Every DataLoader worker seeds its copy of the bias creator with an
+    independent sub-stream derived from seed, epoch and worker id, so no
+    fields are duplicated or correlated between workers. Iterating again
+    restarts the streams, call set_epoch to obtain new fields.
+    """
+
+    def __init__(self, bias_creator: BiasCreator, image: ImageData,
+                 seed: int | None = None, chunk_size: int = 16) -> None:
+        """Create a bias field dataset.
+
+        Parameters
+        ----------
+        bias_creator
+            Bias field creator, seeded per worker with manual_seed
+        image
+            Reference image defining shape and device of the bias fields
+        seed, optional
+            Root seed of all streams, by default a random seed
+        chunk_size, optional
+            Number of bias fields created at once, by default 16
+        """
+        super().__init__()
+        self.bias_creator = bias_creator
+        self.image = image
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1)[0])
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        """Set the epoch used to derive the seeds of the streams.
+
+        Parameters
+        ----------
+        epoch
+            Epoch number
+        """
+        self.epoch = epoch
+
+    def __iter__(self) -> Iterator[torch.Tensor]:
+        """Iterate over bias fields.
+
+        Returns
+        -------
+            Iterator of bias fields with shape (1, z, y, x)
+        """
+        self.bias_creator.manual_seed(seed_from_sequence(
+            worker_seed_sequence(self.seed, self.epoch)))
+        while True:
+            for bf in self.bias_creator.get_random_bias_fields(
+                    self.image, self.chunk_size):
+                yield bf.data
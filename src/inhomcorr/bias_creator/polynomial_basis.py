@@ -0,0 +1,161 @@
+"""Polynomial basis of smooth bias fields.
+
+Follows the bias field model of torchio: the log bias field is a linear
+combination of monomials x^i * y^j * z^k with i + j + k <= order on a grid
+normalized to [-1, 1] along each dimension.
+"""
+from collections import OrderedDict
+from typing import NamedTuple
+
+import torch
+
+
+def number_of_terms(order: int) -> int:
+    """Get the number of monomials of a 3D polynomial.
+
+    Parameters
+    ----------
+    order
+        Maximal order of the polynomial
+
+    Returns
+    -------
+        Number of monomials with i + j + k <= order
+    """
+    return (order + 1) * (order + 2) * (order + 3) // 6
+
+
+def polynomial_basis(shape: tuple[int, int, int], order: int,
+                     dtype: torch.dtype = torch.float32,
+                     device: torch.device | str | None = None,
+                     ) -> torch.Tensor:
+    """Calculate all monomials of a 3D polynomial on a grid.
+
+    The monomials are ordered as the coefficients of torchio.BiasField.
+
+    Parameters
+    ----------
+    shape
+        Shape (z, y, x) of the grid
+    order
+        Maximal order of the polynomial
+    dtype, optional
+        dtype of the basis, by default torch.float32
+    device, optional
+        device of the basis, by default None
+
+    Returns
+    -------
+        Basis with shape (number_of_terms(order), z, y, x)
+
+    Raises
+    ------
+    ValueError
+        If the shape is not 3D
+    """
+    if len(shape) != 3:
+        raise ValueError(f'Shape has to be 3D. Got {shape}.')
+
+    coords = []
+    for size in shape:
+        coord = torch.arange(size, dtype=torch.float64, device=device)
+        coord -= (size - 1) / 2
+        if size > 1:
+            coord /= coord.max()
+        coords.append(coord)
+    c0 = coords[0][:, None, None]
+    c1 = coords[1][None, :, None]
+    c2 = coords[2][None, None, :]
+
+    basis = torch.empty((number_of_terms(order), *shape), dtype=dtype,
+                        device=device)
+    term = 0
+    for i in range(order + 1):
+        for j in range(order + 1 - i):
+            for k in range(order + 1 - (i + j)):
+                basis[term] = c0**i * c1**j * c2**k
+                term += 1
+    return basis
+
+
+class BasisCacheInfo(NamedTuple):
+    """Statistics of a PolynomialBasisCache."""
+
+    hits: int
+    misses: int
+    entries: int
+    nbytes: int
+    max_bytes: int
+
+
+class PolynomialBasisCache:
+    """LRU cache of polynomial bases.
+
+    Bases are keyed on (shape, order, dtype, device). The least recently used
+    bases are removed once the cached bases need more than max_bytes. The
+    returned tensors are shared and must not be modified.
+    """
+
+    def __init__(self, max_bytes: int = 2**30) -> None:
+        self.max_bytes = max_bytes
+        self._bases: OrderedDict[tuple, torch.Tensor] = OrderedDict()
+        self._nbytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, shape: tuple[int, int, int], order: int,
+            dtype: torch.dtype = torch.float32,
+            device: torch.device | str | None = None) -> torch.Tensor:
+        """Get the basis from the cache or calculate it.
+
+        Parameters
+        ----------
+        shape
+            Shape (z, y, x) of the grid
+        order
+            Maximal order of the polynomial
+        dtype, optional
+            dtype of the basis, by default torch.float32
+        device, optional
+            device of the basis, by default None
+
+        Returns
+        -------
+            Basis with shape (number_of_terms(order), z, y, x)
+        """
+        device = torch.device('cpu') if device is None else torch.device(
+            device)
+        key = (tuple(shape), order, dtype, str(device))
+        basis = self._bases.get(key)
+        if basis is not None:
+            self._hits += 1
+            self._bases.move_to_end(key)
+            return basis
+
+        self._misses += 1
+        basis = polynomial_basis(shape, order, dtype=dtype, device=device)
+        nbytes = basis.element_size() * basis.nelement()
+        if nbytes <= self.max_bytes:
+            while self._nbytes + nbytes > self.max_bytes:
+                _, oldest = self._bases.popitem(last=False)
+                self._nbytes -= oldest.element_size() * oldest.nelement()
+            self._bases[key] = basis
+            self._nbytes += nbytes
+        return basis
+
+    def info(self) -> BasisCacheInfo:
+        """Get hits, misses and memory usage of the cache.
+
+        Returns
+        -------
+            Cache statistics
+        """
+        return BasisCacheInfo(self._hits, self._misses, len(self._bases),
+                              self._nbytes, self.max_bytes)
+
+    def clear(self) -> None:
+        """Remove all bases and reset the statistics."""
+        self._bases.clear()
+        self._nbytes = 0
+        self._hits = 0
+        self._misses = 0
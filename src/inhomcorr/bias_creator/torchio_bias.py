@@ -1,22 +1,58 @@
-"""Wrapper to use torchio to simulate bias fields."""
+"""Simulation of bias fields following the torchio bias field model."""
 
 import torch
-import torchio as tio
 
 from inhomcorr.bias_creator.bias_creator_interface import BiasCreator
+from inhomcorr.bias_creator.polynomial_basis import BasisCacheInfo
+from inhomcorr.bias_creator.polynomial_basis import PolynomialBasisCache
+from inhomcorr.bias_creator.polynomial_basis import number_of_terms
+from inhomcorr.instrumentation import instrument
 from inhomcorr.mrdata import ImageData
 
 
 class BiasCreatorTorchio(BiasCreator):
-    """Bias field creation using torchio."""
+    """Bias field creation following torchio.RandomBiasField.
 
-    def __init__(self, coefficient_range: float = 0.2, order: int = 3) -> None:
+    The bias fields are calculated natively in torch, so many bias fields can
+    be created at once on any device. The polynomial bases of the image grids
+    are kept in an LRU cache of at most cache_max_bytes.
+
+    The coefficients are sampled with the given torch.Generator or, if a
+    seed is given, a new generator seeded with it. Otherwise the global
+    random number generator of torch is used.
+    """
+
+    def __init__(self, coefficient_range: float = 0.2, order: int = 3,
+                 cache_max_bytes: int = 2**30,
+                 seed: int | None = None,
+                 generator: torch.Generator | None = None) -> None:
         self.coefficient_range: float = coefficient_range
         self.order: int = order
+        self.basis_cache = PolynomialBasisCache(cache_max_bytes)
+        if seed is not None:
+            if generator is not None:
+                raise ValueError('Provide either seed or generator.')
+            generator = torch.Generator().manual_seed(seed)
+        self.generator: torch.Generator | None = generator
+
+    def manual_seed(self, seed: int) -> None:
+        """Seed the random number generator of the bias field creator.
+
+        Parameters
+        ----------
+        seed
+            Seed of the random number generator
+        """
+        if self.generator is None:
+            self.generator = torch.Generator()
+        self.generator.manual_seed(seed)
 
+    @instrument
     def get_bias_field(self, image: ImageData) -> ImageData:
         """Inferface of a bias field creator.
 
+        A batch of images gets an independent bias field for each subject.
+
         Parameters
         ----------
         image
@@ -24,27 +60,12 @@ class BiasCreatorTorchio(BiasCreator):
 
         Returns
         -------
-            Bias field
+            Bias field with shape (1, z, y, x) or (b, 1, z, y, x)
         """
-        # Create torchio random bias field transform
-        bft_rnd = tio.RandomBiasField(
-            coefficients=self.coefficient_range, order=self.order)
-
-        # Sample from random parameters
-        rnd_coeff = bft_rnd.get_params(
-            bft_rnd.order, bft_rnd.coefficients_range)
-
-        # Create bias field
-        bft = tio.BiasField(coefficients=rnd_coeff, order=bft_rnd.order)
-        bf = bft.generate_bias_field(data=tio.ScalarImage(tensor=image.data),
-                                     order=bft_rnd.order,
-                                     coefficients=rnd_coeff)
-
-        # Return as Image object
-        bf_image = ImageData(torch.tensor(bf).unsqueeze(0))
-
-        return bf_image
+        bf = self.get_bias_field_tensor(image, number=image.batch_size or 1)
+        return ImageData(bf.reshape(*image.shape[:-4], 1, *image.shape[-3:]))
 
+    @instrument
     def get_random_bias_fields(self, image: ImageData,
                                number: int) -> list[ImageData]:
         """Inferface of a bias field creator providing multiple bias fields.
@@ -60,7 +81,70 @@ class BiasCreatorTorchio(BiasCreator):
         -------
             List of bias field
         """
-        bf_image_list = []
-        for ind in range(number):
-            bf_image_list.append(self.get_bias_field(image))
-        return (bf_image_list)
+        bf = self.get_bias_field_tensor(image, number)
+        return [ImageData(bf[ind:ind+1]) for ind in range(number)]
+
+    @instrument
+    def get_bias_field_tensor(self, image: ImageData, number: int,
+                              device: torch.device | str | None = None,
+                              ) -> torch.Tensor:
+        """Create multiple random bias fields at once.
+
+        Parameters
+        ----------
+        image
+            Reference image
+        number
+            Number of bias fields
+        device, optional
+            Device of the bias fields, by default the device of the image
+
+        Returns
+        -------
+            Bias fields with shape (number, z, y, x)
+        """
+        if device is None:
+            device = image.device
+        # Sample on the device of the generator, so the coefficients do not
+        # depend on the device of the bias fields
+        gen_device = self.generator.device if self.generator else 'cpu'
+        coefficients = torch.empty(
+            (number, number_of_terms(self.order)), device=gen_device)
+        coefficients.uniform_(-self.coefficient_range,
+                              self.coefficient_range,
+                              generator=self.generator)
+        coefficients = coefficients.to(device)
+        return self.bias_fields_from_coefficients(
+            coefficients, image.shape[-3:])
+
+    def bias_fields_from_coefficients(self, coefficients: torch.Tensor,
+                                      shape: tuple[int, int, int],
+                                      ) -> torch.Tensor:
+        """Calculate bias fields from polynomial coefficients.
+
+        Parameters
+        ----------
+        coefficients
+            Coefficients with shape (number, number_of_terms(order)) in the
+            order of torchio.BiasField
+        shape
+            Shape (z, y, x) of the bias fields
+
+        Returns
+        -------
+            Bias fields with shape (number, z, y, x)
+        """
+        basis = self.basis_cache.get(tuple(shape), self.order,
+                                     dtype=coefficients.dtype,
+                                     device=coefficients.device)
+        log_bf = coefficients @ basis.reshape(basis.shape[0], -1)
+        return log_bf.exp_().reshape(-1, *shape)
+
+    def cache_info(self) -> BasisCacheInfo:
+        """Get hits, misses and memory usage of the basis cache.
+
+        Returns
+        -------
+            Cache statistics
+        """
+        return self.basis_cache.info()
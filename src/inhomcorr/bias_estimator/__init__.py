@@ -1,2 +1,7 @@
+from .cached_estimator import CachedEstimator
+from .cnn_torch import CNNEstimator
+from .cnn_torch import CNNHyperparameters
 from .n4_itk import N4Estimator
 from .n4_itk import N4Hyperparameters
+from .polynomial_torch import PolynomialEstimator
+from .polynomial_torch import PolynomialHyperparameters
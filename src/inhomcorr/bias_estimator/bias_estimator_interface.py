@@ -25,7 +25,8 @@ class BiasEstimator(ABC):
         Parameters
         ----------
         image
-            Bias corrupted Image
+            Bias corrupted Image, optionally batched with shape
+            (b, c, z, y, x)
 
         Returns
         -------
@@ -0,0 +1,429 @@
+"""Content-addressed cache of bias field estimates.
+
+CachedEstimator wraps a BiasEstimator and serves repeated estimates of the
+same image from a cache:
+
+    estimator = CachedEstimator(N4Estimator(N4Hyperparameters()),
+                                DiskResultCache('n4_cache'))
+    biasfield = estimator(image)
+
+The key is a hash of data, mask and header of the image, the type of the
+estimator and its hyperparameters. Bias fields are cached with the header
+set by the estimator, so cached and new estimates are identical.
+"""
+import hashlib
+import json
+import os
+from abc import ABC
+from abc import abstractmethod
+from collections import OrderedDict
+from dataclasses import asdict
+from dataclasses import is_dataclass
+from pathlib import Path
+from typing import NamedTuple
+
+import torch
+
+from inhomcorr.bias_estimator.bias_estimator_interface import BiasEstimator
+from inhomcorr.header import decode_header
+from inhomcorr.header import encode_header
+from inhomcorr.instrumentation import instrument
+from inhomcorr.mrdata import ImageData
+
+# Version of the keys and of the entries of DiskResultCache
+RESULT_CACHE_VERSION = 1
+
+
+def _hash_tensor(hasher: hashlib.blake2b, tensor: torch.Tensor) -> None:
+    """Add dtype, shape and content of a tensor to a hash.
+
+    Parameters
+    ----------
+    hasher
+        hashlib object
+    tensor
+        Tensor of any dtype and device
+    """
+    tensor = tensor.detach().cpu().contiguous()
+    hasher.update(f'{tensor.dtype}{tuple(tensor.shape)}'.encode())
+    hasher.update(tensor.reshape(-1).view(torch.uint8).numpy())
+
+
+def image_fingerprint(image: ImageData) -> str:
+    """Hash data, mask and header of an image.
+
+    Parameters
+    ----------
+    image
+        ImageData object
+
+    Returns
+    -------
+        Hex digest of the blake2b hash
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    _hash_tensor(hasher, image.data)
+    if image.mask is not None:
+        _hash_tensor(hasher, image.mask)
+    # The header defines e.g. the spacing used by the estimator
+    hasher.update(json.dumps(encode_header(image.header), sort_keys=True,
+                             default=repr).encode())
+    return hasher.hexdigest()
+
+
+class ResultCacheInfo(NamedTuple):
+    """Statistics of a ResultCache."""
+
+    hits: int
+    misses: int
+    entries: int
+    nbytes: int
+    max_bytes: int
+
+
+class ResultCache(ABC):
+    """Interface of a cache of bias fields."""
+
+    @abstractmethod
+    def get(self, key: str) -> ImageData | None:
+        """Get a cached bias field.
+
+        Parameters
+        ----------
+        key
+            Key of the estimate
+
+        Returns
+        -------
+            Bias field or None if the key is not cached
+        """
+        pass
+
+    @abstractmethod
+    def put(self, key: str, biasfield: ImageData) -> None:
+        """Add a bias field to the cache.
+
+        Parameters
+        ----------
+        key
+            Key of the estimate
+        biasfield
+            Bias field
+        """
+        pass
+
+    @abstractmethod
+    def info(self) -> ResultCacheInfo:
+        """Get hits, misses and memory usage of the cache.
+
+        Returns
+        -------
+            Cache statistics
+        """
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove all entries and reset the statistics."""
+        pass
+
+
+class MemoryResultCache(ResultCache):
+    """LRU cache of bias fields in memory.
+
+    The least recently used bias fields are removed once the cached bias
+    fields need more than max_bytes. Bias fields stay on their device and
+    copies including the header are returned, so they can be modified.
+    """
+
+    def __init__(self, max_bytes: int = 2**30) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, ImageData] = OrderedDict()
+        self._nbytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: str) -> ImageData | None:
+        """Get a copy of a cached bias field.
+
+        Parameters
+        ----------
+        key
+            Key of the estimate
+
+        Returns
+        -------
+            Bias field or None if the key is not cached
+        """
+        biasfield = self._entries.get(key)
+        if biasfield is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._entries.move_to_end(key)
+        return biasfield.clone()
+
+    def put(self, key: str, biasfield: ImageData) -> None:
+        """Add a copy of a bias field to the cache.
+
+        Bias fields larger than max_bytes are not cached.
+
+        Parameters
+        ----------
+        key
+            Key of the estimate
+        biasfield
+            Bias field
+        """
+        nbytes = biasfield.nbytes
+        if nbytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._nbytes -= old.nbytes
+        while self._nbytes + nbytes > self.max_bytes:
+            _, oldest = self._entries.popitem(last=False)
+            self._nbytes -= oldest.nbytes
+        self._entries[key] = biasfield.clone()
+        self._nbytes += nbytes
+
+    def info(self) -> ResultCacheInfo:
+        """Get hits, misses and memory usage of the cache.
+
+        Returns
+        -------
+            Cache statistics
+        """
+        return ResultCacheInfo(self._hits, self._misses, len(self._entries),
+                               self._nbytes, self.max_bytes)
+
+    def clear(self) -> None:
+        """Remove all entries and reset the statistics."""
+        self._entries.clear()
+        self._nbytes = 0
+        self._hits = 0
+        self._misses = 0
+
+
+class DiskResultCache(ResultCache):
+    """Cache of bias fields in a folder.
+
+    Each bias field and its header is a file named by its key. Files are
+    written atomically, so several processes can share a folder. Reading an
+    entry updates its modification time, and the least recently used files
+    are removed once the folder holds more than max_bytes of entries. Bias
+    fields are loaded on the cpu.
+    """
+
+    suffix = '.pt'
+
+    def __init__(self, folder: Path | str, max_bytes: int = 2**32) -> None:
+        """Create a disk cache.
+
+        Parameters
+        ----------
+        folder
+            Folder of the cache, created if it does not exist
+        max_bytes, optional
+            Maximal size of all entries, by default 4 GiB
+        """
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._hits = 0
+        self._misses = 0
+
+    def _file(self, key: str) -> Path:
+        """Get the file of an entry.
+
+        Parameters
+        ----------
+        key
+            Key of the estimate
+
+        Returns
+        -------
+            File in the cache folder
+        """
+        return self.folder / f'{key}{self.suffix}'
+
+    def _entry_files(self) -> list[tuple[Path, os.stat_result]]:
+        """Get the files of all entries.
+
+        Returns
+        -------
+            Files and their stat results, entries removed by other
+            processes are skipped
+        """
+        entries = []
+        for file in self.folder.glob(f'*{self.suffix}'):
+            try:
+                entries.append((file, file.stat()))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def get(self, key: str) -> ImageData | None:
+        """Load a cached bias field.
+
+        Parameters
+        ----------
+        key
+            Key of the estimate
+
+        Returns
+        -------
+            Bias field or None if the key is not cached
+        """
+        file = self._file(key)
+        try:
+            entry = torch.load(file, weights_only=True)
+            os.utime(file)
+        except (FileNotFoundError, RuntimeError, EOFError):
+            # Missing, evicted by another process or truncated
+            self._misses += 1
+            return None
+        if entry.get('version') != RESULT_CACHE_VERSION:
+            self._misses += 1
+            return None
+        self._hits += 1
+        biasfield = ImageData(entry['data'])
+        biasfield.header = decode_header(json.loads(entry['header']))
+        return biasfield
+
+    def put(self, key: str, biasfield: ImageData) -> None:
+        """Save a bias field and evict the least recently used entries.
+
+        Parameters
+        ----------
+        key
+            Key of the estimate
+        biasfield
+            Bias field
+        """
+        file = self._file(key)
+        file_tmp = file.with_name(f'{file.name}.{os.getpid()}.tmp')
+        entry = {'version': RESULT_CACHE_VERSION,
+                 'data': biasfield.data.detach().cpu().clone(),
+                 'header': json.dumps(encode_header(biasfield.header))}
+        torch.save(entry, file_tmp)
+        os.replace(file_tmp, file)
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove the least recently used entries above max_bytes."""
+        entries = sorted(self._entry_files(),
+                         key=lambda entry: entry[1].st_mtime_ns)
+        nbytes = sum(stat.st_size for _, stat in entries)
+        for file, stat in entries:
+            if nbytes <= self.max_bytes:
+                break
+            file.unlink(missing_ok=True)
+            nbytes -= stat.st_size
+
+    def info(self) -> ResultCacheInfo:
+        """Get hits, misses and disk usage of the cache.
+
+        Returns
+        -------
+            Cache statistics
+        """
+        entries = self._entry_files()
+        return ResultCacheInfo(self._hits, self._misses, len(entries),
+                               sum(stat.st_size for _, stat in entries),
+                               self.max_bytes)
+
+    def clear(self) -> None:
+        """Remove all entries and reset the statistics."""
+        for file, _ in self._entry_files():
+            file.unlink(missing_ok=True)
+        self._hits = 0
+        self._misses = 0
+
+
+class CachedEstimator(BiasEstimator):
+    """Bias field estimator serving repeated estimates from a cache.
+
+    Estimates are keyed on the content of data, mask and header of the
+    image, the type of the wrapped estimator, its hyperparameters and a
+    namespace. Learned estimators need a namespace identifying their
+    weights, since the weights are not part of the hyperparameters.
+    """
+
+    def __init__(self, estimator: BiasEstimator,
+                 cache: ResultCache | None = None,
+                 namespace: str = '') -> None:
+        """Wrap a bias field estimator.
+
+        Parameters
+        ----------
+        estimator
+            Bias field estimator
+        cache, optional
+            Cache of the estimates, by default a MemoryResultCache
+        namespace, optional
+            Additional part of the key, e.g. a version of network weights,
+            by default ''
+        """
+        self.estimator = estimator
+        self.cache = cache if cache is not None else MemoryResultCache()
+        self.namespace = namespace
+
+    @property
+    def hparams(self):
+        """Get the hyperparameters of the wrapped estimator.
+
+        Returns
+        -------
+            Hyperparameters or None
+        """
+        return getattr(self.estimator, 'hparams', None)
+
+    def key(self, image: ImageData) -> str:
+        """Get the cache key of the estimate of an image.
+
+        Parameters
+        ----------
+        image
+            ImageData object
+
+        Returns
+        -------
+            Hex digest of image, estimator, hyperparameters, namespace and
+            cache version
+        """
+        hparams = self.hparams
+        if is_dataclass(hparams):
+            hparams = asdict(hparams)
+        estimator_type = type(self.estimator)
+        description = json.dumps(
+            {'estimator': f'{estimator_type.__module__}.'
+                          f'{estimator_type.__qualname__}',
+             'hparams': hparams, 'namespace': self.namespace,
+             'version': RESULT_CACHE_VERSION},
+            sort_keys=True, default=repr)
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update(description.encode())
+        hasher.update(image_fingerprint(image).encode())
+        return hasher.hexdigest()
+
+    @instrument
+    def __call__(self, image: ImageData) -> ImageData:
+        """Get the bias field from the cache or estimate it.
+
+        Parameters
+        ----------
+        image
+            Bias corrupted Image, optionally batched
+
+        Returns
+        -------
+            Bias field on the device of the image
+        """
+        key = self.key(image)
+        biasfield = self.cache.get(key)
+        if biasfield is None:
+            biasfield = self.estimator(image)
+            self.cache.put(key, biasfield)
+            return biasfield
+        return biasfield.to(image.device)
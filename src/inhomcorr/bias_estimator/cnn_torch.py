@@ -0,0 +1,492 @@
+"""Learned bias field estimation with a 3D U-Net."""
+import copy
+import itertools
+from dataclasses import dataclass
+from pathlib import Path
+
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+from inhomcorr.bias_estimator.bias_estimator_interface import BiasEstimator
+from inhomcorr.bias_estimator.bias_estimator_interface import HyperParameters
+from inhomcorr.instrumentation import instrument
+from inhomcorr.mrdata import ImageData
+
+
+@dataclass
+class CNNHyperparameters(HyperParameters):
+    """Hyperparameters of the U-Net bias field estimator.
+
+    Parameters
+    ----------
+    Hyperparameters
+        numberLevels: Number of resolution levels of the U-Net
+        numberFeatures: Number of features of the first level, doubled on
+            each level
+        shrinkFactor: Downsampling factor of the network input. The smooth
+            log bias field is interpolated to the full resolution.
+        tileSize: Edge length of the cubic tiles of the inference in voxels
+            of the downsampled volume. None (default) processes the whole
+            volume at once.
+        tileOverlap: Overlap of neighboring tiles in voxels, blended with
+            linear weights. Should be about the receptive field of the
+            network.
+        batchSize: Number of tiles or volumes per forward pass
+    """
+
+    numberLevels: int = 3
+    numberFeatures: int = 8
+    shrinkFactor: int = 2
+    tileSize: int | None = None
+    tileOverlap: int = 16
+    batchSize: int = 4
+
+
+def _conv_block(in_channels: int, out_channels: int) -> nn.Sequential:
+    """Create two 3x3x3 convolutions with normalization and activation.
+
+    Parameters
+    ----------
+    in_channels
+        Number of input channels
+    out_channels
+        Number of output channels
+
+    Returns
+    -------
+        Convolution block
+    """
+    return nn.Sequential(
+        nn.Conv3d(in_channels, out_channels, 3, padding=1, bias=False),
+        nn.BatchNorm3d(out_channels),
+        nn.LeakyReLU(inplace=True),
+        nn.Conv3d(out_channels, out_channels, 3, padding=1, bias=False),
+        nn.BatchNorm3d(out_channels),
+        nn.LeakyReLU(inplace=True),
+    )
+
+
+class UNet3D(nn.Module):
+    """Small 3D U-Net predicting the log bias field.
+
+    The input is a normalized image with shape (b, 1, z, y, x), see
+    normalize_intensity. Volumes of any size are padded to a multiple of
+    the downsampling factor internally. BatchNorm keeps the prediction of a
+    voxel independent of the other voxels in eval mode, so tiled inference
+    matches the prediction of the whole volume away from tile borders. The
+    last layer is initialized with zeros, so an untrained network predicts
+    a constant bias field.
+    """
+
+    def __init__(self, levels: int = 3, features: int = 8) -> None:
+        """Create a U-Net.
+
+        Parameters
+        ----------
+        levels, optional
+            Number of resolution levels, by default 3
+        features, optional
+            Number of features of the first level, by default 8
+        """
+        super().__init__()
+        self.factor = 2**(levels - 1)
+        self.encoders = nn.ModuleList()
+        channels = 1
+        for level in range(levels):
+            self.encoders.append(_conv_block(channels, features * 2**level))
+            channels = features * 2**level
+        self.decoders = nn.ModuleList()
+        for level in reversed(range(levels - 1)):
+            self.decoders.append(_conv_block(channels + features * 2**level,
+                                             features * 2**level))
+            channels = features * 2**level
+        self.head = nn.Conv3d(channels, 1, 1)
+        nn.init.zeros_(self.head.weight)
+        nn.init.zeros_(self.head.bias)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        """Predict the log bias field.
+
+        Parameters
+        ----------
+        x
+            Normalized images with shape (b, 1, z, y, x)
+
+        Returns
+        -------
+            Log bias fields with shape (b, 1, z, y, x)
+        """
+        shape = x.shape[2:]
+        padding = [0, 0, 0, 0, 0, 0]
+        for dim in range(3):
+            padding[5 - 2 * dim] = -shape[dim] % self.factor
+        x = F.pad(x, padding, mode='replicate')
+
+        skips: list[torch.Tensor] = []
+        for level, encoder in enumerate(self.encoders):
+            if level > 0:
+                x = F.max_pool3d(x, 2)
+            x = encoder(x)
+            skips.append(x)
+        skips.pop()
+        for decoder in self.decoders:
+            skip = skips.pop()
+            x = F.interpolate(x, size=skip.shape[2:], mode='trilinear',
+                              align_corners=False)
+            x = decoder(torch.cat([x, skip], dim=1))
+        x = self.head(x)
+        return x[:, :, :shape[0], :shape[1], :shape[2]]
+
+
+def normalize_intensity(images: torch.Tensor) -> torch.Tensor:
+    """Normalize images to a mean intensity of 1.
+
+    Parameters
+    ----------
+    images
+        Images with shape (b, 1, z, y, x)
+
+    Returns
+    -------
+        Normalized images
+    """
+    mean = images.flatten(1).mean(dim=1).abs()
+    mean = mean.clamp_min(torch.finfo(images.dtype).tiny)
+    return images / mean[:, None, None, None, None]
+
+
+def shrink(images: torch.Tensor, factor: int) -> torch.Tensor:
+    """Downsample images by average pooling.
+
+    Parameters
+    ----------
+    images
+        Images with shape (b, 1, z, y, x)
+    factor
+        Downsampling factor, dimensions are never shrunk below 1
+
+    Returns
+    -------
+        Downsampled images
+    """
+    if factor <= 1:
+        return images
+    kernel = [min(factor, size) for size in images.shape[2:]]
+    return F.avg_pool3d(images, kernel, ceil_mode=True)
+
+
+def expand(log_bias: torch.Tensor,
+           shape: tuple[int, int, int]) -> torch.Tensor:
+    """Interpolate downsampled log bias fields to the full resolution.
+
+    Parameters
+    ----------
+    log_bias
+        Log bias fields with shape (b, 1, z', y', x')
+    shape
+        Full resolution shape (z, y, x)
+
+    Returns
+    -------
+        Log bias fields with shape (b, 1, z, y, x)
+    """
+    if tuple(log_bias.shape[2:]) == tuple(shape):
+        return log_bias
+    return F.interpolate(log_bias, size=shape, mode='trilinear',
+                         align_corners=False)
+
+
+class BiasFieldModel(nn.Module):
+    """Model mapping corrupted images to bias fields, e.g. for training.
+
+    Wraps a network predicting log bias fields of normalized images, see
+    CNNEstimator.training_model.
+    """
+
+    def __init__(self, network: nn.Module, shrink_factor: int = 1) -> None:
+        """Create a bias field model.
+
+        Parameters
+        ----------
+        network
+            Network predicting log bias fields of normalized images
+        shrink_factor, optional
+            Downsampling factor of the network input, by default 1
+        """
+        super().__init__()
+        self.network = network
+        self.shrink_factor = shrink_factor
+
+    def forward(self, images: torch.Tensor) -> torch.Tensor:
+        """Predict bias fields.
+
+        Parameters
+        ----------
+        images
+            Corrupted images with shape (b, 1, z, y, x)
+
+        Returns
+        -------
+            Bias fields with shape (b, 1, z, y, x)
+        """
+        log_bias = self.network(shrink(normalize_intensity(images),
+                                       self.shrink_factor))
+        return expand(log_bias, images.shape[2:]).exp()
+
+
+def _tile_starts(size: int, tile: int, overlap: int) -> list[int]:
+    """Get the start indices of overlapping tiles along one dimension.
+
+    Parameters
+    ----------
+    size
+        Size of the dimension
+    tile
+        Tile size
+    overlap
+        Minimal overlap of neighboring tiles
+
+    Returns
+    -------
+        Start indices, the last tile ends at size
+    """
+    if tile >= size:
+        return [0]
+    stride = max(tile - overlap, 1)
+    starts = list(range(0, size - tile, stride))
+    return starts + [size - tile]
+
+
+def _blend_weights(region: tuple[slice, slice, slice],
+                   shape: tuple[int, int, int], overlap: int,
+                   device: torch.device) -> torch.Tensor:
+    """Get separable blending weights of a tile.
+
+    The weights ramp up linearly over the center half of the overlap from
+    each tile border inside the volume. Predictions at borders of the volume
+    are kept.
+
+    Parameters
+    ----------
+    region
+        Slices of the tile in the volume
+    shape
+        Shape (z, y, x) of the volume
+    overlap
+        Overlap of neighboring tiles
+    device
+        Device of the weights
+
+    Returns
+    -------
+        Positive weights with the shape of the tile
+    """
+    # The outer quarter of the overlap gets almost no weight, since the
+    # predictions close to tile borders lack context
+    margin = overlap // 4
+    width = overlap + 1 - 2 * margin
+    weights = []
+    for index, size in zip(region, shape):
+        position = torch.arange(index.start, index.stop, dtype=torch.float32,
+                                device=device)
+        weight = torch.ones_like(position)
+        if index.start > 0:
+            ramp = (position - index.start + 1 - margin) / width
+            weight = torch.minimum(weight, ramp)
+        if index.stop < size:
+            ramp = (index.stop - position - margin) / width
+            weight = torch.minimum(weight, ramp)
+        weight = weight.clamp_min(1e-3)
+        weights.append(weight)
+    return weights[0][:, None, None] * weights[1][None, :, None] \
+        * weights[2][None, None, :]
+
+
+class CNNEstimator(BiasEstimator):
+    """Bias field estimator based on a 3D U-Net.
+
+    The network predicts the log bias field of intensity normalized and
+    downsampled images, which is interpolated to the full resolution.
+    Volumes of a batch are processed batchSize at a time. With a tileSize,
+    the downsampled volumes are split into overlapping cubic tiles, whose
+    predictions are blended with linear weights, which bounds the memory of
+    large volumes. Intensities are normalized per volume before tiling.
+
+    The network is trained with SupervisedTrainer on training_model(). For
+    serving, it can be exported with TorchScript or compiled with
+    torch.compile.
+    """
+
+    def __init__(self, hparams: CNNHyperparameters | None = None,
+                 network: nn.Module | None = None) -> None:
+        """Create a U-Net bias field estimator.
+
+        Parameters
+        ----------
+        hparams, optional
+            CNNHyperparameters, by default the defaults
+        network, optional
+            Network predicting log bias fields, e.g. a trained or loaded
+            TorchScript network, by default a new UNet3D
+        """
+        if hparams is None:
+            hparams = CNNHyperparameters()
+        self.hparams = hparams
+        if network is None:
+            network = UNet3D(hparams.numberLevels, hparams.numberFeatures)
+        self.network = network
+
+    @property
+    def device(self) -> torch.device | None:
+        """Get the device of the network.
+
+        Returns
+        -------
+            Device of the first parameter or buffer, None for networks
+            without tensors
+        """
+        tensor = next(itertools.chain(self.network.parameters(),
+                                      self.network.buffers()), None)
+        return tensor.device if tensor is not None else None
+
+    def training_model(self) -> BiasFieldModel:
+        """Get the model to train, sharing the parameters of the network.
+
+        Returns
+        -------
+            Model mapping corrupted images to bias fields
+        """
+        return BiasFieldModel(self.network, self.hparams.shrinkFactor)
+
+    @instrument
+    def __call__(self, image: ImageData) -> ImageData:
+        """Estimate the bias field of an image or a batch of images.
+
+        Parameters
+        ----------
+        image
+            Single channel image with shape (1, z, y, x) or (b, 1, z, y, x)
+
+        Returns
+        -------
+            Bias field with the shape and on the device of image
+
+        Raises
+        ------
+        ValueError
+            If the image has more than one channel
+        """
+        image = image.upcast()
+        data = image.data
+        if data.shape[-4] != 1:
+            raise ValueError('Only single channel images are supported. '
+                             f'Got shape {tuple(data.shape)}.')
+        volumes = data.reshape(-1, *data.shape[-4:])
+        device = self.device or data.device
+
+        self.network.eval()
+        with torch.inference_mode():
+            volumes = shrink(normalize_intensity(volumes),
+                             self.hparams.shrinkFactor)
+            if self.hparams.tileSize is None:
+                log_bias = torch.cat([
+                    self.network(batch.to(device)).to(volumes.device)
+                    for batch in volumes.split(self.hparams.batchSize)])
+            else:
+                log_bias = self._predict_tiled(volumes, device)
+            log_bias = expand(log_bias, data.shape[-3:])
+
+        biasfield = ImageData(log_bias.exp().reshape(data.shape))
+        biasfield.header = copy.deepcopy(image.header)
+        return biasfield
+
+    def _predict_tiled(self, volumes: torch.Tensor,
+                       device: torch.device) -> torch.Tensor:
+        """Predict log bias fields tile by tile.
+
+        Only the tiles of a batch are moved to the device of the network,
+        the predictions are blended on the device of the volumes.
+
+        Parameters
+        ----------
+        volumes
+            Network inputs with shape (b, 1, z, y, x)
+        device
+            Device of the network
+
+        Returns
+        -------
+            Log bias fields with shape (b, 1, z, y, x) on the device of
+            volumes
+        """
+        tile = self.hparams.tileSize
+        overlap = self.hparams.tileOverlap
+        shape = volumes.shape[-3:]
+        tile_shape = tuple(min(tile, size) for size in shape)
+
+        regions = [tuple(slice(s, s + edge)
+                         for s, edge in zip(start, tile_shape))
+                   for start in itertools.product(*(
+                       _tile_starts(size, edge, overlap)
+                       for size, edge in zip(shape, tile_shape)))]
+        # Tiles of all volumes are batched together
+        tiles = [(index, region) for index in range(volumes.shape[0])
+                 for region in regions]
+
+        log_bias = torch.zeros_like(volumes)
+        weight_sum = torch.zeros_like(volumes)
+        for start in range(0, len(tiles), self.hparams.batchSize):
+            batch = tiles[start:start + self.hparams.batchSize]
+            inputs = torch.stack([volumes[(index, slice(None), *region)]
+                                  for index, region in batch])
+            outputs = self.network(inputs.to(device)).to(volumes.device)
+            for (index, region), output in zip(batch, outputs):
+                weights = _blend_weights(region, shape, overlap,
+                                         volumes.device).to(volumes.dtype)
+                log_bias[(index, slice(None), *region)] += output * weights
+                weight_sum[(index, slice(None), *region)] += weights
+        return log_bias / weight_sum
+
+    def compile(self, **kwargs) -> None:
+        """Compile the network with torch.compile.
+
+        Parameters
+        ----------
+        kwargs
+            Keyword arguments of torch.compile
+        """
+        self.network = torch.compile(self.network, **kwargs)
+
+    def export_torchscript(self, file: Path | str) -> None:
+        """Save the network in eval mode as TorchScript.
+
+        Parameters
+        ----------
+        file
+            Output file, loaded with load_torchscript
+        """
+        self.network.eval()
+        torch.jit.save(torch.jit.script(self.network), file)
+
+    @classmethod
+    def load_torchscript(cls, file: Path | str,
+                         hparams: CNNHyperparameters | None = None,
+                         device: torch.device | str | None = None,
+                         ) -> 'CNNEstimator':
+        """Create an estimator from a TorchScript network.
+
+        Parameters
+        ----------
+        file
+            File written by export_torchscript
+        hparams, optional
+            CNNHyperparameters of the inference, by default the defaults
+        device, optional
+            Device of the network, by default the saved device
+
+        Returns
+        -------
+            Estimator using the loaded network
+        """
+        return cls(hparams, network=torch.jit.load(file, map_location=device))
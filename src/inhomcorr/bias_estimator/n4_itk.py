@@ -1,4 +1,9 @@
 """Implementaion of N4 bias field estimator."""
+import os
+import time
+import weakref
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 
 import numpy as np
@@ -7,7 +12,17 @@ import torch
 
 from inhomcorr.bias_estimator.bias_estimator_interface import BiasEstimator
 from inhomcorr.bias_estimator.bias_estimator_interface import HyperParameters
+from inhomcorr.instrumentation import instrument
 from inhomcorr.mrdata import ImageData
+from inhomcorr.sitk_conversion import image_to_sitk
+from inhomcorr.sitk_conversion import mask_to_sitk
+from inhomcorr.sitk_conversion import sitk_to_image
+
+# Otsu masks of images without a mask, shared between all N4Estimators.
+# Keyed on the id of the tensor owning the storage of the image data, which
+# outlives the short-lived subjects of unstack, and then on the view of the
+# subject. Entries are removed once the tensor is garbage collected.
+_OTSU_MASK_CACHE: dict[int, dict[tuple, tuple[int, sitk.Image]]] = {}
 
 
 @dataclass
@@ -19,10 +34,14 @@ class N4Hyperparameters(HyperParameters):
     Hyperparameters
         maxNumberIterations: Number of iterations inside N4
         numberFittingLevels: Levels of Spline Approximation
+        shrinkFactor: Downsampling factor of image and mask used for fitting
+            the bias field. The log bias field is evaluated on the full
+            resolution grid afterwards. 1 fits at full resolution.
     """
 
     maxNumberIterations: int = 50
     numberFittingLevels: int = 4
+    shrinkFactor: int = 1
 
 
 class N4Estimator(BiasEstimator):
@@ -34,21 +53,29 @@ class N4Estimator(BiasEstimator):
         Class of type BiasEstimator
     """
 
-    def __init__(self, hparams: N4Hyperparameters | None) -> None:
+    def __init__(self, hparams: N4Hyperparameters | None,
+                 cache_mask: bool = True) -> None:
         """Generate an N4 Biasfield Corrector.
 
         Parameters
         ----------
         hparams
             N4Hyperparameters.
+        cache_mask, optional
+            Reuse the Otsu mask of an image without a mask when the same
+            image is estimated again, by default True
         """
         if hparams is None:
             hparams = N4Hyperparameters()
         self.hparams = hparams
+        self.cache_mask = cache_mask
 
+    @instrument
     def __call__(self, image: ImageData) -> ImageData:
         """Compute the bias field based on SITK N4 method.
 
+        N4 fits each subject of a batch separately.
+
         Parameters
         ----------
         image
@@ -56,10 +83,66 @@ class N4Estimator(BiasEstimator):
 
         Returns
         -------
-            _description_
+            Bias field with the shape of image
         """
+        if image.is_batched:
+            return ImageData.stack([self.sitk_n4_estimation(item)
+                                    for item in image.unstack()])
         return self.sitk_n4_estimation(image)
 
+    @instrument
+    def estimate_many(self, images: Sequence[ImageData],
+                      workers: int | None = None,
+                      threads_per_worker: int | None = None,
+                      ) -> tuple[list[ImageData], list[float]]:
+        """Estimate the bias fields of many images using a process pool.
+
+        Parameters
+        ----------
+        images
+            Sequence of ImageData objects
+        workers, optional
+            Number of worker processes. None (default) uses one worker per
+            cpu. With a single worker the images are processed in the
+            calling process.
+        threads_per_worker, optional
+            Number of threads SimpleITK may use in each worker. None
+            (default) splits the available cpus evenly between the workers.
+
+        Returns
+        -------
+            List of bias fields in input order
+            List of wall times in s needed for each image
+        """
+        n_cpu = os.cpu_count() or 1
+        if workers is None:
+            workers = n_cpu
+        workers = max(1, min(workers, len(images)))
+        if threads_per_worker is None:
+            threads_per_worker = max(1, n_cpu // workers)
+
+        if workers == 1:
+            default_threads = \
+                sitk.ProcessObject.GetGlobalDefaultNumberOfThreads()
+            sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(
+                threads_per_worker)
+            try:
+                results = [_n4_worker(self, image) for image in images]
+            finally:
+                sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(
+                    default_threads)
+        else:
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_n4_worker_init,
+                                     initargs=(threads_per_worker,)) as pool:
+                # map returns the results in the order of the input
+                results = list(pool.map(_n4_worker, [self] * len(images),
+                                        images))
+
+        biasfields = [biasfield for biasfield, _ in results]
+        wall_times = [wall_time for _, wall_time in results]
+        return biasfields, wall_times
+
     def format_input_data(self, image: ImageData) -> sitk.Image:
         """Extract data from image and put into sitk.Image.
 
@@ -72,16 +155,60 @@ class N4Estimator(BiasEstimator):
         -------
             sitk.Image
         """
-        data = image.numpy
+        sitk_img = image_to_sitk(image)
+        assert sitk_img.GetDimension() in (2, 3), (
+            f'Your data must be 3D or 2D. You gave {sitk_img.GetDimension()}')
 
-        if data is None:  # TODO: Remove once data is forced not to be None
-            raise RuntimeError('ImageData.data should not be None.')
+        return sitk_img
 
-        data = np.squeeze(data)
-        assert data.ndim < 4 and data.ndim > 1,\
-            f'Your data must be 3D or 2D. You gave {data.ndim}'
+    def format_input_mask(self, image: ImageData,
+                          sitk_img: sitk.Image) -> sitk.Image:
+        """Get the mask used by N4 for the image.
 
-        return sitk.GetImageFromArray(data)
+        The mask of the ImageData is used if it is set. Otherwise an Otsu
+        mask is calculated, which is cached as long as the image data is
+        not changed. Subjects of a batch share the cache of the batch.
+
+        Parameters
+        ----------
+        image
+            ImageData containting image and optionally a mask
+        sitk_img
+            image as returned by format_input_data
+
+        Returns
+        -------
+            sitk.Image with 1 inside and 0 outside of the mask
+        """
+        if image.mask is not None:
+            return mask_to_sitk(image, sitk_img)
+
+        if not self.cache_mask:
+            return sitk.OtsuThreshold(sitk_img, 0, 1, 200)
+
+        # Compact tensor, quantized images dequantize on every access of data
+        data = image._data
+        base = data if data._base is None else data._base
+        view = (data.storage_offset(), tuple(data.shape), tuple(data.stride()),
+                tuple(image.shape), image._quantization.get('_data'))
+        masks = _OTSU_MASK_CACHE.get(id(base))
+        if masks is None:
+            masks = _OTSU_MASK_CACHE[id(base)] = {}
+            weakref.finalize(base, _OTSU_MASK_CACHE.pop, id(base), None)
+        # In-place changes of the data or other views increase the version
+        # counter shared by all views of the base
+        cached = masks.get(view)
+        if cached is None or cached[0] != base._version:
+            cached = (base._version, sitk.OtsuThreshold(sitk_img, 0, 1, 200))
+            masks[view] = cached
+        mask_img = cached[1]
+        mask_img.CopyInformation(sitk_img)
+        return mask_img
+
+    @staticmethod
+    def clear_mask_cache() -> None:
+        """Remove all cached Otsu masks."""
+        _OTSU_MASK_CACHE.clear()
 
     def sitk_n4_estimation(self, image: ImageData) -> ImageData:
         """Estimate the bias field from iamge using the N4 method of SITK.
@@ -96,24 +223,57 @@ class N4Estimator(BiasEstimator):
             Biasfield
         """
         sitk_img = self.format_input_data(image)
-        # TODO: use mask of Image data
-        maskImage = sitk.OtsuThreshold(sitk_img, 0, 1, 200)
+        maskImage = self.format_input_mask(image, sitk_img)
         corrector = sitk.N4BiasFieldCorrectionImageFilter()
 
         corrector.SetMaximumNumberOfIterations(
             [self.hparams.maxNumberIterations]
             * self.hparams.numberFittingLevels
         )
-        corrector.Execute(sitk_img, maskImage)
+        if self.hparams.shrinkFactor > 1:
+            # Fit on a downsampled grid, dimensions are never shrunk below 1
+            shrink = [min(self.hparams.shrinkFactor, size)
+                      for size in sitk_img.GetSize()]
+            corrector.Execute(sitk.Shrink(sitk_img, shrink),
+                              sitk.Shrink(maskImage, shrink))
+        else:
+            corrector.Execute(sitk_img, maskImage)
 
+        # The log bias field is always evaluated on the full resolution grid
         logbiasfield = corrector.GetLogBiasFieldAsImage(sitk_img)
-        logbiasfield = sitk.GetArrayFromImage(logbiasfield)
-        biasfield = np.exp(logbiasfield)
-        biasfield = torch.tensor(biasfield)
-
-        while biasfield.ndim < 4:
-            biasfield = torch.unsqueeze(biasfield, 0)
-        # TODO: adjust once we force setting the data in the constructor
-        biasfield_img = ImageData(biasfield)
+        biasfield_img = sitk_to_image(logbiasfield, header=image.header,
+                                      transform=np.exp, shape=image.shape)
 
         return biasfield_img
+
+
+def _n4_worker_init(threads: int) -> None:
+    """Limit the number of threads used inside a worker process.
+
+    Parameters
+    ----------
+    threads
+        Number of threads for SimpleITK and torch
+    """
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(threads)
+    torch.set_num_threads(threads)
+
+
+def _n4_worker(estimator: N4Estimator,
+               image: ImageData) -> tuple[ImageData, float]:
+    """Estimate a single bias field and measure the wall time.
+
+    Parameters
+    ----------
+    estimator
+        N4Estimator, a pickled copy in worker processes
+    image
+        ImageData object
+
+    Returns
+    -------
+        Bias field and wall time in s
+    """
+    start = time.perf_counter()
+    biasfield = estimator(image)
+    return biasfield, time.perf_counter() - start
@@ -0,0 +1,289 @@
+"""Bias field estimation with a polynomial log bias field in torch."""
+import copy
+from dataclasses import dataclass
+
+import torch
+
+from inhomcorr.bias_creator.polynomial_basis import PolynomialBasisCache
+from inhomcorr.bias_estimator.bias_estimator_interface import BiasEstimator
+from inhomcorr.bias_estimator.bias_estimator_interface import HyperParameters
+from inhomcorr.instrumentation import instrument
+from inhomcorr.mrdata import ImageData
+
+
+@dataclass
+class PolynomialHyperparameters(HyperParameters):
+    """Hyperparameters of the polynomial bias field estimator.
+
+    Parameters
+    ----------
+    Hyperparameters
+        polynomialOrder: Maximal order of the log bias field polynomial
+        numberClasses: Number of tissue classes with constant intensity.
+            With more than one class, class means and the bias field are
+            estimated alternately.
+        numberIterations: Alternating iterations if numberClasses > 1
+        shrinkFactor: Only every shrinkFactor-th voxel along each dimension
+            is used for fitting the bias field. 1 fits all voxels.
+        regularization: Relative Tikhonov regularization of the fit
+    """
+
+    polynomialOrder: int = 3
+    numberClasses: int = 1
+    numberIterations: int = 10
+    shrinkFactor: int = 2
+    regularization: float = 1e-6
+
+
+def _otsu_mask(data: torch.Tensor, bins: int = 200) -> torch.Tensor:
+    """Calculate an Otsu mask of each image of a batch.
+
+    Parameters
+    ----------
+    data
+        Images with shape (B, N)
+    bins, optional
+        Number of histogram bins, by default 200
+
+    Returns
+    -------
+        Boolean mask with shape (B, N), True above the threshold
+    """
+    low = data.amin(dim=1, keepdim=True)
+    high = data.amax(dim=1, keepdim=True)
+    width = (high - low).clamp_min(torch.finfo(data.dtype).tiny) / bins
+    index = ((data - low) / width).long().clamp_(0, bins - 1)
+    counts = torch.zeros((data.shape[0], bins), dtype=data.dtype,
+                         device=data.device)
+    counts.scatter_add_(1, index, torch.ones_like(data))
+
+    centers = torch.arange(bins, dtype=data.dtype, device=data.device)
+    weight_low = counts.cumsum(dim=1)
+    weight_high = weight_low[:, -1:] - weight_low
+    sum_low = (counts * centers).cumsum(dim=1)
+    mean_low = sum_low / weight_low.clamp_min(1)
+    mean_high = (sum_low[:, -1:] - sum_low) / weight_high.clamp_min(1)
+    between = weight_low * weight_high * (mean_low - mean_high)**2
+    threshold = between.argmax(dim=1, keepdim=True)
+    return index > threshold
+
+
+def _kmeans(values: torch.Tensor, weights: torch.Tensor, classes: int,
+            iterations: int = 10) -> torch.Tensor:
+    """Cluster the values of each image of a batch.
+
+    Parameters
+    ----------
+    values
+        Values with shape (B, N)
+    weights
+        Weights with shape (B, N), voxels with zero weight are ignored
+    classes
+        Number of clusters
+    iterations, optional
+        Number of Lloyd iterations, by default 10
+
+    Returns
+    -------
+        Center of the cluster of each voxel with shape (B, N)
+    """
+    inside = weights > 0
+    low = torch.where(inside, values, torch.inf).amin(dim=1, keepdim=True)
+    high = torch.where(inside, values, -torch.inf).amax(dim=1, keepdim=True)
+    fractions = (torch.arange(classes, dtype=values.dtype,
+                              device=values.device) + 0.5) / classes
+    centers = low + (high - low) * fractions
+    for _ in range(iterations):
+        labels = (values[:, None] - centers[..., None]).abs().argmin(dim=1)
+        sums = torch.zeros_like(centers).scatter_add_(1, labels,
+                                                      weights * values)
+        counts = torch.zeros_like(centers).scatter_add_(1, labels, weights)
+        # Empty clusters keep their center
+        centers = torch.where(counts > 0, sums / counts.clamp_min(1e-12),
+                              centers)
+    labels = (values[:, None] - centers[..., None]).abs().argmin(dim=1)
+    return centers.gather(1, labels)
+
+
+class PolynomialEstimator(BiasEstimator):
+    """Bias field estimator fitting a polynomial log bias field in torch.
+
+    The log image inside a mask is fitted by weighted least squares with a
+    polynomial following the bias field model of BiasCreatorTorchio. The
+    mask of the ImageData is used if it is set, otherwise an Otsu mask.
+    All images of a batch are fitted at once on the device of the image
+    and the estimate is differentiable with respect to the image.
+
+    The bias fields are normalized to a mean log bias of 0 inside the mask.
+    """
+
+    def __init__(self, hparams: PolynomialHyperparameters | None = None,
+                 cache_max_bytes: int = 2**30) -> None:
+        """Create a polynomial bias field estimator.
+
+        Parameters
+        ----------
+        hparams, optional
+            PolynomialHyperparameters, by default the defaults
+        cache_max_bytes, optional
+            Maximal memory of the cached polynomial bases, by default 1 GiB
+        """
+        if hparams is None:
+            hparams = PolynomialHyperparameters()
+        self.hparams = hparams
+        self.basis_cache = PolynomialBasisCache(cache_max_bytes)
+
+    @instrument
+    def __call__(self, image: ImageData) -> ImageData:
+        """Estimate the bias field of an image or a batch of images.
+
+        Parameters
+        ----------
+        image
+            Single channel image with shape (1, z, y, x) or (b, 1, z, y, x)
+
+        Returns
+        -------
+            Bias field with the shape of image
+
+        Raises
+        ------
+        ValueError
+            If the image has more than one channel
+        """
+        image = image.upcast()
+        data = image.data
+        if data.shape[-4] != 1:
+            raise ValueError('Only single channel images are supported. '
+                             f'Got shape {tuple(data.shape)}.')
+        shape = tuple(data.shape[-3:])
+        mask = None
+        if image.mask is not None:
+            mask = torch.broadcast_to(image.mask != 0, data.shape).reshape(
+                -1, *shape)
+        log_bias = self.fit(data.reshape(-1, *shape), mask)
+
+        biasfield = ImageData(log_bias.exp().reshape(data.shape))
+        biasfield.header = copy.deepcopy(image.header)
+        return biasfield
+
+    def fit(self, data: torch.Tensor,
+            mask: torch.Tensor | None = None) -> torch.Tensor:
+        """Fit the log bias fields of a batch of volumes.
+
+        Parameters
+        ----------
+        data
+            Volumes with shape (B, z, y, x), integer volumes are fitted in
+            float32
+        mask, optional
+            Masks with shape (B, z, y, x), nonzero inside, by default Otsu
+            masks
+
+        Returns
+        -------
+            Log bias fields with shape (B, z, y, x)
+        """
+        hparams = self.hparams
+        shape = tuple(data.shape[1:])
+        if not data.is_floating_point():
+            # e.g. uint8 or int16 images of the dicom and nifti loaders
+            data = data.to(torch.float32)
+        if mask is None:
+            mask = _otsu_mask(data.detach().reshape(data.shape[0], -1))
+            mask = mask.reshape(data.shape)
+        else:
+            mask = mask != 0
+        # Fit on every shrinkFactor-th voxel, which keeps the exact voxel
+        # positions and avoids partial volume effects of pooling
+        step = slice(None, None, max(hparams.shrinkFactor, 1))
+        basis = self._basis(shape, data)
+        fit_basis = basis[:, step, step, step]
+        fit_data = data[:, step, step, step].reshape(data.shape[0], -1)
+        mask = mask[:, step, step, step].reshape(fit_data.shape)
+
+        fit_basis = fit_basis.reshape(fit_basis.shape[0], -1)
+        weights = (mask & (fit_data > 0)).to(data.dtype)
+        log_data = fit_data.clamp_min(torch.finfo(data.dtype).tiny).log()
+
+        target = log_data
+        fit_log_bias = torch.zeros_like(log_data)
+        iterations = hparams.numberIterations if hparams.numberClasses > 1 \
+            else 1
+        for _ in range(iterations):
+            if hparams.numberClasses > 1:
+                # Classes of the image corrected with the current estimate
+                corrected = (log_data - fit_log_bias).detach()
+                target = log_data - _kmeans(corrected, weights,
+                                            hparams.numberClasses)
+            coefficients = self._solve(fit_basis, weights, target)
+            fit_log_bias = coefficients @ fit_basis
+
+        # Remove the mean log bias inside the mask
+        mean = (fit_log_bias * weights).sum(dim=1, keepdim=True) \
+            / weights.sum(dim=1, keepdim=True).clamp_min(1)
+        log_bias = coefficients @ basis.reshape(basis.shape[0], -1)
+        return (log_bias - mean).reshape(-1, *shape)
+
+    def _basis(self, shape: tuple[int, int, int],
+               data: torch.Tensor) -> torch.Tensor:
+        """Get the polynomial basis of a grid.
+
+        Parameters
+        ----------
+        shape
+            Shape (z, y, x) of the grid
+        data
+            Tensor defining dtype and device
+
+        Returns
+        -------
+            Basis with shape (number of terms, z, y, x)
+        """
+        return self.basis_cache.get(shape, self.hparams.polynomialOrder,
+                                    dtype=data.dtype, device=data.device)
+
+    def _solve(self, basis: torch.Tensor, weights: torch.Tensor,
+               target: torch.Tensor,
+               chunk_elements: int = 2**24) -> torch.Tensor:
+        """Solve the weighted least squares problems of a batch.
+
+        The normal equations are accumulated over chunks of voxels in
+        float64 to limit memory and rounding errors.
+
+        Parameters
+        ----------
+        basis
+            Basis with shape (T, N)
+        weights
+            Weights with shape (B, N)
+        target
+            Values to fit with shape (B, N)
+        chunk_elements, optional
+            Maximal number of elements of the weighted basis per chunk,
+            by default 2**24
+
+        Returns
+        -------
+            Coefficients with shape (B, T)
+        """
+        n_batch, n_voxels = target.shape
+        n_terms = basis.shape[0]
+        chunk = max(1, chunk_elements // (n_batch * n_terms))
+        normal = target.new_zeros((n_batch, n_terms, n_terms),
+                                  dtype=torch.float64)
+        rhs = target.new_zeros((n_batch, n_terms), dtype=torch.float64)
+        for start in range(0, n_voxels, chunk):
+            part = basis[:, start:start + chunk]
+            weighted = weights[:, None, start:start + chunk] * part
+            normal = normal + (weighted @ part.T).double()
+            rhs = rhs + (weighted @ target[:, start:start + chunk, None]
+                         ).squeeze(-1).double()
+
+        diagonal = normal.diagonal(dim1=1, dim2=2)
+        scale = diagonal.mean(dim=1).clamp_min(1e-12)
+        eye = torch.eye(n_terms, dtype=torch.float64, device=normal.device)
+        damping = self.hparams.regularization * scale
+        normal = normal + damping[:, None, None] * eye
+        coefficients = torch.linalg.solve(normal, rhs)
+        return coefficients.to(target.dtype)
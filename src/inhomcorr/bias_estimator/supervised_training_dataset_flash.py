@@ -0,0 +1,156 @@
+"""Supervised training dataset of simulated FLASH images."""
+import math
+from collections.abc import Iterator
+from collections.abc import Sequence
+
+import torch
+from torch.utils.data import IterableDataset
+
+from inhomcorr.bias_creator.bias_creator_interface import BiasCreator
+from inhomcorr.bias_creator.bias_field_dataset import seed_from_sequence
+from inhomcorr.bias_creator.bias_field_dataset import worker_seed_sequence
+from inhomcorr.bias_estimator.supervised_training_dataset_interface import (
+    SupervisedTrainingDataset,
+)
+from inhomcorr.mrdata import ImageData
+from inhomcorr.mrdata import QMRIData
+from inhomcorr.mrsig.flash import MRSigFlash
+
+
+class SupervisedTrainingDatasetFlash(SupervisedTrainingDataset,
+                                     IterableDataset):
+    """Infinite stream of bias corrupted FLASH images and their bias fields.
+
+    For each chunk a random subject is selected, chunk_size FLASH images are
+    simulated with random repetition times and flip angles and multiplied
+    with chunk_size random bias fields. All calculations of a chunk run at
+    once on the given device. The random streams of DataLoader workers are
+    independent, see BiasFieldDataset.
+    """
+
+    def __init__(self, qmri_data: Sequence[QMRIData],
+                 bias_creator: BiasCreator,
+                 mrsig: MRSigFlash | None = None,
+                 tr_range: tuple[float, float] = (10e-3, 100e-3),
+                 alpha_range: tuple[float, float] = (math.radians(5),
+                                                     math.radians(40)),
+                 chunk_size: int = 16,
+                 device: torch.device | str | None = None,
+                 seed: int = 0) -> None:
+        """Create a dataset of simulated images.
+
+        Parameters
+        ----------
+        qmri_data
+            Quantitative maps of the subjects, e.g. from QMRIDataLoaderNii
+        bias_creator
+            Bias field creator, seeded per worker with manual_seed
+        mrsig, optional
+            FLASH signal model, by default MRSigFlash()
+        tr_range, optional
+            Range of the repetition time in s, by default (10e-3, 100e-3)
+        alpha_range, optional
+            Range of the flip angle in radian, by default 5 to 40 degree
+        chunk_size, optional
+            Number of samples simulated at once, by default 16
+        device, optional
+            Device of the simulation, by default the device of each subject
+        seed, optional
+            Root seed of all random streams, by default 0
+
+        Raises
+        ------
+        ValueError
+            If no QMRIData object is given
+        """
+        super().__init__()
+        if len(qmri_data) == 0:
+            raise ValueError('At least one QMRIData object is required.')
+        self.qmri_data = qmri_data
+        self.bias_creator = bias_creator
+        self.mrsig = mrsig if mrsig is not None else MRSigFlash()
+        self.tr_range = tr_range
+        self.alpha_range = alpha_range
+        self.chunk_size = chunk_size
+        self.device = device
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        """Set the epoch used to derive the seeds of the streams.
+
+        Parameters
+        ----------
+        epoch
+            Epoch number
+        """
+        self.epoch = epoch
+
+    def _uniform(self, low: float, high: float,
+                 generator: torch.Generator) -> torch.Tensor:
+        """Sample chunk_size values uniformly from a range.
+
+        Parameters
+        ----------
+        low
+            Lower bound of the range
+        high
+            Upper bound of the range
+        generator
+            Random number generator of the worker
+
+        Returns
+        -------
+            float64 values with shape (chunk_size,)
+        """
+        values = torch.empty(self.chunk_size, dtype=torch.float64)
+        return values.uniform_(low, high, generator=generator)
+
+    def simulate(self, qmri: QMRIData, tr: torch.Tensor,
+                 alpha: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        """Simulate a chunk of bias corrupted images of one subject.
+
+        Parameters
+        ----------
+        qmri
+            Quantitative maps of the subject
+        tr
+            Repetition times in s
+        alpha
+            Flip angles in radian
+
+        Returns
+        -------
+            Corrupted images and bias fields, both with shape
+            (len(tr), 1, z, y, x)
+        """
+        images = self.mrsig.signal(qmri, tr, alpha).unsqueeze(1)
+        bias = self.bias_creator.get_bias_field_tensor(
+            ImageData(images[0]), len(tr), device=images.device)
+        bias = bias.unsqueeze(1)
+        return images * bias, bias
+
+    def __iter__(self) -> Iterator[tuple[torch.Tensor, torch.Tensor]]:
+        """Iterate over simulated samples.
+
+        Returns
+        -------
+            Iterator of corrupted image and bias field, both with shape
+            (1, z, y, x)
+        """
+        seeds = worker_seed_sequence(self.seed, self.epoch).spawn(2)
+        generator = torch.Generator().manual_seed(
+            seed_from_sequence(seeds[0]))
+        self.bias_creator.manual_seed(seed_from_sequence(seeds[1]))
+
+        while True:
+            index = int(torch.randint(len(self.qmri_data), (1,),
+                                      generator=generator))
+            qmri = self.qmri_data[index]
+            if self.device is not None:
+                qmri = qmri.to(device=self.device)
+            tr = self._uniform(*self.tr_range, generator)
+            alpha = self._uniform(*self.alpha_range, generator)
+            images, bias = self.simulate(qmri, tr, alpha)
+            for ind in range(self.chunk_size):
+                yield images[ind], bias[ind]
@@ -23,8 +23,8 @@ class Trainer(ABC):
         pass
 
     @abstractmethod
-    def _call__(self, dataset: SupervisedTrainingDataset) -> None:
-        """Inferface of a bias field estimato Trainer.
+    def __call__(self, dataset: SupervisedTrainingDataset) -> None:
+        """Inferface of a bias field estimator Trainer.
 
         Parameters
         ----------
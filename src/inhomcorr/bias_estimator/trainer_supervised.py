@@ -0,0 +1,314 @@
+"""Supervised training of learned bias field estimators."""
+import logging
+import os
+import time
+from collections.abc import Callable
+from collections.abc import Iterator
+from dataclasses import asdict
+from dataclasses import dataclass
+from pathlib import Path
+
+import torch
+from torch.utils.data import DataLoader
+from torch.utils.data import IterableDataset
+
+from inhomcorr.bias_estimator.supervised_training_dataset_interface import (
+    SupervisedTrainingDataset,
+)
+from inhomcorr.bias_estimator.trainer_interface import Trainer
+from inhomcorr.bias_estimator.trainer_interface import TrainingParameters
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = 'checkpoint.pt'
+
+PRECISIONS = {'float32': None, 'bfloat16': torch.bfloat16,
+              'float16': torch.float16}
+
+
+@dataclass
+class SupervisedTrainingParameters(TrainingParameters):
+    """Parameters of the supervised training.
+
+    Parameters
+    ----------
+    TrainingParameters
+        numberSteps: Number of optimizer steps
+        batchSize: Number of samples per forward pass
+        accumulationSteps: Number of batches whose gradients are accumulated
+            per optimizer step
+        learningRate: Learning rate of the default Adam optimizer
+        numberWorkers: Number of DataLoader worker processes
+        precision: 'float32', 'bfloat16' or 'float16'. bfloat16 and float16
+            run the forward pass with autocast, float16 scales the loss.
+        logEvery: Number of optimizer steps between throughput logs
+        checkpointEvery: Number of optimizer steps between checkpoints
+    """
+
+    numberSteps: int = 1000
+    batchSize: int = 4
+    accumulationSteps: int = 1
+    learningRate: float = 1e-3
+    numberWorkers: int = 0
+    precision: str = 'float32'
+    logEvery: int = 10
+    checkpointEvery: int = 100
+
+
+class SupervisedTrainer(Trainer):
+    """Trainer of a model predicting bias fields from corrupted images.
+
+    The model is called with batches of corrupted images and its output is
+    compared with the true bias fields by loss_fn. Datasets yield tuples of
+    corrupted image and bias field, e.g. SupervisedTrainingDatasetFlash.
+    Map-style datasets are shuffled each epoch, iterable datasets are
+    restarted when exhausted. Datasets with a set_epoch method get the epoch
+    before each pass.
+
+    If a checkpoint_dir is given, model, optimizer and progress are saved
+    regularly and training resumes from an existing checkpoint. Resumed
+    training starts a new epoch, so infinite streams are not replayed.
+    Loss and throughput in samples/s are logged with the logging module
+    and stored in history.
+    """
+
+    def __init__(self, model: torch.nn.Module,
+                 params: SupervisedTrainingParameters | None = None,
+                 optimizer: torch.optim.Optimizer | None = None,
+                 loss_fn: Callable[[torch.Tensor, torch.Tensor],
+                                   torch.Tensor] | None = None,
+                 device: torch.device | str | None = None,
+                 checkpoint_dir: Path | str | None = None) -> None:
+        """Create a supervised trainer.
+
+        Parameters
+        ----------
+        model
+            Model mapping images with shape (b, 1, z, y, x) to bias fields
+        params, optional
+            SupervisedTrainingParameters, by default the defaults
+        optimizer, optional
+            Optimizer of the model parameters, by default Adam
+        loss_fn, optional
+            Loss of prediction and true bias field, by default mse_loss
+        device, optional
+            Device of the training, by default the device of the model
+        checkpoint_dir, optional
+            Folder of the checkpoint, by default None (no checkpoints)
+
+        Raises
+        ------
+        ValueError
+            If the precision is unknown
+        """
+        if params is None:
+            params = SupervisedTrainingParameters()
+        if params.precision not in PRECISIONS:
+            raise ValueError(f'Unknown precision {params.precision}. '
+                             f'Choose one of {list(PRECISIONS)}.')
+        if device is None:
+            parameter = next(model.parameters(), None)
+            device = parameter.device if parameter is not None else 'cpu'
+        self.device = torch.device(device)
+        self.model = model.to(self.device)
+        self.params = params
+        if optimizer is None:
+            optimizer = torch.optim.Adam(model.parameters(),
+                                         lr=params.learningRate)
+        self.optimizer = optimizer
+        self.loss_fn = loss_fn or torch.nn.functional.mse_loss
+        self.scaler = torch.amp.GradScaler(
+            self.device.type, enabled=params.precision == 'float16')
+        self.checkpoint_dir = Path(checkpoint_dir) if checkpoint_dir \
+            else None
+        self.step = 0
+        self.epoch = 0
+        self.history: list[dict[str, float]] = []
+
+    @property
+    def checkpoint_file(self) -> Path | None:
+        """Get the checkpoint file.
+
+        Returns
+        -------
+            File in checkpoint_dir or None without checkpoint_dir
+        """
+        if self.checkpoint_dir is None:
+            return None
+        return self.checkpoint_dir / CHECKPOINT_FILE
+
+    def save_checkpoint(self, file: Path | str | None = None) -> None:
+        """Save model, optimizer and progress.
+
+        The file is replaced atomically, so an interrupted save keeps the
+        previous checkpoint.
+
+        Parameters
+        ----------
+        file, optional
+            Checkpoint file, by default checkpoint_file
+        """
+        file = Path(file or self.checkpoint_file)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        checkpoint = {'model': self.model.state_dict(),
+                      'optimizer': self.optimizer.state_dict(),
+                      'scaler': self.scaler.state_dict(),
+                      'step': self.step,
+                      # Resumed training starts a new epoch
+                      'epoch': self.epoch + 1,
+                      'params': asdict(self.params)}
+        file_tmp = file.with_name(file.name + '.tmp')
+        torch.save(checkpoint, file_tmp)
+        os.replace(file_tmp, file)
+
+    def load_checkpoint(self, file: Path | str | None = None) -> None:
+        """Load model, optimizer and progress.
+
+        Parameters
+        ----------
+        file, optional
+            Checkpoint file, by default checkpoint_file
+        """
+        file = Path(file or self.checkpoint_file)
+        checkpoint = torch.load(file, map_location=self.device,
+                                weights_only=True)
+        self.model.load_state_dict(checkpoint['model'])
+        self.optimizer.load_state_dict(checkpoint['optimizer'])
+        self.scaler.load_state_dict(checkpoint['scaler'])
+        self.step = checkpoint['step']
+        self.epoch = checkpoint['epoch']
+        logger.info('Resuming from %s at step %d', file, self.step)
+
+    def _data_loader(self, dataset: SupervisedTrainingDataset) -> DataLoader:
+        """Create the DataLoader of the current epoch.
+
+        Parameters
+        ----------
+        dataset
+            Dataset of corrupted images and bias fields
+
+        Returns
+        -------
+            DataLoader of batches
+        """
+        if hasattr(dataset, 'set_epoch'):
+            dataset.set_epoch(self.epoch)
+        kwargs = {}
+        if not isinstance(dataset, IterableDataset):
+            kwargs = {'shuffle': True, 'drop_last': True,
+                      'generator': torch.Generator().manual_seed(self.epoch)}
+        return DataLoader(dataset, batch_size=self.params.batchSize,
+                          num_workers=self.params.numberWorkers,
+                          pin_memory=self.device.type == 'cuda', **kwargs)
+
+    def _batches(self, dataset: SupervisedTrainingDataset,
+                 ) -> Iterator[tuple[torch.Tensor, torch.Tensor]]:
+        """Iterate over batches of all epochs.
+
+        Parameters
+        ----------
+        dataset
+            Dataset of corrupted images and bias fields
+
+        Returns
+        -------
+            Iterator of batches of corrupted images and bias fields
+
+        Raises
+        ------
+        ValueError
+            If the dataset yields no batch
+        """
+        while True:
+            empty = True
+            for images, bias in self._data_loader(dataset):
+                empty = False
+                yield images, bias
+            if empty:
+                raise ValueError('Dataset yields no batch.')
+            self.epoch += 1
+
+    def _train_step(self, batches: Iterator[tuple[torch.Tensor,
+                                                  torch.Tensor]],
+                    ) -> tuple[torch.Tensor, int]:
+        """Run a single optimizer step.
+
+        Parameters
+        ----------
+        batches
+            Iterator of batches of corrupted images and bias fields
+
+        Returns
+        -------
+            Sum of the losses of the accumulated batches and the number of
+            samples
+        """
+        params = self.params
+        autocast_dtype = PRECISIONS[params.precision]
+        non_blocking = self.device.type == 'cuda'
+        loss_sum = torch.zeros((), device=self.device)
+        samples = 0
+        self.optimizer.zero_grad(set_to_none=True)
+        for _ in range(params.accumulationSteps):
+            images, bias = next(batches)
+            images = images.to(self.device, non_blocking=non_blocking)
+            bias = bias.to(self.device, non_blocking=non_blocking)
+            with torch.autocast(self.device.type, dtype=autocast_dtype,
+                                enabled=autocast_dtype is not None):
+                prediction = self.model(images)
+            # Loss in full precision
+            loss = self.loss_fn(prediction.float(), bias.float())
+            self.scaler.scale(loss / params.accumulationSteps).backward()
+            loss_sum += loss.detach()
+            samples += images.shape[0]
+        self.scaler.step(self.optimizer)
+        self.scaler.update()
+        self.step += 1
+        return loss_sum, samples
+
+    def __call__(self, dataset: SupervisedTrainingDataset) -> None:
+        """Train the model until numberSteps optimizer steps are done.
+
+        Parameters
+        ----------
+        dataset
+            Dataset of corrupted images and bias fields
+        """
+        params = self.params
+        if self.checkpoint_file is not None and self.checkpoint_file.exists():
+            self.load_checkpoint()
+        batches = self._batches(dataset)
+        self.model.train()
+
+        running_loss = torch.zeros((), device=self.device)
+        samples = 0
+        batches_done = 0
+        start = time.perf_counter()
+        try:
+            while self.step < params.numberSteps:
+                loss_sum, step_samples = self._train_step(batches)
+                # Losses are only synchronized when logged
+                running_loss += loss_sum
+                samples += step_samples
+                batches_done += params.accumulationSteps
+                last = self.step == params.numberSteps
+
+                if self.step % params.logEvery == 0 or last:
+                    elapsed = time.perf_counter() - start
+                    entry = {'step': self.step,
+                             'loss': running_loss.item() / batches_done,
+                             'samples_per_s': samples / elapsed}
+                    self.history.append(entry)
+                    logger.info('step %d loss %.4g %.1f samples/s',
+                                self.step, entry['loss'],
+                                entry['samples_per_s'])
+                    running_loss.zero_()
+                    samples = 0
+                    batches_done = 0
+                    start = time.perf_counter()
+                if self.checkpoint_file is not None and (
+                        self.step % params.checkpointEvery == 0 or last):
+                    self.save_checkpoint()
+        finally:
+            # Stops the DataLoader workers
+            batches.close()
@@ -0,0 +1,360 @@
+"""Data loader for QMRIData objects directly from dicom files."""
+from collections.abc import Sequence
+from pathlib import Path
+
+import dicom2nifti.settings as settings
+import numpy as np
+import pydicom
+import torch
+
+from inhomcorr.data_loader.data_loader_interface import QMRIDataLoader
+from inhomcorr.data_loader.dcm2nii import group_dicom_series
+from inhomcorr.instrumentation import instrument
+from inhomcorr.mrdata import QMRIData
+
+DicomSource = Path | str | Sequence[Path | str]
+
+
+def _slice_normal(dicom: pydicom.Dataset) -> np.ndarray:
+    """Get the normal of the image plane.
+
+    Parameters
+    ----------
+    dicom
+        dicom dataset
+
+    Returns
+    -------
+        Unit vector perpendicular to rows and columns
+    """
+    orientation = np.asarray(dicom.ImageOrientationPatient, dtype=np.float64)
+    return np.cross(orientation[:3], orientation[3:])
+
+
+def _slice_position(dicom: pydicom.Dataset, normal: np.ndarray) -> float:
+    """Get the position of a slice along the normal of the image plane.
+
+    Parameters
+    ----------
+    dicom
+        dicom dataset
+    normal
+        normal of the image plane
+
+    Returns
+    -------
+        Slice position in mm
+    """
+    position = np.asarray(dicom.ImagePositionPatient, dtype=np.float64)
+    return float(position @ normal)
+
+
+class QMRIDataLoaderDicom(QMRIDataLoader):
+    """Load QMRIData object from dicom files.
+
+    The maps are built directly from the pixel data of the dicom files
+    without intermediate nifti files. Slices are ordered by their position
+    along the normal of the image plane, rescale slope and intercept are
+    applied. Sources are either a folder, which is searched recursively, or
+    a list of dicom files. Folders with several series require the
+    SeriesInstanceUID of the series to load.
+
+    If several images of a series share the same slice position, e.g.
+    multiple echoes or repetitions, the volume to load is chosen with dim.
+    Images at the same position are ordered by AcquisitionNumber,
+    TemporalPositionIdentifier and InstanceNumber.
+
+    The loader keeps the grouped series of each folder and the dicom
+    datasets it has read, so loading header, T1 and rho reads each file
+    once. load_all loads all of them at once. Use clear_cache after the
+    dicom files changed.
+    """
+
+    def __init__(self) -> None:
+        self.qmri_data = QMRIData()
+        # Files of each series by folder
+        self._folders: dict[Path, dict[str, list[Path]]] = {}
+        # Datasets by source and series, and whether they have pixel data
+        self._datasets: dict[tuple, tuple[list[pydicom.Dataset], bool]] = {}
+
+    def clear_cache(self) -> None:
+        """Forget all grouped series and read dicom datasets."""
+        self._folders.clear()
+        self._datasets.clear()
+
+    @instrument
+    def load_all(self, source: DicomSource, t1_dim: int | None = None,
+                 m0_dim: int | None = None, series_uid: str | None = None,
+                 m0_series_uid: str | None = None) -> None:
+        """Load header, T1 and rho from dicom files in a single pass.
+
+        T1 and m0 are either volumes of the same series, chosen with
+        t1_dim and m0_dim, or separate series of source, chosen with
+        series_uid and m0_series_uid. Each series is read once. rho is only
+        loaded if m0_dim or m0_series_uid is given.
+
+        Parameters
+        ----------
+        source
+            folder or list of dicom files
+        t1_dim, optional
+            volume of T1 if the series contains several volumes,
+            by default None (single volume)
+        m0_dim, optional
+            volume of m0 if the series contains several volumes,
+            by default None (single volume)
+        series_uid, optional
+            SeriesInstanceUID of T1 if source contains several series
+        m0_series_uid, optional
+            SeriesInstanceUID of m0, by default the series of T1
+        """
+        # The header reuses the datasets read with pixel data for T1
+        self.load_t1(source, t1_dim, series_uid)
+        self.load_header(source, series_uid)
+        if m0_dim is not None or m0_series_uid is not None:
+            self.load_rho(source, m0_dim, m0_series_uid or series_uid)
+
+    @instrument
+    def load_header(self, source: DicomSource,
+                    series_uid: str | None = None) -> None:
+        """Load header from dicom files.
+
+        The header contains spacing and origin in (x, y, z) order as well as
+        descriptive tags of the series. Pixel data is not read. Series with
+        several volumes take the geometry of the first volume.
+
+        Parameters
+        ----------
+        source
+            folder or list of dicom files
+        series_uid, optional
+            SeriesInstanceUID if source contains several series
+        """
+        dicoms = self._read_series(source, series_uid, pixels=False)
+        # All volumes of a series share the same slice positions
+        volume = self._select_volume(dicoms, 0)
+        self.qmri_data.header = self._header_from_dicoms(volume)
+
+    @instrument
+    def load_t1(self, source: DicomSource, dim: int | None = None,
+                series_uid: str | None = None) -> None:
+        """Load T1 from dicom files.
+
+        Parameters
+        ----------
+        source
+            folder or list of dicom files containing T1
+        dim, optional
+            volume of T1 if the series contains several volumes,
+            by default None (single volume)
+        series_uid, optional
+            SeriesInstanceUID if source contains several series
+        """
+        self.qmri_data.t1 = self._load_param_from_dicom(source, dim,
+                                                        series_uid)
+
+    @instrument
+    def load_rho(self, source: DicomSource, dim: int | None = None,
+                 series_uid: str | None = None) -> None:
+        """Load rho from dicom files containing m0.
+
+        Parameters
+        ----------
+        source
+            folder or list of dicom files containing m0
+        dim, optional
+            volume of m0 if the series contains several volumes,
+            by default None (single volume)
+        series_uid, optional
+            SeriesInstanceUID if source contains several series
+        """
+        m0 = self._load_param_from_dicom(source, dim, series_uid)
+        self.qmri_data.rho = m0 / m0.max()
+
+    def _load_param_from_dicom(self, source: DicomSource, dim: int | None,
+                               series_uid: str | None) -> torch.Tensor:
+        """Load a parameter map from dicom files.
+
+        Parameters
+        ----------
+        source
+            folder or list of dicom files
+        dim
+            volume if the series contains several volumes
+        series_uid
+            SeriesInstanceUID if source contains several series
+
+        Returns
+        -------
+            torch.Tensor with (z, y, x) data
+        """
+        dicoms = self._read_series(source, series_uid, pixels=True)
+        volume = self._select_volume(dicoms, dim)
+        data = np.empty((len(volume), volume[0].Rows, volume[0].Columns),
+                        dtype=np.float32)
+        for index, dicom in enumerate(volume):
+            data[index] = dicom.pixel_array
+            slope = float(dicom.get('RescaleSlope', 1.))
+            intercept = float(dicom.get('RescaleIntercept', 0.))
+            if slope != 1. or intercept != 0.:
+                data[index] *= slope
+                data[index] += intercept
+        return torch.from_numpy(data)
+
+    def _read_series(self, source: DicomSource, series_uid: str | None,
+                     pixels: bool) -> list[pydicom.Dataset]:
+        """Read the dicom files of a single series.
+
+        Datasets read before are reused, datasets without pixel data are
+        read again if pixels are needed.
+
+        Parameters
+        ----------
+        source
+            folder or list of dicom files
+        series_uid
+            SeriesInstanceUID if source contains several series
+        pixels
+            read the pixel data
+
+        Returns
+        -------
+            dicom datasets
+
+        Raises
+        ------
+        ValueError
+            If the source does not contain exactly one matching series
+        """
+        if isinstance(source, (str, Path)) and Path(source).is_dir():
+            key = (Path(source).resolve(), series_uid)
+        elif isinstance(source, (str, Path)):
+            key = ((Path(source).resolve(),), series_uid)
+        else:
+            key = (tuple(Path(file).resolve() for file in source), series_uid)
+        cached = self._datasets.get(key)
+        if cached is not None and (cached[1] or not pixels):
+            return cached[0]
+
+        if isinstance(source, (str, Path)) and Path(source).is_dir():
+            folder = Path(source).resolve()
+            if folder not in self._folders:
+                self._folders[folder] = group_dicom_series(folder)
+            series = self._folders[folder]
+            if series_uid is None and len(series) > 1:
+                raise ValueError(f'{source} contains {len(series)} series. '
+                                 'Choose one with series_uid.')
+            if series_uid is None and series:
+                series_uid = next(iter(series))
+            files = series.get(series_uid, [])
+        else:
+            files = [source] if isinstance(source, (str, Path)) else source
+
+        dicoms = [pydicom.dcmread(file, stop_before_pixels=not pixels,
+                                  force=settings.pydicom_read_force)
+                  for file in files]
+        if series_uid is not None:
+            dicoms = [dicom for dicom in dicoms
+                      if dicom.get('SeriesInstanceUID') == series_uid]
+        if not dicoms:
+            raise ValueError(f'No dicom series found in {source}.')
+        if len({dicom.get('SeriesInstanceUID') for dicom in dicoms}) > 1:
+            raise ValueError('Dicom files belong to several series. '
+                             'Choose one with series_uid.')
+        if 'NumberOfFrames' in dicoms[0]:
+            raise ValueError('Multi-frame dicom files are not supported.')
+        self._datasets[key] = (dicoms, pixels)
+        return dicoms
+
+    @staticmethod
+    def _select_volume(dicoms: list[pydicom.Dataset],
+                       dim: int | None) -> list[pydicom.Dataset]:
+        """Sort dicoms by slice position and select a single volume.
+
+        Parameters
+        ----------
+        dicoms
+            dicom datasets of a series
+        dim
+            volume if several images share a slice position
+
+        Returns
+        -------
+            dicom datasets of the volume ordered by slice position
+
+        Raises
+        ------
+        ValueError
+            If the series contains a different number of volumes than
+            specified by dim
+        """
+        normal = _slice_normal(dicoms[0])
+        slices: dict[float, list[pydicom.Dataset]] = {}
+        for dicom in dicoms:
+            # Round to tolerate numerical noise in the positions
+            position = round(_slice_position(dicom, normal), 3)
+            slices.setdefault(position, []).append(dicom)
+
+        n_volumes = {len(images) for images in slices.values()}
+        if len(n_volumes) != 1:
+            raise ValueError('Slice positions contain different numbers of '
+                             'images.')
+        n_volumes = n_volumes.pop()
+        if dim is None and n_volumes > 1:
+            raise ValueError(f'Series contains {n_volumes} volumes. '
+                             'Choose one with dim.')
+        if dim is not None and not -n_volumes <= dim < n_volumes:
+            raise ValueError(f'Volume {dim} not in series with {n_volumes} '
+                             'volumes.')
+
+        def volume_key(dicom: pydicom.Dataset) -> tuple[int, int, int]:
+            return tuple(int(dicom.get(tag) or 0) for tag in (
+                'AcquisitionNumber', 'TemporalPositionIdentifier',
+                'InstanceNumber'))
+
+        return [sorted(slices[position], key=volume_key)[dim or 0]
+                for position in sorted(slices)]
+
+    @staticmethod
+    def _header_from_dicoms(volume: list[pydicom.Dataset]) -> dict:
+        """Create the header of a volume.
+
+        Parameters
+        ----------
+        volume
+            dicom datasets ordered by slice position
+
+        Returns
+        -------
+            header with spacing, origin and orientation in (x, y, z) order
+        """
+        first = volume[0]
+        row_spacing, column_spacing = (float(s) for s in first.PixelSpacing)
+        if len(volume) > 1:
+            normal = _slice_normal(first)
+            slice_spacing = _slice_position(volume[1], normal) \
+                - _slice_position(first, normal)
+        else:
+            slice_spacing = float(first.get('SpacingBetweenSlices')
+                                  or first.get('SliceThickness') or 1.)
+
+        header = {
+            'spacing': (column_spacing, row_spacing, abs(slice_spacing)),
+            'origin': tuple(float(p) for p in first.ImagePositionPatient),
+            'orientation': tuple(float(o)
+                                 for o in first.ImageOrientationPatient),
+        }
+        for tag in ('SeriesInstanceUID', 'SeriesNumber', 'SeriesDescription',
+                    'Modality'):
+            if tag in first:
+                header[tag] = str(first.get(tag))
+        return header
+
+    def get_data(self) -> QMRIData:
+        """Return QMRIData object.
+
+        Returns
+        -------
+            QMRIData object
+        """
+        return self.qmri_data
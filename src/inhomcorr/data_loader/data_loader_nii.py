@@ -1,4 +1,7 @@
 """Data loader for QMRIData objects from nifti files."""
+import functools
+import os
+from collections.abc import Sequence
 from pathlib import Path
 
 import nibabel as nib
@@ -6,15 +9,86 @@ import numpy as np
 import torch
 
 from inhomcorr.data_loader.data_loader_interface import QMRIDataLoader
+from inhomcorr.instrumentation import instrument
 from inhomcorr.mrdata import QMRIData
 
 
+@functools.lru_cache(maxsize=32)
+def _load_nii_cached(filename_nii: str, mtime_ns: int, size: int,
+                     mmap: bool) -> nib.Nifti1Image:
+    """Load a nifti file, cached on file name, modification time and size.
+
+    Parameters
+    ----------
+    filename_nii
+        resolved nii file name
+    mtime_ns
+        modification time of the file, only used as cache key
+    size
+        size of the file, only used as cache key
+    mmap
+        memory-map uncompressed files
+
+    Returns
+    -------
+        nibabel image with parsed header and array proxy
+    """
+    return nib.load(filename_nii, mmap=mmap)
+
+
+def _load_nii(filename_nii: Path, mmap: bool) -> nib.Nifti1Image:
+    """Load a nifti file, reusing images of unchanged files.
+
+    Parameters
+    ----------
+    filename_nii
+        nii file
+    mmap
+        memory-map uncompressed files
+
+    Returns
+    -------
+        nibabel image with parsed header and array proxy
+    """
+    filename_nii = Path(filename_nii).resolve()
+    stat = os.stat(filename_nii)
+    return _load_nii_cached(str(filename_nii), stat.st_mtime_ns, stat.st_size,
+                            mmap)
+
+
 class QMRIDataLoaderNii(QMRIDataLoader):
-    """Load QMRIData object from nifti file(s)."""
+    """Load QMRIData object from nifti file(s).
 
-    def __init__(self) -> None:
+    In lazy mode (default) uncompressed nifti files are memory-mapped and
+    only the requested volume of 4D files is read through the array proxy
+    of nibabel. The loaded maps are copies, which stay valid if the file
+    changes. Otherwise the whole file is read into memory.
+
+    Parsed nifti files are kept in a cache shared by all loaders, so files
+    used for several parameters or subjects are only opened once. Modified
+    files are opened again.
+    """
+
+    def __init__(self, lazy: bool = True) -> None:
         self.qmri_data = QMRIData()
+        self.lazy = lazy
+
+    @staticmethod
+    def clear_cache() -> None:
+        """Remove all cached nifti files."""
+        _load_nii_cached.cache_clear()
+
+    @staticmethod
+    def cache_info() -> functools._CacheInfo:
+        """Get hits and misses of the nifti file cache.
+
+        Returns
+        -------
+            Cache statistics
+        """
+        return _load_nii_cached.cache_info()
 
+    @instrument
     def load_header(self, file_nii: Path) -> None:
         """Load header from nifti file.
 
@@ -22,11 +96,12 @@ class QMRIDataLoaderNii(QMRIDataLoader):
         ----------
         file_nii
             provide nii file used for header of QMRIData object
-        """        """"""
+        """
         # Read in nii file
-        nii_file = nib.load(file_nii)
+        nii_file = _load_nii(file_nii, mmap=self.lazy)
         self.qmri_data.header = dict(nii_file.header)
 
+    @instrument
     def load_t1(self, file_nii: Path, t1_dim: int = 2) -> None:
         """Load T1 from from nifti file.
 
@@ -41,6 +116,7 @@ class QMRIDataLoaderNii(QMRIDataLoader):
         self.qmri_data.t1, self.t1_nii_file_dim = self._load_param_from_nii(
             file_nii, t1_dim)
 
+    @instrument
     def load_rho(self, file_nii: Path, m0_dim: int = 0) -> None:
         """Load rho from from nifti file.
 
@@ -53,7 +129,48 @@ class QMRIDataLoaderNii(QMRIDataLoader):
             by default 0
         """
         m0, self.m0_nii_file_dim = self._load_param_from_nii(file_nii, m0_dim)
+        self._set_rho_from_m0(m0)
+
+    @instrument
+    def load_all(self, file_nii: Path, t1_dim: int = 2,
+                 m0_dim: int = 0) -> None:
+        """Load header, T1 and rho from a single nifti file.
+
+        The file is opened and its header decoded once. For 4d files T1 and
+        rho are read together, for 2d and 3d files only T1 is loaded.
+
+        Parameters
+        ----------
+        file_nii
+            nii file with all parameters
+        t1_dim, optional
+            if file_nii is 4d, specifies the dimension where T1 is stored,
+            by default 2
+        m0_dim, optional
+            if file_nii is 4d, specifies the dimension where m0 is stored,
+            by default 0
+        """
+        nii_file = _load_nii(file_nii, mmap=self.lazy)
+        self.qmri_data.header = dict(nii_file.header)
+
+        ndim = len(nii_file.shape)
+        if ndim == 4:
+            t1, m0 = self._read_volumes(nii_file, file_nii, [t1_dim, m0_dim])
+            self.m0_nii_file_dim = ndim
+            self._set_rho_from_m0(m0)
+        else:
+            (t1,) = self._read_volumes(nii_file, file_nii, [None])
+        self.qmri_data.t1 = t1
+        self.t1_nii_file_dim = ndim
 
+    def _set_rho_from_m0(self, m0: torch.Tensor) -> None:
+        """Set rho of the QMRIData object from m0.
+
+        Parameters
+        ----------
+        m0
+            m0 map
+        """
         # Calculate rho from m0
         # Calculate mask
         m0 = m0 / m0.max()
@@ -75,36 +192,104 @@ class QMRIDataLoaderNii(QMRIDataLoader):
         -------
             torch.Tensor with parameter data
             int with number of dimensions of nii file
+        """
+        # Read in nii file
+        nii_file = _load_nii(filename_nii, mmap=self.lazy)
+        (data,) = self._read_volumes(nii_file, filename_nii, [dim])
+        return data, len(nii_file.shape)
+
+    def _read_volumes(self, nii_file: nib.Nifti1Image, filename_nii: Path,
+                      dims: Sequence[int | None]) -> list[torch.Tensor]:
+        """Read parameter volumes from a nifti file.
+
+        Parameters
+        ----------
+        nii_file
+            nibabel image
+        filename_nii
+            nii file
+        dims
+            dimensions of the parameters in case of a 4d nifti object,
+            ignored for 2d and 3d files
+
+        Returns
+        -------
+            torch.Tensor with (z, y, x) data of each parameter
 
         Raises
         ------
         ValueError
-            _description_
+            If the nii file is not 2, 3 or 4 dimensional
         """
-        # Read in nii file
-        nii_file = nib.load(filename_nii)
+        # Verify size of nii file
+        ndim = len(nii_file.shape)
+        if ndim not in (2, 3, 4):
+            raise ValueError(f'Wrong number of dimensions in nii file: {ndim}.\
+                            Needs to be 2, 3 or 4 dimensional.')
 
-        # Get numpy data as float32
-        nii_data = np.asarray(nii_file.dataobj, dtype=np.float32)
+        if ndim == 4:
+            if self.lazy:
+                # Read the range of volumes containing all parameters at once
+                first, last = min(dims), max(dims)
+                nii_data = self._read_volume_lazy(
+                    nii_file, filename_nii, slice(first, last + 1))
+                volumes = [nii_data[..., dim - first] for dim in dims]
+            else:
+                # Get numpy data as float32
+                nii_data = np.asarray(nii_file.dataobj, dtype=np.float32)
+                volumes = [nii_data[..., dim] for dim in dims]
+        elif self.lazy:
+            volumes = [self._read_volume_lazy(nii_file, filename_nii, None)]
+        else:
+            volumes = [np.asarray(nii_file.dataobj, dtype=np.float32)]
 
-        # revert oder of axis
-        nii_data = np.transpose(nii_data)
+        data = []
+        for nii_data in volumes:
+            nii_data = nii_data.astype(np.float32, copy=False)
+            # revert oder of axis, returns a view
+            nii_data = np.transpose(nii_data)
+            if ndim == 2:
+                nii_data = nii_data[np.newaxis]
+            data.append(torch.as_tensor(nii_data, dtype=torch.float32))
+        return data
 
-        # Verify size of nii file
-        ndim = nii_data.ndim
-        if ndim == 4:
-            nii_data = nii_data[dim]
+    @staticmethod
+    def _read_volume_lazy(nii_file: nib.Nifti1Image, filename_nii: Path,
+                          dim: int | slice | None) -> np.ndarray:
+        """Read only a single volume of a nifti file.
 
-        elif ndim == 2:
-            nii_data = nii_data[np.newaxis]
+        Uncompressed files without intensity scaling are memory-mapped, so
+        only the pages of the volume are read and copied. Other files are
+        sliced through the array proxy of nibabel.
 
-        elif ndim != 3:
-            raise ValueError(f'Wrong number of dimensions in nii file: {ndim}.\
-                            Needs to be 2, 3 or 4 dimensional.')
+        Parameters
+        ----------
+        nii_file
+            nibabel image loaded with mmap=True
+        filename_nii
+            nii file
+        dim
+            volume (or slice of volumes) of a 4D nifti file, ignored for 2D
+            and 3D files
 
-        data = torch.as_tensor(nii_data, dtype=torch.float32)
+        Returns
+        -------
+            numpy array in nifti (x, y, z) order
+        """
+        proxy = nii_file.dataobj
+        slicer = (..., dim) if len(nii_file.shape) == 4 else ()
+        if Path(filename_nii).suffix == '.nii' and proxy.slope == 1. \
+                and proxy.inter == 0.:
+            # Slice the memory map and copy only the pages of the volume.
+            # The copy does not alias the file, which may be overwritten or
+            # truncated later.
+            return np.array(proxy.get_unscaled()[slicer])
 
-        return data, ndim
+        nii_data = np.asanyarray(proxy[slicer])
+        if not nii_data.flags.writeable:
+            # Arrays created from the raw file buffer are read only
+            nii_data = nii_data.copy()
+        return nii_data
 
     def get_data(self) -> QMRIData:
         """Return QMRIData object.
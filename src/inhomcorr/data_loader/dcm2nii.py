@@ -4,11 +4,288 @@ Heavily relies on package dicom2nifti
 https://github.com/icometrix/dicom2nifti.
 """
 
+import hashlib
+import json
+import logging
+import os
+import re
 import tempfile
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-import dicom2nifti
 import dicom2nifti.settings as settings
+import pydicom
+from dicom2nifti import common
+from dicom2nifti.convert_dicom import dicom_array_to_nifti
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'dcm2nii_manifest.json'
+
+
+def group_dicom_series(folder_in_dicom: Path) -> dict[str, list[Path]]:
+    """Find all imaging dicoms in a directory and group them by series.
+
+    Only the dicom headers are read.
+
+    Parameters
+    ----------
+    folder_in_dicom
+        folder which is searched recursively
+
+    Returns
+    -------
+        Sorted list of dicom files for each SeriesInstanceUID
+    """
+    series: dict[str, list[Path]] = {}
+    for file in sorted(Path(folder_in_dicom).rglob('*')):
+        if not file.is_file() or not common.is_dicom_file(str(file)):
+            continue
+        header = pydicom.dcmread(file, stop_before_pixels=True,
+                                 force=settings.pydicom_read_force)
+        multiframe = 'NumberOfFrames' in header
+        if 'SeriesInstanceUID' not in header or not multiframe and (
+                'ImagePositionPatient' not in header
+                or 'ImageOrientationPatient' not in header):
+            logger.info('Skipping: %s', file)
+            continue
+        series.setdefault(str(header.SeriesInstanceUID), []).append(file)
+    return series
+
+
+def _series_file_stem(header: pydicom.Dataset) -> str:
+    """Get a file name of a series following dicom2nifti.
+
+    Parameters
+    ----------
+    header
+        dicom header of the series
+
+    Returns
+    -------
+        '<SeriesNumber>_<SeriesDescription>' or the SeriesInstanceUID
+    """
+    if 'SeriesNumber' in header:
+        stem = f'{header.SeriesNumber}'
+        for key in ('SeriesDescription', 'SequenceName', 'ProtocolName'):
+            if key in header:
+                stem = f'{stem}_{header.get(key)}'
+                break
+    else:
+        stem = str(header.SeriesInstanceUID)
+    stem = unicodedata.normalize('NFKD', stem.replace(' ', '_'))
+    stem = stem.encode('ASCII', 'ignore').decode('ASCII')
+    stem = re.sub(r'[^\w\s-]', '', stem.strip().lower())
+    return re.sub(r'[-\s]+', '-', stem)
+
+
+def _series_fingerprint(files: list[Path], hash_content: bool,
+                        root: Path) -> str:
+    """Get a hash describing the state of all files of a series.
+
+    Paths are taken relative to root, so moving or remounting the input
+    folder keeps the fingerprint.
+
+    Parameters
+    ----------
+    files
+        dicom files of the series
+    hash_content
+        hash the file content instead of path, size and modification time
+    root
+        input folder containing the files
+
+    Returns
+    -------
+        Hex digest
+    """
+    sha1 = hashlib.sha1()
+    for file in sorted(files):
+        if hash_content:
+            with open(file, 'rb') as fid:
+                for block in iter(lambda: fid.read(2**20), b''):
+                    sha1.update(block)
+        else:
+            stat = os.stat(file)
+            path = file.relative_to(root).as_posix()
+            state = f'{path}:{stat.st_size}:{stat.st_mtime_ns};'
+            sha1.update(state.encode())
+    return sha1.hexdigest()
+
+
+def _convert_series(files: list[Path], file_nifti: Path,
+                    reorient: bool) -> Path | None:
+    """Convert the dicom files of one series into a nifti file.
+
+    Parameters
+    ----------
+    files
+        dicom files of the series
+    file_nifti
+        target nifti file
+    reorient
+        reorient the data to LAS orientation
+
+    Returns
+    -------
+        The nifti file or None if the series could not be converted
+    """
+    settings.disable_validate_slicecount()
+    dicoms = [pydicom.dcmread(file, defer_size='1 KB',
+                              force=settings.pydicom_read_force)
+              for file in files]
+    try:
+        dicom_array_to_nifti(dicoms, str(file_nifti), reorient)
+    except Exception:  # dicom2nifti raises various errors for bad series
+        logger.warning('Unable to convert: %s', file_nifti, exc_info=True)
+        return None
+    return file_nifti
+
+
+class DicomToNiftiConverter:
+    """Incremental conversion of dicom series into nifti files.
+
+    The output folder contains a manifest of all converted series with a
+    fingerprint of their dicom files. Series which are unchanged since the
+    last conversion are skipped, new or changed series are converted in
+    parallel worker processes. Series which failed to convert are recorded
+    as failed and only converted again once their fingerprint changes.
+    """
+
+    def __init__(self, folder_out_nifti: Path, workers: int | None = None,
+                 compression: bool = False, reorient: bool = True,
+                 use_manifest: bool = True,
+                 hash_content: bool = False) -> None:
+        """Create a converter.
+
+        Parameters
+        ----------
+        folder_out_nifti
+            target folder, has to be writable to
+        workers, optional
+            number of worker processes, None (default) uses one per cpu
+        compression, optional
+            write compressed .nii.gz files, by default False
+        reorient, optional
+            reorient the data to LAS orientation, by default True
+        use_manifest, optional
+            read and write the manifest, by default True. Without manifest
+            all series are converted.
+        hash_content, optional
+            detect changed dicom files by their content instead of size and
+            modification time, by default False
+        """
+        self.folder_out_nifti = Path(folder_out_nifti)
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.compression = compression
+        self.reorient = reorient
+        self.use_manifest = use_manifest
+        self.hash_content = hash_content
+
+    @property
+    def manifest_file(self) -> Path:
+        """Get the manifest file.
+
+        Returns
+        -------
+            Path of the manifest in the output folder
+        """
+        return self.folder_out_nifti / MANIFEST_FILE
+
+    def _read_manifest(self) -> dict:
+        """Read the manifest of converted series.
+
+        Returns
+        -------
+            Entries with nifti file name, fingerprint and failure flag per
+            series
+        """
+        if not self.use_manifest or not self.manifest_file.exists():
+            return {}
+        with open(self.manifest_file) as file:
+            return json.load(file)
+
+    def _write_manifest(self, manifest: dict) -> None:
+        """Write the manifest of converted series.
+
+        Parameters
+        ----------
+        manifest
+            Entries with nifti file name, fingerprint and failure flag per
+            series
+        """
+        tmp_file = self.manifest_file.with_suffix('.tmp')
+        with open(tmp_file, 'w') as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+    def convert(self, folder_in_dicom: Path) -> dict[str, Path]:
+        """Convert all new or changed dicom series of a directory.
+
+        Parameters
+        ----------
+        folder_in_dicom
+            folder to convert all dicoms in
+
+        Returns
+        -------
+            nifti file of each SeriesInstanceUID found in the folder, except
+            series which failed to convert
+        """
+        self.folder_out_nifti.mkdir(parents=True, exist_ok=True)
+        manifest = self._read_manifest()
+        suffix = '.nii.gz' if self.compression else '.nii'
+
+        result: dict[str, Path] = {}
+        todo: dict[str, tuple[list[Path], Path, str]] = {}
+        used_names = {entry['nifti'] for entry in manifest.values()}
+        for uid, files in group_dicom_series(folder_in_dicom).items():
+            fingerprint = _series_fingerprint(files, self.hash_content,
+                                              Path(folder_in_dicom))
+            entry = manifest.get(uid)
+            if entry is not None:
+                file_nifti = self.folder_out_nifti / entry['nifti']
+                if entry['fingerprint'] == fingerprint:
+                    if entry.get('failed', False):
+                        logger.info('Skipping failed series: %s', uid)
+                        continue
+                    if file_nifti.exists():
+                        result[uid] = file_nifti
+                        continue
+            else:
+                header = pydicom.dcmread(files[0], stop_before_pixels=True,
+                                         force=settings.pydicom_read_force)
+                name = _series_file_stem(header) + suffix
+                if name in used_names:
+                    # Series sharing number and description
+                    name = f'{_series_file_stem(header)}_' \
+                        f'{hashlib.sha1(uid.encode()).hexdigest()[:8]}{suffix}'
+                used_names.add(name)
+                file_nifti = self.folder_out_nifti / name
+            todo[uid] = (files, file_nifti, fingerprint)
+
+        uids = list(todo)
+        args = ([todo[uid][0] for uid in uids], [todo[uid][1] for uid in uids],
+                [self.reorient] * len(uids))
+        workers = min(self.workers or 1, len(uids))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                converted = list(pool.map(_convert_series, *args))
+        else:
+            converted = list(map(_convert_series, *args))
+
+        for uid, file_nifti in zip(uids, converted):
+            _, file_target, fingerprint = todo[uid]
+            manifest[uid] = {'nifti': file_target.name,
+                             'fingerprint': fingerprint,
+                             'failed': file_nifti is None}
+            if file_nifti is not None:
+                result[uid] = file_nifti
+
+        if self.use_manifest:
+            self._write_manifest(manifest)
+        return result
 
 
 def convert_dcm2nii_dir(folder_in_dicom: Path,
@@ -31,9 +308,6 @@ def convert_dcm2nii_dir(folder_in_dicom: Path,
     if folder_out_nifti is None:
         folder_out_nifti = Path(tempfile.mkdtemp())
 
-    existing_niftis = set(folder_out_nifti.glob('*.nii'))
-    dicom2nifti.convert_directory(
-        folder_in_dicom, folder_out_nifti, reorient=True, compression=False)
-    current_nifits = set(folder_out_nifti.glob('*.nii'))
-    new_nifits = current_nifits-existing_niftis
-    return list(new_nifits)
+    converter = DicomToNiftiConverter(folder_out_nifti, workers=1,
+                                      use_manifest=False)
+    return list(converter.convert(folder_in_dicom).values())
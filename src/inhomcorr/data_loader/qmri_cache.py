@@ -0,0 +1,180 @@
+"""Binary on-disk cache of decoded QMRIData objects.
+
+A cache entry is a folder with one .npy file per map and a small JSON file
+with the header and a fingerprint of the source files. The compact maps are
+saved, so broadcast dimensions and quantized storage are kept, and loaded
+memory-mapped. Entries are invalid once size or modification time (or,
+optionally, the content hash) of any source file changes.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from collections.abc import Iterator
+from collections.abc import Sequence
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO
+
+import numpy as np
+import torch
+
+from inhomcorr.header import decode_header
+from inhomcorr.header import encode_header
+from inhomcorr.mrdata import QMRIData
+
+CACHE_VERSION = 1
+_META_FILE = 'meta.json'
+
+
+def _file_fingerprint(file: Path, hash_content: bool) -> dict:
+    """Describe the state of a source file.
+
+    Parameters
+    ----------
+    file
+        Source file
+    hash_content
+        Include a sha256 hash of the content
+
+    Returns
+    -------
+        Resolved path, size, modification time and optionally the hash
+    """
+    file = Path(file).resolve()
+    stat = os.stat(file)
+    fingerprint = {'path': str(file), 'size': stat.st_size,
+                   'mtime_ns': stat.st_mtime_ns}
+    if hash_content:
+        sha256 = hashlib.sha256()
+        with open(file, 'rb') as fid:
+            for block in iter(lambda: fid.read(2**20), b''):
+                sha256.update(block)
+        fingerprint['sha256'] = sha256.hexdigest()
+    return fingerprint
+
+
+@contextmanager
+def _replace_file(file: Path, mode: str = 'wb') -> Iterator[IO]:
+    """Write a file atomically.
+
+    The content is written to a temporary file with a unique name in the
+    same folder, which replaces the file once it is complete. Concurrent
+    writers never see or replace half-written files of each other.
+
+    Parameters
+    ----------
+    file
+        File to replace
+    mode, optional
+        Mode of the temporary file, 'wb' or 'w', by default 'wb'
+
+    Returns
+    -------
+        Context manager of the opened temporary file
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=file.parent, prefix=f'{file.name}.',
+                                    suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as fid:
+            yield fid
+        os.replace(tmp_name, file)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def save_qmri_cache(qmri_data: QMRIData, cache_dir: Path,
+                    sources: Sequence[Path],
+                    hash_content: bool = False) -> None:
+    """Save a QMRIData object to the cache.
+
+    Parameters
+    ----------
+    qmri_data
+        QMRIData object
+    cache_dir
+        Folder of the cache entry, created if it does not exist
+    sources
+        Files the QMRIData object was loaded from
+    hash_content, optional
+        Validate the cache with a content hash of the sources in addition
+        to size and modification time, by default False
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Remove the metadata first, so an interrupted save leaves an invalid
+    # entry instead of mixing old and new maps
+    (cache_dir / _META_FILE).unlink(missing_ok=True)
+
+    # Compact tensors without materializing broadcast dimensions
+    maps = {'t1': qmri_data._t1, 'rho': qmri_data._rho}
+    if qmri_data.mask is not None:
+        maps['mask'] = qmri_data.mask
+    for name, value in maps.items():
+        # Replace instead of overwriting, the old file may be memory-mapped
+        # by a previously loaded object
+        with _replace_file(cache_dir / f'{name}.npy') as fid:
+            np.save(fid, value.numpy(force=True))
+
+    meta = {'version': CACHE_VERSION,
+            'maps': list(maps),
+            'quantization': {name.lstrip('_'): list(value) for name, value
+                             in qmri_data._quantization.items()},
+            'sources': [_file_fingerprint(file, hash_content)
+                        for file in sources],
+            'header': encode_header(qmri_data.header)}
+    # The metadata is written last, entries are only complete once all
+    # maps are in place
+    with _replace_file(cache_dir / _META_FILE, 'w') as fid:
+        json.dump(meta, fid)
+
+
+def load_qmri_cache(cache_dir: Path, sources: Sequence[Path],
+                    hash_content: bool = False) -> QMRIData | None:
+    """Load a QMRIData object from the cache.
+
+    Parameters
+    ----------
+    cache_dir
+        Folder of the cache entry
+    sources
+        Files the QMRIData object was loaded from
+    hash_content, optional
+        Compare the content hash of the sources, by default False
+
+    Returns
+    -------
+        Memory-mapped QMRIData object or None if the entry is missing or
+        outdated
+    """
+    meta_file = Path(cache_dir) / _META_FILE
+    if not meta_file.exists():
+        return None
+    with open(meta_file) as file:
+        meta = json.load(file)
+
+    if meta.get('version') != CACHE_VERSION:
+        return None
+    try:
+        fingerprints = [_file_fingerprint(file, hash_content)
+                        for file in sources]
+    except FileNotFoundError:
+        return None
+    if len(fingerprints) != len(meta['sources']):
+        return None
+    for current, cached in zip(fingerprints, meta['sources']):
+        if any(cached.get(key) != val for key, val in current.items()):
+            return None
+
+    # Copy-on-write memory maps can be modified without touching the cache
+    maps = {name: torch.from_numpy(np.load(Path(cache_dir) / f'{name}.npy',
+                                           mmap_mode='c'))
+            for name in meta['maps']}
+    qmri_data = QMRIData(t1=maps['t1'], rho=maps['rho'])
+    if 'mask' in maps:
+        qmri_data.mask = maps['mask']
+    qmri_data._quantization = {f'_{name}': tuple(value) for name, value
+                               in meta.get('quantization', {}).items()}
+    qmri_data.header = decode_header(meta['header'])
+    return qmri_data
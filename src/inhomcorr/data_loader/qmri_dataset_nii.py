@@ -0,0 +1,260 @@
+"""Dataset of many QMRIData subjects stored in nifti files."""
+import hashlib
+import itertools
+import json
+from collections import deque
+from collections.abc import Iterable
+from collections.abc import Iterator
+from collections.abc import Sequence
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from dataclasses import dataclass
+from pathlib import Path
+
+import torch
+from torch.utils.data import Dataset
+
+from inhomcorr.data_loader.data_loader_nii import QMRIDataLoaderNii
+from inhomcorr.data_loader.qmri_cache import load_qmri_cache
+from inhomcorr.data_loader.qmri_cache import save_qmri_cache
+from inhomcorr.mrdata import QMRIData
+
+
+@dataclass
+class QMRISubjectNii:
+    """Nifti files of a single subject.
+
+    Parameters
+    ----------
+    t1_file
+        nii file containing T1
+    rho_file
+        nii file containing m0. None (default) uses t1_file if it is 4d.
+    t1_dim
+        dimension of T1 in a 4d nii file
+    m0_dim
+        dimension of m0 in a 4d nii file
+    """
+
+    t1_file: Path
+    rho_file: Path | None = None
+    t1_dim: int = 2
+    m0_dim: int = 0
+
+
+class QMRIDatasetNii(Dataset):
+    """Map-style dataset of QMRIData subjects stored in nifti files.
+
+    Subjects are loaded on access, so the dataset can be used with several
+    workers of a torch.utils.data.DataLoader. QMRIData objects cannot be
+    collated into tensors, use collate_fn=list to obtain lists of subjects.
+    For single process pipelines, prefetch reads subjects ahead in a thread
+    pool.
+
+    If a cache_dir is given, decoded subjects are stored in a binary cache
+    (see qmri_cache) and loaded memory-mapped as long as their nifti files
+    are unchanged.
+    """
+
+    def __init__(self, subjects: Sequence[QMRISubjectNii],
+                 lazy: bool = True, cache_dir: Path | None = None,
+                 hash_content: bool = False,
+                 storage_dtype: torch.dtype | None = None) -> None:
+        """Create a dataset from a list of subjects.
+
+        Parameters
+        ----------
+        subjects
+            nifti files of each subject
+        lazy, optional
+            Load nifti files lazily, see QMRIDataLoaderNii, by default True
+        cache_dir, optional
+            Folder of the binary cache, by default None (no cache)
+        hash_content, optional
+            Validate cache entries with a content hash of the nifti files,
+            by default False
+        storage_dtype, optional
+            Store the maps of loaded subjects with reduced precision, see
+            QMRIData.to_storage, by default None (float32)
+        """
+        super().__init__()
+        self.subjects = list(subjects)
+        self.lazy = lazy
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.hash_content = hash_content
+        self.storage_dtype = storage_dtype
+
+    @classmethod
+    def from_directory(cls, folder: Path, pattern: str = '*.nii*',
+                       t1_dim: int = 2, m0_dim: int = 0,
+                       **kwargs) -> 'QMRIDatasetNii':
+        """Create a dataset with one subject per nifti file of a folder.
+
+        Parameters
+        ----------
+        folder
+            folder with nii files
+        pattern, optional
+            glob pattern of the nii files, by default '*.nii*'
+        t1_dim, optional
+            dimension of T1 in 4d nii files, by default 2
+        m0_dim, optional
+            dimension of m0 in 4d nii files, by default 0
+        kwargs
+            further arguments of QMRIDatasetNii, e.g. lazy or cache_dir
+
+        Returns
+        -------
+            Dataset with subjects sorted by file name
+        """
+        files = sorted(Path(folder).glob(pattern))
+        return cls([QMRISubjectNii(file, t1_dim=t1_dim, m0_dim=m0_dim)
+                    for file in files], **kwargs)
+
+    @classmethod
+    def from_manifest(cls, manifest: Path, **kwargs) -> 'QMRIDatasetNii':
+        """Create a dataset from a JSON manifest.
+
+        The manifest is a list of objects with the keys of QMRISubjectNii,
+        e.g. [{"t1_file": "sub1.nii.gz", "t1_dim": 2}]. Relative file names
+        are relative to the folder of the manifest.
+
+        Parameters
+        ----------
+        manifest
+            JSON file
+        kwargs
+            further arguments of QMRIDatasetNii, e.g. lazy or cache_dir
+
+        Returns
+        -------
+            Dataset with the subjects of the manifest
+        """
+        manifest = Path(manifest)
+        with open(manifest) as file:
+            entries = json.load(file)
+
+        subjects = []
+        for entry in entries:
+            entry = dict(entry)
+            for key in ('t1_file', 'rho_file'):
+                if entry.get(key) is not None:
+                    entry[key] = manifest.parent / entry[key]
+            subjects.append(QMRISubjectNii(**entry))
+        return cls(subjects, **kwargs)
+
+    def __len__(self) -> int:
+        """Get the number of subjects.
+
+        Returns
+        -------
+            Number of subjects
+        """
+        return len(self.subjects)
+
+    def __getitem__(self, index: int) -> QMRIData:
+        """Load a subject.
+
+        Parameters
+        ----------
+        index
+            Index of the subject
+
+        Returns
+        -------
+            QMRIData object
+        """
+        qmri_data = self._load_cached(self.subjects[index])
+        if self.storage_dtype is not None:
+            qmri_data = qmri_data.to_storage(self.storage_dtype)
+        return qmri_data
+
+    def _load_cached(self, subject: QMRISubjectNii) -> QMRIData:
+        """Load a subject from the binary cache or its nifti files.
+
+        Parameters
+        ----------
+        subject
+            nifti files of the subject
+
+        Returns
+        -------
+            QMRIData object
+        """
+        if self.cache_dir is None:
+            return self._load_subject(subject)
+
+        sources = [subject.t1_file]
+        if subject.rho_file is not None:
+            sources.append(subject.rho_file)
+        # Entries are named after the resolved files and dimensions
+        key = asdict(subject)
+        key.update({name: str(Path(key[name]).resolve())
+                    for name in ('t1_file', 'rho_file')
+                    if key[name] is not None})
+        entry = self.cache_dir / hashlib.sha1(
+            json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+        qmri_data = load_qmri_cache(entry, sources, self.hash_content)
+        if qmri_data is None:
+            qmri_data = self._load_subject(subject)
+            save_qmri_cache(qmri_data, entry, sources, self.hash_content)
+        return qmri_data
+
+    def _load_subject(self, subject: QMRISubjectNii) -> QMRIData:
+        """Load a subject from its nifti files.
+
+        Parameters
+        ----------
+        subject
+            nifti files of the subject
+
+        Returns
+        -------
+            QMRIData object
+        """
+        loader = QMRIDataLoaderNii(lazy=self.lazy)
+        if subject.rho_file is None or subject.rho_file == subject.t1_file:
+            loader.load_all(subject.t1_file, t1_dim=subject.t1_dim,
+                            m0_dim=subject.m0_dim)
+        else:
+            loader.load_header(subject.t1_file)
+            loader.load_t1(subject.t1_file, t1_dim=subject.t1_dim)
+            loader.load_rho(subject.rho_file, m0_dim=subject.m0_dim)
+        return loader.get_data()
+
+    def prefetch(self, indices: Iterable[int] | None = None,
+                 num_threads: int = 4,
+                 read_ahead: int = 8) -> Iterator[QMRIData]:
+        """Iterate over subjects which are loaded ahead in a thread pool.
+
+        Parameters
+        ----------
+        indices, optional
+            Indices of the subjects, by default all subjects in order
+        num_threads, optional
+            Number of threads reading files, by default 4
+        read_ahead, optional
+            Maximal number of subjects loaded ahead, by default 8
+
+        Returns
+        -------
+            Iterator of QMRIData objects in the order of indices
+        """
+        if indices is None:
+            indices = range(len(self))
+        index_iter = iter(indices)
+        pending: deque[Future] = deque()
+        pool = ThreadPoolExecutor(max_workers=num_threads)
+        try:
+            for index in itertools.islice(index_iter, max(1, read_ahead)):
+                pending.append(pool.submit(self.__getitem__, index))
+            while pending:
+                qmri_data = pending.popleft().result()
+                for index in itertools.islice(index_iter, 1):
+                    pending.append(pool.submit(self.__getitem__, index))
+                yield qmri_data
+        finally:
+            # Do not wait for subjects which are not needed anymore
+            pool.shutdown(wait=False, cancel_futures=True)
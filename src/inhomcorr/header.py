@@ -0,0 +1,66 @@
+"""JSON serialization of the headers of MRData objects.
+
+Headers hold e.g. numpy arrays and bytes of NIfTI headers and tuples of
+spacing and origin. encode_header converts them into JSON serializable
+objects, decode_header restores the original types:
+
+    text = json.dumps(encode_header(image.header))
+    header = decode_header(json.loads(text))
+"""
+from typing import Any
+
+import numpy as np
+
+
+def encode_header(value: Any) -> Any:
+    """Convert header values into JSON serializable objects.
+
+    Parameters
+    ----------
+    value
+        Header value, e.g. numpy arrays of a nifti header
+
+    Returns
+    -------
+        JSON serializable object
+    """
+    if isinstance(value, dict):
+        return {str(key): encode_header(val) for key, val in value.items()}
+    if isinstance(value, tuple):
+        return {'__tuple__': [encode_header(val) for val in value]}
+    if isinstance(value, list):
+        return [encode_header(val) for val in value]
+    if isinstance(value, np.ndarray):
+        return {'__ndarray__': encode_header(value.tolist()),
+                'dtype': value.dtype.str}
+    if isinstance(value, bytes):
+        return {'__bytes__': value.hex()}
+    if isinstance(value, np.generic):
+        return encode_header(value.item())
+    return value
+
+
+def decode_header(value: Any) -> Any:
+    """Invert encode_header.
+
+    Parameters
+    ----------
+    value
+        Object loaded from JSON
+
+    Returns
+    -------
+        Header value
+    """
+    if isinstance(value, dict):
+        if '__ndarray__' in value:
+            return np.array(decode_header(value['__ndarray__']),
+                            dtype=np.dtype(value['dtype']))
+        if '__bytes__' in value:
+            return bytes.fromhex(value['__bytes__'])
+        if '__tuple__' in value:
+            return tuple(decode_header(val) for val in value['__tuple__'])
+        return {key: decode_header(val) for key, val in value.items()}
+    if isinstance(value, list):
+        return [decode_header(val) for val in value]
+    return value
@@ -0,0 +1,316 @@
+"""Opt-in timing and memory instrumentation of the pipeline stages.
+
+Functions decorated with instrument are recorded while a Recorder is active:
+
+    with Recorder() as recorder:
+        image = MRSigFlash()(qmri, param)
+    recorder.to_chrome_trace('trace.json')
+
+Each call records wall time, the shapes and bytes of tensor and MRData
+inputs and outputs and, on CUDA, the peak allocated memory. Calls are also
+marked with torch.profiler.record_function ranges, so they show up in traces
+of torch.profiler. Without an active Recorder or profiler, the decorator
+only adds a single check per call.
+"""
+from __future__ import annotations
+
+import functools
+import json
+import os
+import threading
+import time
+from collections.abc import Callable
+from collections.abc import Iterable
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+from dataclasses import replace
+from pathlib import Path
+from typing import Any
+from typing import TypeVar
+
+import torch
+
+from inhomcorr.mrdata import MRData
+
+TFunc = TypeVar('TFunc', bound=Callable[..., Any])
+
+# Active recorders, checked by every instrumented call
+_RECORDERS: list[Recorder] = []
+_LOCK = threading.Lock()
+# Stack of open calls per thread, used for nested CUDA peaks
+_LOCAL = threading.local()
+
+
+@dataclass
+class CallRecord:
+    """Measurements of a single instrumented call.
+
+    Parameters
+    ----------
+    name
+        Name of the instrumented function
+    start_s
+        Start time in s relative to the start of the recorder
+    duration_s
+        Wall time in s
+    thread_id
+        Identifier of the calling thread
+    input_shapes
+        Shapes of tensor and MRData arguments
+    output_shapes
+        Shapes of tensor and MRData results
+    bytes_in
+        Bytes of tensor and MRData arguments
+    bytes_out
+        Bytes of tensor and MRData results
+    peak_memory_bytes
+        Peak increase of allocated CUDA memory, None on the cpu
+    """
+
+    name: str
+    start_s: float
+    duration_s: float
+    thread_id: int
+    input_shapes: list[tuple[int, ...]] = field(default_factory=list)
+    output_shapes: list[tuple[int, ...]] = field(default_factory=list)
+    bytes_in: int = 0
+    bytes_out: int = 0
+    peak_memory_bytes: int | None = None
+
+
+def _describe(values: Iterable[Any]) -> tuple[list[tuple[int, ...]], int]:
+    """Get shapes and bytes of tensors and MRData objects.
+
+    Parameters
+    ----------
+    values
+        Arguments or results, lists and tuples are searched one level deep
+
+    Returns
+    -------
+        Shapes and total number of bytes
+    """
+    shapes = []
+    nbytes = 0
+    for value in values:
+        items = value if isinstance(value, (list, tuple)) else (value,)
+        for item in items:
+            if isinstance(item, torch.Tensor):
+                shapes.append(tuple(item.shape))
+                nbytes += item.numel() * item.element_size()
+            elif isinstance(item, MRData):
+                shapes.append(tuple(item.shape))
+                nbytes += item.nbytes
+    return shapes, nbytes
+
+
+class Recorder:
+    """Context manager recording all instrumented calls.
+
+    Recorders can be nested, each active recorder gets all calls. Records
+    are passed to the callbacks as soon as a call finishes.
+    """
+
+    def __init__(self,
+                 callbacks: Iterable[Callable[[CallRecord], None]] = (),
+                 ) -> None:
+        """Create a recorder.
+
+        Parameters
+        ----------
+        callbacks, optional
+            Functions called with each CallRecord, by default none
+        """
+        self.callbacks = list(callbacks)
+        self.records: list[CallRecord] = []
+        self._start = time.perf_counter()
+
+    def __enter__(self) -> Recorder:
+        """Start recording.
+
+        Returns
+        -------
+            The recorder
+        """
+        self._start = time.perf_counter()
+        with _LOCK:
+            _RECORDERS.append(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Stop recording."""
+        with _LOCK:
+            _RECORDERS.remove(self)
+
+    def _add(self, record: CallRecord, start: float) -> None:
+        """Add a record of a finished call.
+
+        Parameters
+        ----------
+        record
+            Record with start time relative to perf_counter
+        start
+            Start time of the call from perf_counter
+        """
+        record = replace(record, start_s=start - self._start)
+        with _LOCK:
+            self.records.append(record)
+        for callback in self.callbacks:
+            callback(record)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """Summarize the records by function name.
+
+        Returns
+        -------
+            Number of calls, total and mean wall time in s and total bytes
+            for each function
+        """
+        summary: dict[str, dict[str, float]] = {}
+        for record in self.records:
+            entry = summary.setdefault(record.name, {
+                'calls': 0, 'total_s': 0., 'bytes_in': 0, 'bytes_out': 0})
+            entry['calls'] += 1
+            entry['total_s'] += record.duration_s
+            entry['bytes_in'] += record.bytes_in
+            entry['bytes_out'] += record.bytes_out
+        for entry in summary.values():
+            entry['mean_s'] = entry['total_s'] / entry['calls']
+        return summary
+
+    def to_json(self, file: Path | str) -> None:
+        """Write all records and their summary as JSON.
+
+        Parameters
+        ----------
+        file
+            Output file
+        """
+        with open(file, 'w') as fid:
+            json.dump({'records': [asdict(r) for r in self.records],
+                       'summary': self.summary()}, fid, indent=2)
+
+    def to_chrome_trace(self, file: Path | str) -> None:
+        """Write the records in the Chrome trace event format.
+
+        The file can be opened in chrome://tracing or Perfetto.
+
+        Parameters
+        ----------
+        file
+            Output file
+        """
+        pid = os.getpid()
+        events = [{'name': r.name, 'ph': 'X', 'pid': pid,
+                   'tid': r.thread_id, 'ts': r.start_s * 1e6,
+                   'dur': r.duration_s * 1e6,
+                   'args': {'input_shapes': r.input_shapes,
+                            'output_shapes': r.output_shapes,
+                            'bytes_in': r.bytes_in,
+                            'bytes_out': r.bytes_out,
+                            'peak_memory_bytes': r.peak_memory_bytes}}
+                  for r in self.records]
+        with open(file, 'w') as fid:
+            json.dump({'traceEvents': events,
+                       'displayTimeUnit': 'ms'}, fid)
+
+
+def _cuda_peak_enabled() -> bool:
+    """Check if the peak of allocated CUDA memory can be measured.
+
+    Returns
+    -------
+        True if CUDA is initialized
+    """
+    return torch.cuda.is_available() and torch.cuda.is_initialized()
+
+
+def _record_call(name: str, func: Callable[..., Any], args: tuple,
+                 kwargs: dict) -> Any:
+    """Call a function and record it in all active recorders.
+
+    Parameters
+    ----------
+    name
+        Name of the record
+    func
+        Instrumented function
+    args
+        Positional arguments
+    kwargs
+        Keyword arguments
+
+    Returns
+    -------
+        Result of the function
+    """
+    recorders = list(_RECORDERS)
+    measure_cuda = bool(recorders) and _cuda_peak_enabled()
+    stack = _LOCAL.__dict__.setdefault('stack', [])
+    if measure_cuda:
+        # Nested calls reset the peak, so peaks are passed to the caller
+        if stack:
+            stack[-1] = max(stack[-1], torch.cuda.max_memory_allocated())
+        start_allocated = torch.cuda.memory_allocated()
+        torch.cuda.reset_peak_memory_stats()
+    stack.append(0)
+
+    start = time.perf_counter()
+    try:
+        with torch.profiler.record_function(name):
+            result = func(*args, **kwargs)
+    finally:
+        child_peak = stack.pop()
+    duration = time.perf_counter() - start
+    if not recorders:
+        return result
+
+    peak = None
+    if measure_cuda:
+        absolute_peak = max(torch.cuda.max_memory_allocated(), child_peak)
+        peak = absolute_peak - start_allocated
+        if stack:
+            stack[-1] = max(stack[-1], absolute_peak)
+    input_shapes, bytes_in = _describe((*args, *kwargs.values()))
+    output_shapes, bytes_out = _describe((result,))
+    record = CallRecord(name=name, start_s=0., duration_s=duration,
+                        thread_id=threading.get_ident(),
+                        input_shapes=input_shapes,
+                        output_shapes=output_shapes, bytes_in=bytes_in,
+                        bytes_out=bytes_out, peak_memory_bytes=peak)
+    for recorder in recorders:
+        recorder._add(record, start)
+    return result
+
+
+def instrument(func: TFunc | None = None, *,
+               name: str | None = None) -> TFunc | Callable[[TFunc], TFunc]:
+    """Decorate a function to be recorded by active recorders.
+
+    Can be used as @instrument or @instrument(name='stage').
+
+    Parameters
+    ----------
+    func, optional
+        Function to instrument
+    name, optional
+        Name of the records, by default the qualified name of func
+
+    Returns
+    -------
+        Instrumented function or decorator
+    """
+    def decorator(func: TFunc) -> TFunc:
+        record_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _RECORDERS and not torch.autograd._profiler_enabled():
+                return func(*args, **kwargs)
+            return _record_call(record_name, func, args, kwargs)
+        return wrapper  # type: ignore[return-value]
+
+    if func is not None:
+        return decorator(func)
+    return decorator
@@ -1,9 +1,12 @@
 """Flash T1 Simulation."""
 
+import math
+from collections.abc import Sequence
 from dataclasses import dataclass
 
 import torch
 
+from inhomcorr.instrumentation import instrument
 from inhomcorr.mrdata import ImageData
 from inhomcorr.mrdata import QMRIData
 from inhomcorr.mrsig.mrsig_interface import MRParam
@@ -25,14 +28,52 @@ class MRParamGRE(MRParam):
     alpha: float = 0.0  # in radian
 
 
+def _flash_signal(t1: torch.Tensor, rho: torch.Tensor,
+                  tr: torch.Tensor | float, sin_alpha: torch.Tensor | float,
+                  cos_alpha: torch.Tensor | float) -> torch.Tensor:
+    """GRE steady state signal equation.
+
+    Parameters
+    ----------
+    t1
+        T1 map
+    rho
+        rho map
+    tr
+        Repetition time, broadcastable with the maps
+    sin_alpha
+        Sine of the flip angle, broadcastable with the maps
+    cos_alpha
+        Cosine of the flip angle, broadcastable with the maps
+
+    Returns
+    -------
+        Signal
+    """
+    e1 = torch.exp(-tr / t1)
+    return rho * (1 - e1) * sin_alpha / (1 - cos_alpha * e1)
+
+
 class MRSigFlash(MRSig):
     """Flash MR Sig Interface."""
 
-    def __init__(self, with_t2s: bool = False) -> None:
-        """Init."""
+    def __init__(self, with_t2s: bool = False, compile: bool = False) -> None:
+        """Init.
+
+        Parameters
+        ----------
+        with_t2s, optional
+            Include T2* decay, not supported yet, by default False
+        compile, optional
+            Fuse the signal equation with torch.compile, by default False
+        """
         super().__init__()
         self.with_t2s = with_t2s  # False: GRE signal without T2 star
+        self._signal = _flash_signal
+        if compile:
+            self._signal = torch.compile(_flash_signal, dynamic=True)
 
+    @instrument
     def __call__(self, qmap: QMRIData, param: MRParamGRE) -> ImageData:
         """__call__ _summary_.
 
@@ -51,16 +92,74 @@ class MRSigFlash(MRSig):
         if qmap.t1 is None:
             raise AttributeError('T1 map not defined')
 
-        e1 = torch.exp(-param.tr / qmap.t1)
-        greimage = qmap.rho * (1-e1) * torch.sin(torch.tensor(param.alpha)) / \
-            (1 - torch.cos(torch.tensor(param.alpha)) * e1)
+        # Maps stored with reduced precision are computed in float32
+        qmap = qmap.upcast()
+        # Python scalars avoid creating tensors on the cpu
+        greimage = self._signal(qmap.t1, qmap.rho, param.tr,
+                                math.sin(param.alpha), math.cos(param.alpha))
 
         if self.with_t2s:
             pass
             # qmridata needs attribute t2s
             # greimage = greimage * math.exp(param.te / qmap.t2s)
 
-        # save the GRE image in ImageData and return it
-        gre_id = ImageData(torch.Tensor(greimage))
+        # save the GRE image with a channel dimension in ImageData, so
+        # batched maps (b, z, y, x) result in images (b, 1, z, y, x)
+        gre_id = ImageData(greimage.unsqueeze(-4))
 
         return gre_id
+
+    @instrument
+    def signal(self, qmap: QMRIData, tr: torch.Tensor | Sequence[float],
+               alpha: torch.Tensor | Sequence[float]) -> torch.Tensor:
+        """Calculate the signal for many parameters at once.
+
+        Parameters
+        ----------
+        qmap
+            Quantitative maps with shape (z, y, x) or (b, z, y, x)
+        tr
+            P repetition times in s
+        alpha
+            P flip angles in radian
+
+        Returns
+        -------
+            Signal with shape (P, z, y, x) or (P, b, z, y, x) on the device
+            of qmap. Maps stored with reduced precision result in float32.
+
+        Raises
+        ------
+        ValueError
+            If tr and alpha are not 1D or differ in length
+        """
+        qmap = qmap.upcast()
+        t1 = qmap.t1
+        tr = torch.as_tensor(tr, device=qmap.device)
+        alpha = torch.as_tensor(alpha, device=qmap.device)
+        if tr.shape != alpha.shape or tr.ndim != 1:
+            raise ValueError('tr and alpha have to be 1D with equal length. '
+                             f'Got {tuple(tr.shape)} and {tuple(alpha.shape)}')
+        # Broadcast the parameters along a new leading dimension
+        tr, alpha = (p.reshape(-1, *([1] * t1.ndim)) for p in (tr, alpha))
+        return self._signal(t1, qmap.rho, tr.to(t1.dtype),
+                            torch.sin(alpha).to(t1.dtype),
+                            torch.cos(alpha).to(t1.dtype))
+
+    def batch(self, qmap: QMRIData,
+              params: Sequence[MRParamGRE]) -> torch.Tensor:
+        """Calculate the signal for a list of parameters at once.
+
+        Parameters
+        ----------
+        qmap
+            Quantitative maps with shape (z, y, x)
+        params
+            P sets of GRE parameters
+
+        Returns
+        -------
+            Signal with shape (P, z, y, x) on the device of qmap
+        """
+        return self.signal(qmap, [param.tr for param in params],
+                           [param.alpha for param in params])
@@ -0,0 +1,211 @@
+"""Conversion between ImageData and SimpleITK images.
+
+SimpleITK always owns the pixel buffer of its images, so one copy is needed
+in each direction. All other steps use views: torch tensors are viewed as
+numpy arrays and SimpleITK images are read via GetArrayViewFromImage.
+
+Spacing and origin are taken from the header of the ImageData. They are
+stored as tuples in (x, y, z) order under the keys 'spacing' and 'origin'.
+If these keys are missing, the NIfTI header fields 'pixdim' and
+'qoffset_x/y/z' are used.
+"""
+from collections.abc import Callable
+
+import numpy as np
+import SimpleITK as sitk
+import torch
+
+from inhomcorr.mrdata import ImageData
+
+
+def _geometry_from_header(header: dict) -> tuple[tuple[float, ...],
+                                                 tuple[float, ...]]:
+    """Get spacing and origin in (x, y, z) order from a header.
+
+    Parameters
+    ----------
+    header
+        Header dictionary of an ImageData object
+
+    Returns
+    -------
+        Spacing and origin, default to (1, 1, 1) and (0, 0, 0)
+    """
+    if 'spacing' in header:
+        spacing = tuple(float(s) for s in header['spacing'])
+    elif 'pixdim' in header:
+        spacing = tuple(float(s) for s in np.ravel(header['pixdim'])[1:4])
+    else:
+        spacing = (1., 1., 1.)
+
+    if 'origin' in header:
+        origin = tuple(float(o) for o in header['origin'])
+    elif all(f'qoffset_{ax}' in header for ax in 'xyz'):
+        origin = tuple(float(header[f'qoffset_{ax}']) for ax in 'xyz')
+    else:
+        origin = (0., 0., 0.)
+
+    return spacing, origin
+
+
+def _kept_axes(shape: tuple) -> list[int]:
+    """Get axes of a (c, z, y, x) shape which are kept by squeezing.
+
+    Parameters
+    ----------
+    shape
+        Shape of the ImageData
+
+    Returns
+    -------
+        Indices of all axes with more than one entry
+
+    Raises
+    ------
+    ValueError
+        If there is more than one channel
+    """
+    if shape[0] > 1:
+        raise ValueError('Only single channel images can be converted to '
+                         f'sitk.Image. Got shape {shape}.')
+    return [axis for axis, size in enumerate(shape) if size > 1]
+
+
+def _sitk_geometry(header: dict, shape: tuple) -> tuple[list[float],
+                                                        list[float]]:
+    """Get spacing and origin for the sitk.Image of a squeezed ImageData.
+
+    Entry i of spacing and origin belongs to axis 3 - i of (c, z, y, x).
+
+    Parameters
+    ----------
+    header
+        Header dictionary of an ImageData object
+    shape
+        Shape of the ImageData
+
+    Returns
+    -------
+        Spacing and origin of the squeezed image in sitk (x, y, z) order
+    """
+    spacing, origin = _geometry_from_header(header)
+    spacing_sitk, origin_sitk = [], []
+    for axis in reversed(_kept_axes(shape)):
+        index = 3 - axis
+        spacing_sitk.append(spacing[index] if index < len(spacing) else 1.)
+        origin_sitk.append(origin[index] if index < len(origin) else 0.)
+    return spacing_sitk, origin_sitk
+
+
+def image_to_sitk(image: ImageData) -> sitk.Image:
+    """Convert an ImageData object into a sitk.Image.
+
+    Singleton dimensions are removed. The data is copied once into the
+    buffer of the sitk.Image.
+
+    Parameters
+    ----------
+    image
+        ImageData object with a single channel
+
+    Returns
+    -------
+        sitk.Image with spacing and origin of the image header
+    """
+    data = image.data.detach()
+    if data.dtype not in (torch.float32, torch.float64):
+        data = data.float()
+    # View of the tensor, copies only if the tensor is not on the cpu
+    array = data.cpu().numpy()
+    # Broadcasted data has zero strides and has to be materialized
+    array = np.ascontiguousarray(np.squeeze(array))
+
+    sitk_img = sitk.GetImageFromArray(array)
+    spacing, origin = _sitk_geometry(image.header, image.shape)
+    sitk_img.SetSpacing(spacing)
+    sitk_img.SetOrigin(origin)
+    return sitk_img
+
+
+def mask_to_sitk(image: ImageData, reference: sitk.Image) -> sitk.Image:
+    """Convert the mask of an ImageData object into a sitk.Image.
+
+    Parameters
+    ----------
+    image
+        ImageData object with mask
+    reference
+        sitk.Image of the image data as returned by image_to_sitk
+
+    Returns
+    -------
+        sitk.Image of type uint8 with 1 inside and 0 outside of the mask
+
+    Raises
+    ------
+    ValueError
+        If the image has no mask
+    """
+    if image.mask is None:
+        raise ValueError('ImageData has no mask.')
+    mask = torch.broadcast_to(image.mask.detach() != 0, image.shape)
+    array = mask.cpu().numpy().astype(np.uint8)
+    sitk_img = sitk.GetImageFromArray(
+        array.reshape(reference.GetSize()[::-1]))
+    sitk_img.CopyInformation(reference)
+    return sitk_img
+
+
+def sitk_to_image(sitk_img: sitk.Image, header: dict | None = None,
+                  transform: Callable[[np.ndarray], np.ndarray] | None = None,
+                  shape: tuple | None = None) -> ImageData:
+    """Convert a sitk.Image into an ImageData object.
+
+    The pixel buffer of the sitk.Image is read through a view, so the only
+    copy is made by transform or, if no transform is given, when copying
+    the view into the new tensor.
+
+    Parameters
+    ----------
+    sitk_img
+        2D or 3D sitk.Image
+    header, optional
+        Header of the new ImageData object. Spacing and origin are updated
+        with the values of the sitk.Image.
+    transform, optional
+        Function applied to the array view, has to return a new array,
+        e.g. np.exp
+    shape, optional
+        (c, z, y, x) shape of the ImageData converted by image_to_sitk.
+        The singleton axes removed by image_to_sitk are restored at their
+        positions. By default leading singleton axes are added.
+
+    Returns
+    -------
+        ImageData object with shape or (1, z, y, x) shape
+    """
+    view = sitk.GetArrayViewFromImage(sitk_img)
+    array = np.array(view) if transform is None else transform(view)
+    data = torch.from_numpy(array)
+    # Axes of the ImageData belonging to the (x, y, z) axes of sitk_img
+    if shape is None:
+        while data.ndim < 4:
+            data = data.unsqueeze(0)
+        axes = [3, 2, 1][:sitk_img.GetDimension()]
+    else:
+        data = data.reshape(shape)
+        axes = _kept_axes(shape)[::-1]
+
+    header = dict(header) if header is not None else {}
+    spacing, origin = _geometry_from_header(header)
+    spacing, origin = list(spacing), list(origin)
+    # Only overwrite the axes present in the sitk.Image
+    for index, axis in enumerate(axes):
+        spacing[3 - axis] = sitk_img.GetSpacing()[index]
+        origin[3 - axis] = sitk_img.GetOrigin()[index]
+    header['spacing'] = tuple(spacing)
+    header['origin'] = tuple(origin)
+
+    image = ImageData(data)
+    image.header = header
+    return image
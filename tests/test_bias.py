@@ -1,6 +1,18 @@
 """Tests of bias field operation."""
+import itertools
 import unittest
 
+import numpy as np
+import torch
+import torchio as tio
+from torch.utils.data import DataLoader
+
+from inhomcorr.bias_creator.bias_creator_interface import BiasCreator
+from inhomcorr.bias_creator.bias_field_dataset import BiasFieldDataset
+from inhomcorr.bias_creator.bias_field_dataset import seed_from_sequence
+from inhomcorr.bias_creator.polynomial_basis import PolynomialBasisCache
+from inhomcorr.bias_creator.polynomial_basis import number_of_terms
+from inhomcorr.bias_creator.polynomial_basis import polynomial_basis
 from inhomcorr.bias_creator.torchio_bias import BiasCreatorTorchio
 from inhomcorr.mrdata import ImageData
 from tests.testdata import TestData
@@ -30,3 +42,179 @@ class TestBiasCreationTorchio(unittest.TestCase):
         # Test length and dtype
         self.assertEqual(len(bf_list), 6)
         self.assertIsInstance(bf_list[3], ImageData)
+
+    def test_bias_field_tensor_torchio(self):
+
+        bf_creator = BiasCreatorTorchio()
+        bf = bf_creator.get_bias_field_tensor(self.image, number=5)
+
+        self.assertEqual((5, *self.shape[1:]), tuple(bf.shape))
+        self.assertEqual(bf.device, self.image.device)
+        # Fields differ from each other
+        self.assertFalse(torch.allclose(bf[0], bf[1]))
+
+    def test_bias_field_batched(self):
+
+        bf_creator = BiasCreatorTorchio(seed=3)
+        batch = ImageData.stack([self.image] * 3)
+        bf = bf_creator.get_bias_field(batch)
+
+        self.assertEqual((3, *self.shape), tuple(bf.shape))
+        self.assertFalse(torch.allclose(bf.data[0], bf.data[1]))
+        # Same fields as created for the unbatched image
+        bf_creator.manual_seed(3)
+        torch.testing.assert_close(
+            bf.data[:, 0], bf_creator.get_bias_field_tensor(self.image, 3))
+
+    def test_bias_field_matches_torchio(self):
+
+        shape = (1, 5, 8, 7)
+        image = TestData(img_shape=shape).get_random_image()
+        bf_creator = BiasCreatorTorchio(order=3)
+        coefficients = torch.empty((1, 20)).uniform_(-0.2, 0.2)
+
+        bf = bf_creator.bias_fields_from_coefficients(
+            coefficients, shape[1:])
+        bf_tio = tio.BiasField.generate_bias_field(
+            data=image.data, order=3, coefficients=coefficients[0].tolist())
+
+        torch.testing.assert_close(bf[0], torch.as_tensor(bf_tio))
+
+
+class TestPolynomialBasis(unittest.TestCase):
+
+    def test_basis_shape(self):
+        for order in range(5):
+            basis = polynomial_basis((3, 4, 5), order)
+            self.assertEqual(basis.shape, (number_of_terms(order), 3, 4, 5))
+
+    def test_basis_range(self):
+        basis = polynomial_basis((1, 4, 5), order=2)
+        # Constant term and normalization of the grid to [-1, 1]
+        torch.testing.assert_close(basis[0], torch.ones((1, 4, 5)))
+        self.assertEqual(float(basis.abs().max()), 1.)
+
+    def test_basis_shape_exception(self):
+        with self.assertRaises(ValueError):
+            polynomial_basis((4, 5), order=2)
+
+
+class TestPolynomialBasisCache(unittest.TestCase):
+
+    def test_hits_and_misses(self):
+        cache = PolynomialBasisCache()
+        basis = cache.get((2, 3, 4), order=2)
+        self.assertIs(cache.get((2, 3, 4), order=2), basis)
+        cache.get((2, 3, 4), order=2, dtype=torch.float64)
+        cache.get((2, 3, 5), order=2)
+
+        info = cache.info()
+        self.assertEqual((info.hits, info.misses, info.entries), (1, 3, 3))
+        torch.testing.assert_close(basis, polynomial_basis((2, 3, 4), 2))
+
+    def test_memory_cap(self):
+        # Each basis needs 10 * 2 * 3 * 4 * 4 bytes
+        cache = PolynomialBasisCache(max_bytes=2 * 960)
+        cache.get((2, 3, 4), order=2)
+        cache.get((2, 4, 3), order=2)
+        cache.get((2, 3, 4), order=2)
+        cache.get((4, 3, 2), order=2)
+
+        # The least recently used basis (2, 4, 3) was removed
+        info = cache.info()
+        self.assertEqual((info.entries, info.nbytes), (2, 2 * 960))
+        cache.get((2, 4, 3), order=2)
+        self.assertEqual(cache.info().misses, 4)
+
+        # Bases larger than the cache are not stored
+        cache.get((20, 30, 40), order=2)
+        self.assertEqual(cache.info().nbytes, 2 * 960)
+
+    def test_bias_creator_cache(self):
+        shape = (1, 2, 8, 8)
+        image = TestData(img_shape=shape).get_random_image()
+        bf_creator = BiasCreatorTorchio()
+        bf_creator.get_random_bias_fields(image, number=3)
+        bf_creator.get_bias_field(image)
+        bf_creator.get_bias_field(image)
+        info = bf_creator.cache_info()
+        self.assertEqual((info.hits, info.misses), (2, 1))
+
+
+class TestBiasFieldStreams(unittest.TestCase):
+
+    def setUp(self):
+        self.shape = (1, 1, 8, 6)
+        self.image = TestData(img_shape=self.shape).get_random_image()
+
+    def test_seeded_bias_creator(self):
+        bf_a = BiasCreatorTorchio(seed=3).get_bias_field_tensor(self.image, 4)
+        bf_b = BiasCreatorTorchio(seed=3).get_bias_field_tensor(self.image, 4)
+        torch.testing.assert_close(bf_a, bf_b)
+
+        generator = torch.Generator().manual_seed(3)
+        bf_c = BiasCreatorTorchio(generator=generator).get_bias_field_tensor(
+            self.image, 4)
+        torch.testing.assert_close(bf_a, bf_c)
+
+        with self.assertRaises(ValueError):
+            BiasCreatorTorchio(seed=3, generator=generator)
+
+    def test_stream(self):
+        bf_creator = BiasCreatorTorchio(seed=1)
+        stream = bf_creator.stream(self.image)
+        bfs = [next(stream) for _ in range(3)]
+        self.assertIsInstance(bfs[2], ImageData)
+        self.assertEqual(bfs[2].shape, self.shape)
+
+    def test_dataset_reproducible(self):
+        dataset = BiasFieldDataset(BiasCreatorTorchio(), self.image, seed=5,
+                                   chunk_size=2)
+        first = list(itertools.islice(dataset, 3))
+        second = list(itertools.islice(dataset, 3))
+        torch.testing.assert_close(first, second)
+        self.assertEqual(first[0].shape, self.shape)
+
+        dataset.set_epoch(1)
+        third = list(itertools.islice(dataset, 3))
+        self.assertFalse(torch.allclose(first[0], third[0]))
+
+    def test_dataset_workers(self):
+        dataset = BiasFieldDataset(BiasCreatorTorchio(), self.image, seed=5,
+                                   chunk_size=2)
+        loader = DataLoader(dataset, batch_size=2, num_workers=2)
+        batches = list(itertools.islice(loader, 4))
+        self.assertEqual(batches[0].shape, (2, *self.shape))
+
+        # Batches alternate between the workers, which must not repeat
+        fields = torch.cat(batches).flatten(1)
+        self.assertEqual(len(torch.unique(fields, dim=0)), 8)
+
+        # Each worker reproduces its own sub-stream
+        seeds = np.random.SeedSequence([5, 0]).spawn(2)
+        worker_0 = BiasCreatorTorchio(seed=seed_from_sequence(seeds[0]))
+        torch.testing.assert_close(
+            batches[0], worker_0.get_bias_field_tensor(self.image, 2)[:, None])
+
+    def test_manual_seed_abstract(self):
+        class Creator(BiasCreator):
+            def __init__(self):
+                pass
+
+            def get_bias_field(self, image):
+                return image
+
+            def get_random_bias_fields(self, image, number):
+                return [image] * number
+
+        # Creators without seeding cannot be created
+        with self.assertRaises(TypeError):
+            Creator()
+
+        class SeededCreator(Creator):
+            def manual_seed(self, seed):
+                pass
+
+        # Default implementation of get_bias_field_tensor
+        bf = SeededCreator().get_bias_field_tensor(self.image, 3)
+        self.assertEqual(bf.shape, (3, *self.shape[1:]))
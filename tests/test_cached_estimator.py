@@ -0,0 +1,184 @@
+"""Tests of the cache of bias field estimates."""
+import tempfile
+import time
+import unittest
+from dataclasses import dataclass
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import torch
+
+from inhomcorr.bias_estimator import CachedEstimator
+from inhomcorr.bias_estimator import N4Estimator
+from inhomcorr.bias_estimator import N4Hyperparameters
+from inhomcorr.bias_estimator.bias_estimator_interface import BiasEstimator
+from inhomcorr.bias_estimator.bias_estimator_interface import HyperParameters
+from inhomcorr.bias_estimator.cached_estimator import DiskResultCache
+from inhomcorr.bias_estimator.cached_estimator import MemoryResultCache
+from inhomcorr.mrdata import ImageData
+from tests.testdata import TestData
+
+
+@dataclass
+class ScaleHyperparameters(HyperParameters):
+    scale: float = 2.
+
+
+class CountingEstimator(BiasEstimator):
+    """Estimator returning a constant bias field and counting its calls."""
+
+    def __init__(self, hparams: ScaleHyperparameters | None = None) -> None:
+        self.hparams = hparams or ScaleHyperparameters()
+        self.calls = 0
+
+    def __call__(self, image: ImageData) -> ImageData:
+        self.calls += 1
+        biasfield = ImageData(torch.full(image.shape, self.hparams.scale))
+        biasfield.header = {**image.header, 'spacing': (2., 3., 4.)}
+        return biasfield
+
+
+class TestCachedEstimator(unittest.TestCase):
+    def setUp(self):
+        self.TestData = TestData(img_shape=(1, 2, 8, 8))
+        self.image = self.TestData.get_random_image()
+
+    def test_memory_cache(self):
+        estimator = CountingEstimator()
+        cached = CachedEstimator(estimator)
+
+        bf = cached(self.image)
+        bf_cached = cached(self.image)
+        self.assertEqual(estimator.calls, 1)
+        torch.testing.assert_close(bf_cached.data, bf.data)
+        self.assertEqual(cached.cache.info().hits, 1)
+        self.assertEqual(cached.cache.info().misses, 1)
+
+        # Modifying the returned bias field does not change the cache
+        bf_cached.data.mul_(0)
+        torch.testing.assert_close(cached(self.image).data, bf.data)
+
+    def test_key(self):
+        cached = CachedEstimator(CountingEstimator())
+        key = cached.key(self.image)
+
+        # Equal content gives equal keys
+        self.assertEqual(cached.key(ImageData(self.image.data.clone())), key)
+
+        # Data, mask, header, hyperparameters and namespace change the key
+        image = ImageData(self.image.data.clone())
+        image.header = {'spacing': (1., 1., 2.)}
+        self.assertNotEqual(cached.key(image), key)
+        image = ImageData(self.image.data.clone())
+        image.data[0, 0, 0, 0] += 1
+        self.assertNotEqual(cached.key(image), key)
+        image = ImageData(self.image.data.clone())
+        image.mask = torch.ones(image.shape, dtype=torch.bool)
+        self.assertNotEqual(cached.key(image), key)
+        cached_hparams = CachedEstimator(CountingEstimator(
+            ScaleHyperparameters(scale=3.)))
+        self.assertNotEqual(cached_hparams.key(self.image), key)
+        cached_namespace = CachedEstimator(CountingEstimator(),
+                                           namespace='weights-v2')
+        self.assertNotEqual(cached_namespace.key(self.image), key)
+
+    def test_header(self):
+        self.image.header = {'pixdim': np.array([1., 2., 3., 4.])}
+        with tempfile.TemporaryDirectory() as folder:
+            for cache in (MemoryResultCache(), DiskResultCache(folder)):
+                cached = CachedEstimator(CountingEstimator(), cache)
+                bf = cached(self.image)
+                bf_cached = cached(self.image)
+
+                # Hits keep the header set by the estimator
+                self.assertEqual(cache.info().hits, 1)
+                self.assertEqual(bf_cached.header.keys(), bf.header.keys())
+                self.assertEqual(bf_cached.header['spacing'], (2., 3., 4.))
+                np.testing.assert_array_equal(bf_cached.header['pixdim'],
+                                              bf.header['pixdim'])
+
+    def test_memory_eviction(self):
+        # Room for two bias fields
+        nbytes = self.image.data.element_size() * self.image.data.nelement()
+        cache = MemoryResultCache(max_bytes=2 * nbytes)
+        estimator = CountingEstimator()
+        cached = CachedEstimator(estimator, cache)
+        images = [self.TestData.get_random_image() for _ in range(3)]
+
+        cached(images[0])
+        cached(images[1])
+        cached(images[0])
+        cached(images[2])
+        self.assertEqual(cache.info().entries, 2)
+        self.assertLessEqual(cache.info().nbytes, 2 * nbytes)
+        # images[1] was least recently used
+        cached(images[0])
+        self.assertEqual(estimator.calls, 3)
+        cached(images[1])
+        self.assertEqual(estimator.calls, 4)
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            estimator = CountingEstimator()
+            bf = CachedEstimator(estimator, DiskResultCache(folder))(
+                self.image)
+
+            # A new cache on the same folder is served from disk
+            cache = DiskResultCache(folder)
+            bf_cached = CachedEstimator(estimator, cache)(self.image)
+            self.assertEqual(estimator.calls, 1)
+            torch.testing.assert_close(bf_cached.data, bf.data)
+            self.assertEqual(cache.info().hits, 1)
+            self.assertEqual(cache.info().entries, 1)
+
+            cache.clear()
+            self.assertEqual(list(Path(folder).iterdir()), [])
+
+    def test_disk_version(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = DiskResultCache(folder)
+            key = CachedEstimator(CountingEstimator()).key(self.image)
+            with patch('inhomcorr.bias_estimator.cached_estimator.'
+                       'RESULT_CACHE_VERSION', 0):
+                cache.put(key, ImageData(self.image.data))
+            # Entries of other versions are misses
+            self.assertIsNone(cache.get(key))
+            self.assertEqual(cache.info().misses, 1)
+
+    def test_disk_eviction(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = DiskResultCache(folder)
+            cached = CachedEstimator(CountingEstimator(), cache)
+            cached(self.image)
+            entry_bytes = cache.info().nbytes
+
+            cache.max_bytes = 2 * entry_bytes
+            images = [self.TestData.get_random_image() for _ in range(3)]
+            for image in images:
+                # Distinct modification times of the entries
+                time.sleep(0.01)
+                cached(image)
+            info = cache.info()
+            self.assertEqual(info.entries, 2)
+            self.assertLessEqual(info.nbytes, 2 * entry_bytes)
+            self.assertIsNone(cache.get(cached.key(self.image)))
+
+    def test_n4(self):
+        testImage = TestData(img_shape=(1, 1, 64, 64)).get_random_image()
+        cached = CachedEstimator(N4Estimator(N4Hyperparameters()))
+
+        start = time.perf_counter()
+        bf = cached(testImage)
+        time_estimate = time.perf_counter() - start
+        start = time.perf_counter()
+        bf_cached = cached(testImage)
+        time_cached = time.perf_counter() - start
+
+        torch.testing.assert_close(bf_cached.data, bf.data)
+        self.assertEqual(bf_cached.header, bf.header)
+        self.assertLess(time_cached, time_estimate)
+        # Other hyperparameters are estimated again
+        cached.estimator.hparams = N4Hyperparameters(maxNumberIterations=5)
+        cached(testImage)
+        self.assertEqual(cached.cache.info().misses, 2)
@@ -1,10 +1,14 @@
 """Data loader tests."""
 import os
+import tempfile
 import unittest
 from pathlib import Path
+from unittest.mock import patch
 
 import nibabel as nib
 import numpy as np
+import torch
+from nibabel.arrayproxy import ArrayProxy
 
 from inhomcorr.data_loader.data_loader_nii import QMRIDataLoaderNii
 from inhomcorr.mrdata import QMRIData
@@ -53,3 +57,106 @@ class TestQMRIDataLoaderNii(unittest.TestCase):
             qmri_dat = qmri_dat_ld.get_data()
             self.assertIsInstance(qmri_dat, QMRIData)
             self.assertEqual(list(qmri_dat.t1.shape), list(self.shape[-2::-1]))
+
+    def test_lazy_equals_eager(self):
+        for nii_file in self.nii_files:
+            data_lazy, ndim_lazy = QMRIDataLoaderNii(
+                lazy=True)._load_param_from_nii(nii_file, 1)
+            data_eager, ndim_eager = QMRIDataLoaderNii(
+                lazy=False)._load_param_from_nii(nii_file, 1)
+            self.assertEqual(ndim_lazy, ndim_eager)
+            self.assertEqual(data_lazy.dtype, torch.float32)
+            torch.testing.assert_close(data_lazy, data_eager)
+
+
+class TestQMRIDataLoaderNiiLazy(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dat4d = np.random.rand(6, 5, 4, 3).astype(np.float32)
+        nifti_im = nib.Nifti1Image(self.dat4d, affine=np.eye(4))
+        self.nii_files = [Path(self.tmp_dir.name) / 'test.nii',
+                          Path(self.tmp_dir.name) / 'test.nii.gz']
+        for nii_file in self.nii_files:
+            nib.save(nifti_im, nii_file)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load_single_volume(self):
+        # The whole 4D array must never be read
+        with patch.object(ArrayProxy, '__array__',
+                          side_effect=AssertionError('full read')):
+            for nii_file in self.nii_files:
+                qmri_dat_ld = QMRIDataLoaderNii()
+                qmri_dat_ld.load_t1(nii_file, t1_dim=2)
+                torch.testing.assert_close(
+                    qmri_dat_ld.get_data().t1,
+                    torch.from_numpy(self.dat4d[..., 2].T.copy()))
+
+    def test_memory_map(self):
+        nii_file = nib.load(self.nii_files[0], mmap=True)
+        nii_data = QMRIDataLoaderNii._read_volume_lazy(
+            nii_file, self.nii_files[0], 1)
+        # The volume is copied out of the memory map
+        self.assertNotIsInstance(nii_data, np.memmap)
+        self.assertTrue(nii_data.flags.owndata)
+        self.assertTrue(nii_data.flags.writeable)
+
+    def test_overwritten_file(self):
+        nii_file = self.nii_files[0]
+        qmri_dat_ld = QMRIDataLoaderNii()
+        qmri_dat_ld.load_t1(nii_file, t1_dim=2)
+        t1 = torch.from_numpy(self.dat4d[..., 2].T.copy())
+
+        # Overwriting or truncating the file does not change loaded maps
+        nib.save(nib.Nifti1Image(np.full_like(self.dat4d, 5.),
+                                 affine=np.eye(4)), nii_file)
+        torch.testing.assert_close(qmri_dat_ld.get_data().t1, t1)
+        os.truncate(nii_file, 0)
+        torch.testing.assert_close(qmri_dat_ld.get_data().t1, t1)
+
+    def test_load_all(self):
+        for nii_file in self.nii_files:
+            qmri_dat_ld = QMRIDataLoaderNii()
+            qmri_dat_ld.load_all(nii_file, t1_dim=2, m0_dim=0)
+            qmri_dat = qmri_dat_ld.get_data()
+
+            # Compare to loading each parameter separately
+            qmri_dat_ref_ld = QMRIDataLoaderNii()
+            qmri_dat_ref_ld.load_header(nii_file)
+            qmri_dat_ref_ld.load_t1(nii_file, t1_dim=2)
+            qmri_dat_ref_ld.load_rho(nii_file, m0_dim=0)
+            qmri_dat_ref = qmri_dat_ref_ld.get_data()
+
+            torch.testing.assert_close(qmri_dat.t1, qmri_dat_ref.t1)
+            torch.testing.assert_close(qmri_dat.rho, qmri_dat_ref.rho)
+            self.assertEqual(qmri_dat.header['dim'].tolist(),
+                             qmri_dat_ref.header['dim'].tolist())
+
+    def test_load_all_single_open(self):
+        QMRIDataLoaderNii.clear_cache()
+        with patch.object(nib, 'load', wraps=nib.load) as nib_load:
+            for nii_file in self.nii_files:
+                QMRIDataLoaderNii().load_all(nii_file)
+                # A second subject sharing the file reuses the parsed file
+                qmri_dat_ld = QMRIDataLoaderNii()
+                qmri_dat_ld.load_header(nii_file)
+                qmri_dat_ld.load_t1(nii_file)
+            self.assertEqual(nib_load.call_count, 2)
+        self.assertEqual(QMRIDataLoaderNii.cache_info().misses, 2)
+
+    def test_cache_invalidation(self):
+        nii_file = self.nii_files[0]
+        QMRIDataLoaderNii().load_all(nii_file)
+
+        dat4d = np.ones_like(self.dat4d) * 2
+        nib.save(nib.Nifti1Image(dat4d, affine=np.eye(4)), nii_file)
+        # Make sure the modification time changes
+        stat = os.stat(nii_file)
+        os.utime(nii_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        qmri_dat_ld = QMRIDataLoaderNii()
+        qmri_dat_ld.load_all(nii_file)
+        torch.testing.assert_close(qmri_dat_ld.get_data().t1,
+                                   torch.full((4, 5, 6), 2.))
@@ -0,0 +1,146 @@
+"""Dicom data loader tests."""
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import pydicom
+import torch
+
+from inhomcorr.data_loader.data_loader_dicom import QMRIDataLoaderDicom
+
+
+class TestQMRIDataLoaderDicom(unittest.TestCase):
+
+    def setUp(self):
+        self.dicom_path = Path('tests')/'test_data'/'TestDicoms_Phantom1Dicom'
+        (self.dicom_file,) = self.dicom_path.glob('*.IMA')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_series(self, positions, acquisitions=None, series_uid=None,
+                     folder=None):
+        # Write small copies of the test dicom with the given slice
+        # positions (mm along the normal) and a constant value per image
+        folder = folder or self.tmp_path
+        series_uid = series_uid or pydicom.uid.generate_uid()
+        acquisitions = acquisitions or [1] * len(positions)
+        template = pydicom.dcmread(self.dicom_file)
+        normal = np.cross(np.asarray(template.ImageOrientationPatient[:3],
+                                     dtype=float),
+                          np.asarray(template.ImageOrientationPatient[3:],
+                                     dtype=float))
+        for index, (position, acquisition) in enumerate(
+                zip(positions, acquisitions)):
+            dicom = pydicom.dcmread(self.dicom_file)
+            dicom.SeriesInstanceUID = series_uid
+            dicom.SOPInstanceUID = pydicom.uid.generate_uid()
+            dicom.InstanceNumber = index + 1
+            dicom.AcquisitionNumber = acquisition
+            dicom.ImagePositionPatient = list(position * normal)
+            dicom.Rows, dicom.Columns = 4, 6
+            dicom.PixelData = np.full(
+                (4, 6), 10 * position + acquisition, dtype=np.uint16).tobytes()
+            dicom.save_as(folder / f'{series_uid}_{index}.IMA')
+        return series_uid
+
+    def test_load_single_file(self):
+        loader = QMRIDataLoaderDicom()
+        loader.load_header(self.dicom_file)
+        loader.load_t1(self.dicom_file)
+        loader.load_rho(self.dicom_path)
+        qmri = loader.get_data()
+
+        pixel_array = pydicom.dcmread(self.dicom_file).pixel_array
+        self.assertEqual(qmri.t1.shape, (1, 512, 512))
+        self.assertEqual(qmri.t1.dtype, torch.float32)
+        torch.testing.assert_close(qmri.t1[0],
+                                   torch.as_tensor(pixel_array.astype(float),
+                                                   dtype=torch.float32))
+        torch.testing.assert_close(qmri.rho, qmri.t1 / qmri.t1.max())
+        self.assertEqual(qmri.header['spacing'], (0.78125, 0.78125, 8.4))
+        self.assertEqual(qmri.header['origin'], (0., -200., 200.))
+        self.assertEqual(qmri.header['SeriesDescription'], 'localizer_CP')
+
+    def test_slice_order(self):
+        self.write_series([4., 0., 8., 2., 6.])
+        loader = QMRIDataLoaderDicom()
+        loader.load_header(self.tmp_path)
+        loader.load_t1(self.tmp_path)
+        qmri = loader.get_data()
+
+        self.assertEqual(qmri.t1.shape, (5, 4, 6))
+        torch.testing.assert_close(qmri.t1[:, 0, 0],
+                                   torch.tensor([1., 21., 41., 61., 81.]))
+        self.assertEqual(qmri.header['spacing'][2], 2.)
+
+    def test_rescale(self):
+        dicom = pydicom.dcmread(self.dicom_file)
+        dicom.RescaleSlope = 2.
+        dicom.RescaleIntercept = -1.
+        dicom.save_as(self.tmp_path / 'rescaled.IMA')
+        loader = QMRIDataLoaderDicom()
+        loader.load_t1(self.tmp_path / 'rescaled.IMA')
+        expected = 2. * dicom.pixel_array.astype(np.float32) - 1.
+        torch.testing.assert_close(loader.get_data().t1[0],
+                                   torch.from_numpy(expected))
+
+    def test_several_volumes(self):
+        self.write_series([0., 0., 2., 2.], acquisitions=[2, 1, 1, 2])
+        loader = QMRIDataLoaderDicom()
+        with self.assertRaises(ValueError):
+            loader.load_t1(self.tmp_path)
+        loader.load_t1(self.tmp_path, dim=1)
+        torch.testing.assert_close(loader.get_data().t1[:, 0, 0],
+                                   torch.tensor([2., 22.]))
+        with self.assertRaises(ValueError):
+            loader.load_t1(self.tmp_path, dim=2)
+        loader.load_header(self.tmp_path)
+        self.assertEqual(loader.get_data().header['spacing'][2], 2.)
+
+    def test_several_series(self):
+        t1_uid = self.write_series([0., 2.])
+        m0_uid = self.write_series([0., 2.], acquisitions=[3, 3])
+        loader = QMRIDataLoaderDicom()
+        with self.assertRaises(ValueError):
+            loader.load_t1(self.tmp_path)
+        loader.load_t1(self.tmp_path, series_uid=t1_uid)
+        loader.load_rho(self.tmp_path, series_uid=m0_uid)
+        torch.testing.assert_close(loader.get_data().t1[:, 0, 0],
+                                   torch.tensor([1., 21.]))
+        torch.testing.assert_close(loader.get_data().rho[:, 0, 0],
+                                   torch.tensor([3., 23.]) / 23.)
+
+    def test_load_all(self):
+        self.write_series([0., 0., 2., 2.], acquisitions=[2, 1, 1, 2])
+        loader = QMRIDataLoaderDicom()
+        with patch.object(pydicom, 'dcmread',
+                          wraps=pydicom.dcmread) as dcmread:
+            loader.load_all(self.tmp_path, t1_dim=0, m0_dim=1)
+            # Grouping reads the headers, loading the pixels of each file
+            self.assertEqual(dcmread.call_count, 8)
+        qmri = loader.get_data()
+
+        torch.testing.assert_close(qmri.t1[:, 0, 0], torch.tensor([1., 21.]))
+        torch.testing.assert_close(qmri.rho[:, 0, 0],
+                                   torch.tensor([2., 22.]) / 22.)
+        self.assertEqual(qmri.header['spacing'][2], 2.)
+
+        # Single loaders reuse the read datasets until the cache is cleared
+        with patch.object(pydicom, 'dcmread',
+                          wraps=pydicom.dcmread) as dcmread:
+            loader.load_header(self.tmp_path)
+            loader.load_rho(self.tmp_path, dim=1)
+            dcmread.assert_not_called()
+            loader.clear_cache()
+            loader.load_header(self.tmp_path)
+            self.assertEqual(dcmread.call_count, 8)
+
+    def test_empty(self):
+        loader = QMRIDataLoaderDicom()
+        with self.assertRaises(ValueError):
+            loader.load_t1(self.tmp_path)
@@ -2,10 +2,15 @@
 import tempfile
 import unittest
 from pathlib import Path
+from unittest.mock import patch
 
 import nibabel
+import pydicom
 
+from inhomcorr.data_loader import dcm2nii
+from inhomcorr.data_loader.dcm2nii import DicomToNiftiConverter
 from inhomcorr.data_loader.dcm2nii import convert_dcm2nii_dir
+from inhomcorr.data_loader.dcm2nii import group_dicom_series
 
 
 class TestDCM2NII(unittest.TestCase):
@@ -52,3 +57,112 @@ class TestDCM2NII(unittest.TestCase):
             returned_list = convert_dcm2nii_dir(
                 tmpdir, tmpdir)
             self.assertEqual(len(returned_list), 0)
+
+
+class TestDicomToNiftiConverter(unittest.TestCase):
+
+    def setUp(self):
+        self.dicom_path = Path('tests')/'test_data'/'TestDicoms_Phantom1Dicom'
+
+    def test_group_series(self):
+        series = group_dicom_series(self.dicom_path)
+        self.assertEqual(len(series), 1)
+        self.assertEqual(len(next(iter(series.values()))), 1)
+
+    def test_mapping(self):
+        with tempfile.TemporaryDirectory() as stroutpath:
+            outpath = Path(stroutpath)
+            converter = DicomToNiftiConverter(outpath, workers=1)
+            mapping = converter.convert(self.dicom_path)
+
+            self.assertEqual(list(mapping), list(
+                group_dicom_series(self.dicom_path)))
+            file_nifti = next(iter(mapping.values()))
+            self.assertEqual(file_nifti, outpath / '3_localizer_cp.nii')
+            self.assertEqual(nibabel.load(file_nifti).shape, (1, 512, 512))
+            self.assertTrue(converter.manifest_file.exists())
+
+    def test_compression(self):
+        with tempfile.TemporaryDirectory() as stroutpath:
+            converter = DicomToNiftiConverter(stroutpath, workers=1,
+                                              compression=True)
+            (file_nifti,) = converter.convert(self.dicom_path).values()
+            self.assertTrue(file_nifti.name.endswith('.nii.gz'))
+            self.assertTrue(file_nifti.exists())
+
+    def test_skip_unchanged(self):
+        with tempfile.TemporaryDirectory() as stroutpath:
+            outpath = Path(stroutpath)
+            converter = DicomToNiftiConverter(outpath, workers=1)
+            first = converter.convert(self.dicom_path)
+
+            with patch.object(dcm2nii, '_convert_series',
+                              wraps=dcm2nii._convert_series) as convert:
+                second = converter.convert(self.dicom_path)
+                convert.assert_not_called()
+            self.assertEqual(first, second)
+
+            # Missing outputs are converted again
+            next(iter(first.values())).unlink()
+            with patch.object(dcm2nii, '_convert_series',
+                              wraps=dcm2nii._convert_series) as convert:
+                third = converter.convert(self.dicom_path)
+                convert.assert_called_once()
+            self.assertEqual(first, third)
+
+    def test_skip_failed(self):
+        with tempfile.TemporaryDirectory() as strinpath, \
+                tempfile.TemporaryDirectory() as stroutpath:
+            (dicom_file,) = self.dicom_path.glob('*.IMA')
+            dicom = pydicom.dcmread(dicom_file)
+            dicom.save_as(Path(strinpath) / '0.IMA')
+            converter = DicomToNiftiConverter(stroutpath, workers=1)
+            with patch.object(dcm2nii, 'dicom_array_to_nifti',
+                              side_effect=ValueError):
+                self.assertEqual(converter.convert(strinpath), {})
+
+            # Failed series are skipped until they change
+            with patch.object(dcm2nii, '_convert_series',
+                              wraps=dcm2nii._convert_series) as convert:
+                self.assertEqual(converter.convert(strinpath), {})
+                convert.assert_not_called()
+
+            dicom.SeriesDescription = 'fixed'
+            dicom.save_as(Path(strinpath) / '0.IMA')
+            self.assertEqual(len(converter.convert(strinpath)), 1)
+
+    def test_moved_input(self):
+        with tempfile.TemporaryDirectory() as strinpath, \
+                tempfile.TemporaryDirectory() as stroutpath:
+            inpath = Path(strinpath)
+            (dicom_file,) = self.dicom_path.glob('*.IMA')
+            (inpath / 'old').mkdir()
+            pydicom.dcmread(dicom_file).save_as(inpath / 'old' / '0.IMA')
+            converter = DicomToNiftiConverter(stroutpath, workers=1)
+            first = converter.convert(inpath / 'old')
+
+            # Moving the folder keeps size and modification time
+            (inpath / 'old').rename(inpath / 'new')
+            with patch.object(dcm2nii, '_convert_series',
+                              wraps=dcm2nii._convert_series) as convert:
+                second = converter.convert(inpath / 'new')
+                convert.assert_not_called()
+            self.assertEqual(first, second)
+
+    def test_parallel(self):
+        with tempfile.TemporaryDirectory() as strinpath, \
+                tempfile.TemporaryDirectory() as stroutpath:
+            # Two series with the same series number and description
+            (dicom_file,) = self.dicom_path.glob('*.IMA')
+            for index in range(2):
+                dicom = pydicom.dcmread(dicom_file)
+                dicom.SeriesInstanceUID = pydicom.uid.generate_uid()
+                dicom.save_as(Path(strinpath) / f'{index}.IMA')
+
+            converter = DicomToNiftiConverter(stroutpath, workers=2)
+            mapping = converter.convert(strinpath)
+            self.assertEqual(len(mapping), 2)
+            self.assertEqual(len(set(mapping.values())), 2)
+            for file_nifti in mapping.values():
+                self.assertEqual(nibabel.load(file_nifti).shape,
+                                 (1, 512, 512))
@@ -0,0 +1,25 @@
+"""Tests of the JSON serialization of headers."""
+import json
+import unittest
+
+import numpy as np
+
+from inhomcorr.header import decode_header
+from inhomcorr.header import encode_header
+
+
+class TestHeader(unittest.TestCase):
+    def test_roundtrip(self):
+        header = {'spacing': (1., 2., 3.), 'dims': [1, 2],
+                  'pixdim': np.arange(8, dtype=np.float32),
+                  'magic': b'n+1\x00', 'qform_code': np.int16(1),
+                  'nested': {'origin': (0., 0., 0.)}}
+        decoded = decode_header(json.loads(json.dumps(encode_header(header))))
+
+        self.assertEqual(decoded['spacing'], (1., 2., 3.))
+        self.assertEqual(decoded['dims'], [1, 2])
+        self.assertEqual(decoded['pixdim'].dtype, np.float32)
+        np.testing.assert_array_equal(decoded['pixdim'], header['pixdim'])
+        self.assertEqual(decoded['magic'], header['magic'])
+        self.assertEqual(decoded['qform_code'], 1)
+        self.assertEqual(decoded['nested'], {'origin': (0., 0., 0.)})
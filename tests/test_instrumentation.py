@@ -0,0 +1,106 @@
+"""Tests of the instrumentation of pipeline stages."""
+import json
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import torch
+
+from inhomcorr.bias_creator.torchio_bias import BiasCreatorTorchio
+from inhomcorr.instrumentation import Recorder
+from inhomcorr.instrumentation import instrument
+from inhomcorr.mrsig.flash import MRSigFlash
+from tests.testdata import TestData
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.testdata = TestData(img_shape=(1, 4, 16, 16),
+                                 qmri_shape=(4, 16, 16))
+        self.qmri = self.testdata.get_random_qmri()
+        self.param = self.testdata.get_gre_param()
+
+    def test_record_call(self):
+        with Recorder() as recorder:
+            image = MRSigFlash()(self.qmri, self.param)
+
+        (record,) = recorder.records
+        self.assertEqual(record.name, 'MRSigFlash.__call__')
+        self.assertEqual(record.input_shapes, [(4, 16, 16)])
+        self.assertEqual(record.output_shapes, [(1, 4, 16, 16)])
+        self.assertEqual(record.bytes_in, self.qmri.nbytes)
+        self.assertEqual(record.bytes_out, image.nbytes)
+        self.assertGreater(record.duration_s, 0.)
+        self.assertIsNone(record.peak_memory_bytes)
+
+    def test_nested_calls(self):
+        image = self.testdata.get_random_image()
+        with Recorder() as recorder:
+            BiasCreatorTorchio().get_bias_field(image)
+
+        names = [record.name for record in recorder.records]
+        # Records are added when calls finish
+        self.assertEqual(names, ['BiasCreatorTorchio.get_bias_field_tensor',
+                                 'BiasCreatorTorchio.get_bias_field'])
+        inner, outer = recorder.records
+        self.assertGreaterEqual(inner.start_s, outer.start_s)
+        self.assertLessEqual(inner.duration_s, outer.duration_s)
+
+    def test_disabled(self):
+        calls = []
+
+        @instrument
+        def add_one(value):
+            return value + 1
+
+        with Recorder(callbacks=[calls.append]) as recorder:
+            add_one(1)
+        self.assertEqual(add_one(2), 3)
+        self.assertEqual(len(recorder.records), 1)
+        self.assertEqual(calls, recorder.records)
+
+        # Overhead of an instrumented call without recorder
+        start = time.perf_counter()
+        for _ in range(10000):
+            add_one(1)
+        self.assertLess((time.perf_counter() - start) / 10000, 2e-5)
+
+    def test_nested_recorders(self):
+        with Recorder() as outer:
+            MRSigFlash()(self.qmri, self.param)
+            with Recorder() as inner:
+                MRSigFlash().signal(self.qmri, [0.01, 0.02], [0.1, 0.2])
+        self.assertEqual(len(outer.records), 2)
+        self.assertEqual([record.name for record in inner.records],
+                         ['MRSigFlash.signal'])
+        summary = outer.summary()
+        self.assertEqual(summary['MRSigFlash.signal']['calls'], 1)
+        self.assertEqual(summary['MRSigFlash.signal']['bytes_out'],
+                         2 * 4 * 16 * 16 * 4)
+
+    def test_export(self):
+        with Recorder() as recorder:
+            MRSigFlash()(self.qmri, self.param)
+
+        with tempfile.TemporaryDirectory() as folder:
+            recorder.to_json(Path(folder) / 'records.json')
+            recorder.to_chrome_trace(Path(folder) / 'trace.json')
+            with open(Path(folder) / 'records.json') as file:
+                records = json.load(file)
+            with open(Path(folder) / 'trace.json') as file:
+                trace = json.load(file)
+
+        self.assertEqual(records['records'][0]['name'], 'MRSigFlash.__call__')
+        self.assertIn('MRSigFlash.__call__', records['summary'])
+        (event,) = trace['traceEvents']
+        self.assertEqual(event['ph'], 'X')
+        self.assertEqual(event['args']['input_shapes'], [[4, 16, 16]])
+
+    def test_torch_profiler(self):
+        with torch.profiler.profile(
+                activities=[torch.profiler.ProfilerActivity.CPU]) as prof:
+            MRSigFlash()(self.qmri, self.param)
+        names = [event.name for event in prof.events()]
+        self.assertIn('MRSigFlash.__call__', names)
@@ -0,0 +1,138 @@
+"""CNN Estimator tests."""
+import tempfile
+import unittest
+from pathlib import Path
+
+import torch
+
+from inhomcorr.bias_estimator import CNNEstimator
+from inhomcorr.bias_estimator import CNNHyperparameters
+from inhomcorr.bias_estimator.cnn_torch import UNet3D
+from inhomcorr.bias_estimator.trainer_supervised import SupervisedTrainer
+from inhomcorr.bias_estimator.trainer_supervised import (
+    SupervisedTrainingParameters,
+)
+from inhomcorr.mrdata import ImageData
+from tests.testdata import TestData
+
+
+class TestCNNEstimator(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.TestData = TestData(img_shape=(1, 20, 24, 18))
+        # Untrained networks predict a constant bias field
+        self.network = UNet3D(levels=2, features=4)
+        torch.nn.init.normal_(self.network.head.weight)
+
+    def test_untrained(self):
+        testImage = self.TestData.get_random_image()
+
+        bf = CNNEstimator()(testImage)
+        self.assertEqual(bf.shape, testImage.shape)
+        torch.testing.assert_close(bf.data, torch.ones(testImage.shape))
+
+    def test_biasfield_estimation_batched(self):
+        testImages = [self.TestData.get_random_image() for _ in range(3)]
+
+        bfe = CNNEstimator(CNNHyperparameters(batchSize=2),
+                           network=self.network)
+        bf = bfe(ImageData.stack(testImages))
+
+        self.assertEqual(bf.shape, (3, *testImages[0].shape))
+        for ind, testImage in enumerate(testImages):
+            torch.testing.assert_close(bf.data[ind], bfe(testImage).data)
+
+    def test_tiled(self):
+        testImage = TestData(img_shape=(1, 40, 48, 36)).get_random_image()
+        hparams = CNNHyperparameters(shrinkFactor=1)
+        bf = CNNEstimator(hparams, network=self.network)(testImage)
+
+        shapes = []
+        self.network.register_forward_hook(
+            lambda module, inputs, output: shapes.append(inputs[0].shape))
+        hparams = CNNHyperparameters(shrinkFactor=1, tileSize=32,
+                                     tileOverlap=16, batchSize=4)
+        bf_tiled = CNNEstimator(hparams, network=self.network)(testImage)
+
+        # 2 x 2 x 2 tiles in batches of 4 tiles
+        self.assertEqual(len(shapes), 2)
+        self.assertEqual(shapes[0], (4, 1, 32, 32, 32))
+        self.assertEqual(bf_tiled.shape, testImage.shape)
+        # Blending limits the deviation at tile borders
+        torch.testing.assert_close(bf_tiled.data.log(), bf.data.log(),
+                                   atol=0.05 * bf.data.log().abs().max(),
+                                   rtol=0)
+
+    def test_tile_larger_than_volume(self):
+        testImage = self.TestData.get_random_image()
+
+        bf = CNNEstimator(network=self.network)(testImage)
+        bf_tiled = CNNEstimator(CNNHyperparameters(tileSize=64),
+                                network=self.network)(testImage)
+        torch.testing.assert_close(bf_tiled.data, bf.data)
+
+    def test_device(self):
+        class MetaNetwork(torch.nn.Module):
+            # Network on the meta device returning cpu predictions
+            def __init__(self):
+                super().__init__()
+                self.weight = torch.nn.Parameter(torch.zeros(1,
+                                                             device='meta'))
+                self.devices = []
+
+            def forward(self, x):
+                self.devices.append(x.device)
+                return torch.zeros(x.shape)
+
+        testImage = self.TestData.get_random_image()
+        for tileSize in (None, 8):
+            network = MetaNetwork()
+            bfe = CNNEstimator(CNNHyperparameters(tileSize=tileSize),
+                               network=network)
+            self.assertEqual(bfe.device, torch.device('meta'))
+            bf = bfe(testImage)
+
+            # Inputs are moved to the network, the bias field back
+            self.assertTrue(network.devices)
+            self.assertTrue(all(device.type == 'meta'
+                                for device in network.devices))
+            self.assertEqual(bf.device, testImage.device)
+            torch.testing.assert_close(bf.data, torch.ones(testImage.shape))
+
+    def test_torchscript(self):
+        testImage = self.TestData.get_random_image()
+        bfe = CNNEstimator(network=self.network)
+
+        with tempfile.TemporaryDirectory() as folder:
+            file = Path(folder) / 'network.pt'
+            bfe.export_torchscript(file)
+            loaded = CNNEstimator.load_torchscript(file)
+
+        torch.testing.assert_close(loaded(testImage).data,
+                                   bfe(testImage).data)
+
+    def test_training(self):
+        bfe = CNNEstimator(CNNHyperparameters(numberLevels=2,
+                                              numberFeatures=4))
+        images = torch.rand(4, 1, 8, 8, 8) + 0.5
+        bias = torch.exp(0.1 * torch.randn(4, 1, 1, 1, 1)).expand_as(images)
+        dataset = torch.utils.data.TensorDataset(images * bias, bias)
+
+        params = SupervisedTrainingParameters(numberSteps=2, batchSize=2)
+        SupervisedTrainer(bfe.training_model(), params)(dataset)
+        # The estimator uses the trained parameters
+        self.assertFalse(torch.all(bfe.network.head.weight == 0))
+        bf = bfe(ImageData(images[0]))
+        self.assertEqual(bf.shape, (1, 8, 8, 8))
+
+    def test_multichannel(self):
+        testImage = TestData(img_shape=(2, 1, 8, 8)).get_random_image()
+        with self.assertRaises(ValueError):
+            CNNEstimator()(testImage)
+
+    def test_biasfield_header(self):
+        testImage = self.TestData.get_random_image()
+        testImage.header = {'spacing': (0.5, 2., 3.), 'origin': (1., 2., 3.)}
+
+        bf = CNNEstimator()(testImage)
+        self.assertEqual(bf.header['spacing'], (0.5, 2., 3.))
@@ -1,10 +1,23 @@
 """N4 Estimator tests."""
 import unittest
+from unittest.mock import patch
+
+import SimpleITK as sitk
+import torch
 
 from inhomcorr.bias_estimator import N4Estimator
+from inhomcorr.bias_estimator import N4Hyperparameters
+from inhomcorr.mrdata import ImageData
 from tests.testdata import TestData
 
 
+class ScaledN4Estimator(N4Estimator):
+    # Subclass whose overrides must be used by the workers of estimate_many
+    def sitk_n4_estimation(self, image):
+        biasfield = super().sitk_n4_estimation(image)
+        return ImageData(2 * biasfield.data)
+
+
 class TestN4Estimator(unittest.TestCase):
     def setUp(self):
         self.TestData = TestData(img_shape=(1, 1, 64, 64))
@@ -18,3 +31,134 @@ class TestN4Estimator(unittest.TestCase):
         assert bf.shape == testImage.shape,\
             'The shapes of biasfield and image should match.'\
             f'You have {bf.shape} and {testImage.shape}'
+
+    def test_biasfield_estimation_batched(self):
+        testImages = [self.TestData.get_random_image() for _ in range(2)]
+
+        bfe = N4Estimator(hparams=N4Hyperparameters(maxNumberIterations=10))
+        bf = bfe(ImageData.stack(testImages))
+
+        self.assertEqual(bf.shape, (2, *testImages[0].shape))
+        for ind, testImage in enumerate(testImages):
+            torch.testing.assert_close(bf.data[ind], bfe(testImage).data)
+
+    def test_biasfield_estimation_many(self):
+        testImages = [self.TestData.get_random_image() for _ in range(3)]
+
+        bfe = N4Estimator(hparams=None)
+        bfs, wall_times = bfe.estimate_many(testImages, workers=2)
+
+        self.assertEqual(len(bfs), len(testImages))
+        self.assertEqual(len(wall_times), len(testImages))
+        # Results are returned in input order
+        for testImage, bf in zip(testImages, bfs):
+            torch.testing.assert_close(bf.data, bfe(testImage).data)
+            self.assertEqual(bf.shape, testImage.shape)
+        self.assertTrue(all(t > 0 for t in wall_times))
+
+    def test_biasfield_estimation_many_subclass(self):
+        testImages = [self.TestData.get_random_image() for _ in range(2)]
+
+        bfe = ScaledN4Estimator(hparams=N4Hyperparameters(
+            maxNumberIterations=10), cache_mask=False)
+        for workers in (1, 2):
+            bfs, _ = bfe.estimate_many(testImages, workers=workers)
+            for testImage, bf in zip(testImages, bfs):
+                torch.testing.assert_close(bf.data, bfe(testImage).data)
+
+    def test_biasfield_estimation_many_serial(self):
+        testImages = [self.TestData.get_random_image() for _ in range(2)]
+
+        bfe = N4Estimator(hparams=None)
+        bfs, wall_times = bfe.estimate_many(testImages, workers=1)
+
+        self.assertEqual(len(bfs), len(testImages))
+        torch.testing.assert_close(bfs[1].data, bfe(testImages[1]).data)
+
+    def test_biasfield_estimation_shrink(self):
+        # Smooth disk phantom corrupted by a linear bias field
+        y, x = torch.meshgrid(torch.linspace(-1, 1, 64),
+                              torch.linspace(-1, 1, 64), indexing='ij')
+        bias = 1 + 0.3 * x
+        disk = ((x**2 + y**2) < 0.8).float() + 0.01
+        testImage = ImageData((disk * bias)[None, None])
+
+        bf_full = N4Estimator(N4Hyperparameters())(testImage)
+        bf_shrink = N4Estimator(N4Hyperparameters(shrinkFactor=2))(testImage)
+
+        self.assertEqual(bf_shrink.shape, testImage.shape)
+        mask = disk[None, None] > 0.5
+        bf_full = bf_full.data[mask] / bf_full.data[mask].mean()
+        bf_shrink = bf_shrink.data[mask] / bf_shrink.data[mask].mean()
+        torch.testing.assert_close(bf_shrink, bf_full, rtol=0.05, atol=0)
+
+    def test_biasfield_estimation_image_mask(self):
+        testImage = self.TestData.get_random_image()
+        testImage.mask = torch.ones(testImage.shape, dtype=torch.bool)
+
+        bfe = N4Estimator(hparams=None)
+        with patch.object(sitk, 'OtsuThreshold',
+                          wraps=sitk.OtsuThreshold) as otsu:
+            bf = bfe(testImage)
+        otsu.assert_not_called()
+        self.assertEqual(bf.shape, testImage.shape)
+
+    def test_otsu_mask_cache(self):
+        testImage = self.TestData.get_random_image()
+
+        with patch.object(sitk, 'OtsuThreshold',
+                          wraps=sitk.OtsuThreshold) as otsu:
+            N4Estimator(N4Hyperparameters(maxNumberIterations=5))(testImage)
+            N4Estimator(N4Hyperparameters(maxNumberIterations=10))(testImage)
+            self.assertEqual(otsu.call_count, 1)
+
+            # Changing the data invalidates the cached mask
+            testImage.data.mul_(2)
+            N4Estimator(N4Hyperparameters())(testImage)
+            self.assertEqual(otsu.call_count, 2)
+
+            # No caching
+            bfe = N4Estimator(N4Hyperparameters(), cache_mask=False)
+            bfe(testImage)
+            bfe(testImage)
+            self.assertEqual(otsu.call_count, 4)
+
+    def test_otsu_mask_cache_batch(self):
+        testImages = ImageData.stack([self.TestData.get_random_image()
+                                      for _ in range(2)])
+        bfe = N4Estimator(N4Hyperparameters(maxNumberIterations=5))
+
+        with patch.object(sitk, 'OtsuThreshold',
+                          wraps=sitk.OtsuThreshold) as otsu:
+            # The masks of the subjects of a batch are cached
+            bf = bfe(testImages)
+            torch.testing.assert_close(bfe(testImages).data, bf.data)
+            self.assertEqual(otsu.call_count, 2)
+
+            # Quantized images
+            quantized = testImages.to_storage(torch.int16)
+            bfe(quantized)
+            bfe(quantized)
+            self.assertEqual(otsu.call_count, 4)
+
+            # Changing the batch invalidates the masks of all subjects
+            testImages.data.mul_(2)
+            bfe(testImages)
+            self.assertEqual(otsu.call_count, 6)
+
+    def test_biasfield_inner_singleton(self):
+        testImage = TestData(img_shape=(1, 16, 1, 16)).get_random_image()
+        testImage.header = {'spacing': (0.5, 2., 3.), 'origin': (1., 2., 3.)}
+
+        bf = N4Estimator(N4Hyperparameters(maxNumberIterations=5))(testImage)
+        self.assertEqual(bf.shape, testImage.shape)
+        self.assertEqual(bf.header['spacing'], (0.5, 2., 3.))
+        self.assertEqual(bf.header['origin'], (1., 2., 3.))
+
+    def test_biasfield_header(self):
+        testImage = self.TestData.get_random_image()
+        testImage.header = {'spacing': (0.5, 2., 3.), 'origin': (1., 2., 3.)}
+
+        bf = N4Estimator(hparams=None)(testImage)
+        self.assertEqual(bf.header['spacing'], (0.5, 2., 3.))
+        self.assertEqual(bf.header['origin'], (1., 2., 3.))
@@ -0,0 +1,137 @@
+"""Polynomial Estimator tests."""
+import time
+import unittest
+
+import torch
+
+from inhomcorr.bias_estimator import N4Estimator
+from inhomcorr.bias_estimator import N4Hyperparameters
+from inhomcorr.bias_estimator import PolynomialEstimator
+from inhomcorr.bias_estimator import PolynomialHyperparameters
+from inhomcorr.mrdata import ImageData
+from tests.testdata import TestData
+
+
+def normalized_error(bf: torch.Tensor, bias: torch.Tensor,
+                     mask: torch.Tensor) -> float:
+    """Maximal relative error of bias fields normalized inside the mask."""
+    bf = bf[mask] / bf[mask].mean()
+    bias = bias[mask] / bias[mask].mean()
+    return float((bf / bias - 1).abs().max())
+
+
+class TestPolynomialEstimator(unittest.TestCase):
+    def setUp(self):
+        self.TestData = TestData(img_shape=(1, 32, 32, 32))
+
+    def test_biasfield_estimation(self):
+        testImage = TestData(img_shape=(1, 1, 64, 64)).get_random_image()
+
+        bf = PolynomialEstimator()(testImage)
+
+        self.assertEqual(bf.shape, testImage.shape)
+        self.assertTrue(torch.all(bf.data > 0))
+
+    def test_biasfield_accuracy(self):
+        testImage, bias, mask = self.TestData.get_bias_phantom()
+        testImage.mask = mask
+
+        bf = PolynomialEstimator(
+            PolynomialHyperparameters(shrinkFactor=1))(testImage)
+        self.assertLess(normalized_error(bf.data, bias.data, mask), 0.02)
+
+    def test_float_mask(self):
+        testImage, bias, mask = self.TestData.get_bias_phantom()
+        testImage.mask = mask
+        bf = PolynomialEstimator()(testImage)
+
+        # Nonzero voxels of non-boolean masks are inside
+        testImage.mask = mask.float() * 2
+        bf_float = PolynomialEstimator()(testImage)
+        torch.testing.assert_close(bf_float.data, bf.data)
+
+    def test_integer_image(self):
+        testImage, _, _ = self.TestData.get_bias_phantom()
+        data = (testImage.data / testImage.data.max() * 200).round()
+        bf = PolynomialEstimator()(ImageData(data))
+
+        # Integer images of the loaders are fitted in float32
+        for dtype in (torch.uint8, torch.int16):
+            bf_int = PolynomialEstimator()(ImageData(data.to(dtype)))
+            self.assertEqual(bf_int.data.dtype, torch.float32)
+            torch.testing.assert_close(bf_int.data, bf.data)
+
+    def test_compare_n4(self):
+        testImage, bias, mask = self.TestData.get_bias_phantom()
+
+        start = time.perf_counter()
+        bf = PolynomialEstimator()(testImage)
+        time_poly = time.perf_counter() - start
+        start = time.perf_counter()
+        bf_n4 = N4Estimator(N4Hyperparameters(maxNumberIterations=20,
+                                              shrinkFactor=2))(testImage)
+        time_n4 = time.perf_counter() - start
+
+        # Both estimators use an Otsu mask
+        error = normalized_error(bf.data, bias.data, mask)
+        error_n4 = normalized_error(bf_n4.data, bias.data, mask)
+        self.assertLess(error, 0.05)
+        self.assertLessEqual(error, error_n4)
+        self.assertLess(time_poly, time_n4)
+
+    def test_biasfield_estimation_batched(self):
+        phantoms = [self.TestData.get_bias_phantom(seed) for seed in (0, 1)]
+        testImages = [image for image, _, _ in phantoms]
+
+        bfe = PolynomialEstimator()
+        bf = bfe(ImageData.stack(testImages))
+
+        self.assertEqual(bf.shape, (2, *testImages[0].shape))
+        for ind, testImage in enumerate(testImages):
+            torch.testing.assert_close(bf.data[ind], bfe(testImage).data)
+
+    def test_classes(self):
+        # Two tissue classes inside the sphere
+        image, bias, mask = self.TestData.get_bias_phantom()
+        obj = image.data / bias.data
+        obj[:, :16] *= torch.where(mask[:, :16], 0.5, 1.)
+        testImage = ImageData(obj * bias.data)
+        testImage.mask = mask
+
+        error_single = normalized_error(
+            PolynomialEstimator()(testImage).data, bias.data, mask)
+        error_classes = normalized_error(
+            PolynomialEstimator(PolynomialHyperparameters(
+                numberClasses=2))(testImage).data, bias.data, mask)
+        self.assertLess(error_classes, 0.05)
+        self.assertLess(error_classes, error_single)
+
+    def test_differentiable(self):
+        testImage, _, mask = self.TestData.get_bias_phantom()
+        data = testImage.data.clone().requires_grad_()
+
+        bf = PolynomialEstimator()(ImageData(data))
+        bf.data.sum().backward()
+        self.assertTrue(torch.isfinite(data.grad).all())
+
+    def test_multichannel(self):
+        testImage = TestData(img_shape=(2, 1, 8, 8)).get_random_image()
+        with self.assertRaises(ValueError):
+            PolynomialEstimator()(testImage)
+
+    def test_biasfield_header(self):
+        testImage = self.TestData.get_random_image()
+        testImage.header = {'spacing': (0.5, 2., 3.), 'origin': (1., 2., 3.)}
+
+        bf = PolynomialEstimator()(testImage)
+        self.assertEqual(bf.header['spacing'], (0.5, 2., 3.))
+
+    @unittest.skipUnless(torch.cuda.is_available(), 'requires CUDA')
+    def test_cuda(self):
+        testImage, _, _ = self.TestData.get_bias_phantom()
+
+        bf = PolynomialEstimator()(testImage.to('cuda'))
+        self.assertEqual(bf.device.type, 'cuda')
+        torch.testing.assert_close(bf.data.cpu(),
+                                   PolynomialEstimator()(testImage).data,
+                                   rtol=1e-4, atol=1e-4)
@@ -4,6 +4,7 @@ import unittest
 import torch
 
 from inhomcorr.mrdata import ImageData
+from inhomcorr.mrdata import QMRIData
 from inhomcorr.mrsig.flash import MRSigFlash
 from tests.testdata import TestData
 
@@ -41,3 +42,57 @@ class TestMRSigFlash(unittest.TestCase):
         self.assertIsInstance(img_out, ImageData)
         torch.testing.assert_close(
             img_out.data, img_ref.data, rtol=0.05, atol=1e-4)
+
+    def test_mr_sig_flash_batched(self):
+
+        mrsig = MRSigFlash()
+        param = self.testdata.get_gre_param()
+        qmris = [self.testdata.get_random_qmri() for _ in range(3)]
+        img = mrsig(QMRIData.stack(qmris), param)
+
+        self.assertEqual(img.shape, (3, *self.img_shape))
+        for ind, qmri in enumerate(qmris):
+            torch.testing.assert_close(img.data[ind], mrsig(qmri, param).data)
+
+    def test_mr_sig_flash_signal(self):
+
+        mrsig = MRSigFlash()
+        params = [self.testdata.get_gre_param(tr=tr, alpha=alpha)
+                  for tr, alpha in [(10e-3, 0.1), (50e-3, 0.3), (0.1, 0.5)]]
+        signal = mrsig.batch(self.rand_qmri, params)
+
+        # Compare to single parameter calls
+        self.assertEqual(signal.shape, (3, *self.qmri_shape))
+        for ind, param in enumerate(params):
+            torch.testing.assert_close(
+                signal[ind], mrsig(self.rand_qmri, param).data[0])
+
+        # Parameters as tensors
+        signal_tensor = mrsig.signal(self.rand_qmri,
+                                     torch.tensor([10e-3, 50e-3, 0.1]),
+                                     torch.tensor([0.1, 0.3, 0.5]))
+        torch.testing.assert_close(signal_tensor, signal)
+
+    def test_mr_sig_flash_signal_exception(self):
+
+        mrsig = MRSigFlash()
+        with self.assertRaises(ValueError):
+            mrsig.signal(self.rand_qmri, [10e-3, 50e-3], [0.1])
+
+    def test_mr_sig_flash_float64(self):
+
+        mrsig = MRSigFlash()
+        qmri = QMRIData(t1=self.rand_qmri.t1.double(),
+                        rho=self.rand_qmri.rho.double())
+        img = mrsig(qmri, self.testdata.get_gre_param())
+        self.assertEqual(img.data.dtype, torch.float64)
+        signal = mrsig.signal(qmri, [10e-3], [0.1])
+        self.assertEqual(signal.dtype, torch.float64)
+
+    def test_mr_sig_flash_compile(self):
+
+        mrsig = MRSigFlash(compile=True)
+        signal = mrsig.signal(self.rand_qmri, [10e-3, 50e-3], [0.1, 0.3])
+        signal_ref = MRSigFlash().signal(self.rand_qmri, [10e-3, 50e-3],
+                                         [0.1, 0.3])
+        torch.testing.assert_close(signal, signal_ref)
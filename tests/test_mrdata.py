@@ -1,11 +1,14 @@
 """Tests for mrdata submodule."""
 import unittest
+from unittest.mock import patch
 
 import torch
 
 from inhomcorr.mrdata import ImageData
 from inhomcorr.mrdata import MRData
 from inhomcorr.mrdata import QMRIData
+from inhomcorr.mrsig.flash import MRParamGRE
+from inhomcorr.mrsig.flash import MRSigFlash
 from tests.testdata import TestData
 
 
@@ -104,3 +107,222 @@ class TestQMRIData(unittest.TestCase):
         qmri = QMRIData()
         self.assertEqual(float(qmri.t1.squeeze()), float('inf'))
         self.assertEqual(float(qmri.rho.squeeze()), 1.)
+
+
+class TestBatching(unittest.TestCase):
+
+    def setUp(self):
+        self.data = TestData(img_shape=(2, 3, 8, 8), qmri_shape=(3, 8, 8))
+
+    def test_stack_image(self):
+        images = [self.data.get_random_image() for _ in range(4)]
+        for ind, image in enumerate(images):
+            image.header = {'subject': ind}
+        batch = ImageData.stack(images)
+
+        self.assertTrue(batch.is_batched)
+        self.assertFalse(images[0].is_batched)
+        self.assertEqual(batch.batch_size, 4)
+        self.assertIsNone(images[0].batch_size)
+        self.assertEqual(batch.shape, (4, 2, 3, 8, 8))
+        torch.testing.assert_close(batch.data[2], images[2].data)
+
+        items = batch.unstack()
+        self.assertEqual(len(items), 4)
+        for ind, (item, image) in enumerate(zip(items, images)):
+            self.assertIsInstance(item, ImageData)
+            self.assertEqual(item.shape, image.shape)
+            self.assertEqual(item.header, {'subject': ind})
+            torch.testing.assert_close(item.data, image.data)
+
+    def test_stack_mask(self):
+        images = [self.data.get_random_image() for _ in range(2)]
+        for image in images:
+            image.mask = torch.rand((1, 3, 8, 8)) > 0.5
+        batch = ImageData.stack(images)
+        self.assertEqual(batch.mask.shape, (2, 1, 3, 8, 8))
+        torch.testing.assert_close(batch.unstack()[1].mask, images[1].mask)
+
+        images[1]._mask = None
+        with self.assertRaises(ValueError):
+            ImageData.stack(images)
+
+    def test_stack_qmri_compact(self):
+        qmris = [QMRIData(t1=torch.rand((3, 8, 8))) for _ in range(3)]
+        batch = QMRIData.stack(qmris)
+
+        self.assertEqual(batch.shape, (3, 3, 8, 8))
+        # Default rho stays broadcast
+        self.assertEqual(batch._rho.shape, (3, 1, 1, 1))
+        torch.testing.assert_close(batch.t1[1], qmris[1].t1)
+        torch.testing.assert_close(batch.unstack()[2].rho, qmris[2].rho)
+
+    def test_unstack_views(self):
+        batch = QMRIData(t1=torch.rand((2, 3, 8, 8)))
+        self.assertTrue(batch.is_batched)
+        items = batch.unstack()
+        self.assertEqual(items[1].shape, (3, 8, 8))
+        self.assertEqual(items[1].t1.data_ptr(), batch.t1[1].data_ptr())
+
+    def test_stack_exceptions(self):
+        with self.assertRaises(ValueError):
+            ImageData.stack([])
+        image = self.data.get_random_image()
+        with self.assertRaises(ValueError):
+            ImageData.stack([image, TestData().get_random_image()])
+        batch = ImageData.stack([image, image])
+        with self.assertRaises(ValueError):
+            ImageData.stack([batch, batch])
+        with self.assertRaises(ValueError):
+            image.unstack()
+
+
+class TestDeviceMoves(unittest.TestCase):
+
+    def test_qmri_to_keeps_broadcast(self):
+        qmri = QMRIData(t1=torch.rand((4, 16, 16)))
+        moved = qmri.to('cpu')
+        # Default rho is not materialized
+        self.assertEqual(moved._rho.shape, (1, 1, 1))
+        self.assertEqual(moved.shape, qmri.shape)
+        torch.testing.assert_close(moved.rho, qmri.rho)
+        # Tensors already on the device are shared
+        self.assertEqual(moved._t1.data_ptr(), qmri._t1.data_ptr())
+
+    def test_image_to_keeps_mask_and_header(self):
+        image = ImageData(torch.rand((1, 1, 1, 16)))
+        image.mask = torch.ones((1, 1, 8, 1), dtype=torch.bool)
+        image.header = {'spacing': (1., 2., 3.)}
+        moved = image.to('cpu')
+
+        self.assertEqual(moved._data.shape, (1, 1, 1, 16))
+        self.assertEqual(moved.shape, (1, 1, 8, 16))
+        torch.testing.assert_close(moved.mask, image.mask)
+        self.assertEqual(moved.header, image.header)
+        self.assertIsNot(moved.header, image.header)
+
+    def test_clone_copies(self):
+        qmri = QMRIData(t1=torch.rand((4, 16, 16)), rho=torch.tensor(2.))
+        qmri.header = {'descrip': 'test'}
+        cloned = qmri.clone()
+
+        self.assertNotEqual(cloned._t1.data_ptr(), qmri._t1.data_ptr())
+        self.assertEqual(cloned._rho.ndim, 0)
+        cloned.t1.fill_(0.)
+        self.assertTrue(bool((qmri.t1 > 0).any()))
+        self.assertEqual(cloned.header, qmri.header)
+
+    def test_to_batched(self):
+        batch = ImageData.stack([ImageData(torch.rand((1, 2, 4, 4)))] * 3)
+        moved = batch.cpu()
+        self.assertTrue(moved.is_batched)
+        self.assertEqual(moved.header, batch.header)
+        torch.testing.assert_close(moved.data, batch.data)
+
+
+class TestTransfer(unittest.TestCase):
+
+    def setUp(self):
+        self.qmri = QMRIData(t1=torch.rand((4, 16, 16)))
+        self.qmri.mask = torch.ones((4, 16, 16), dtype=torch.bool)
+
+    def test_to_inplace(self):
+        t1_ptr = self.qmri._t1.data_ptr()
+        moved = self.qmri.to_('cpu', non_blocking=True)
+        self.assertIs(moved, self.qmri)
+        # Tensors already on the device are reused
+        self.assertEqual(moved._t1.data_ptr(), t1_ptr)
+        self.assertEqual(moved._rho.shape, (1, 1, 1))
+
+    def test_non_blocking(self):
+        moved = self.qmri.cpu(non_blocking=True)
+        torch.testing.assert_close(moved.t1, self.qmri.t1)
+        self.assertFalse(moved.is_pinned())
+
+    def test_pin_memory_calls(self):
+        # Pinning needs an accelerator, so only the calls are checked here
+        pinned_shapes = []
+
+        def pin_memory(tensor):
+            pinned_shapes.append(tuple(tensor.shape))
+            return tensor.clone()
+
+        with patch.object(torch.Tensor, 'pin_memory', pin_memory):
+            pinned = self.qmri.pin_memory()
+        # t1, rho and mask are pinned in their compact shape
+        self.assertEqual(pinned_shapes,
+                         [(4, 16, 16), (1, 1, 1), (4, 16, 16)])
+        self.assertEqual(pinned._rho.shape, (1, 1, 1))
+        self.assertIsNot(pinned, self.qmri)
+
+    @unittest.skipUnless(torch.cuda.is_available(), 'Requires CUDA')
+    def test_pin_memory_cuda(self):
+        pinned = self.qmri.pin_memory()
+        self.assertTrue(pinned.is_pinned())
+        moved = pinned.cuda(non_blocking=True)
+        torch.cuda.synchronize()
+        self.assertEqual(moved.device.type, 'cuda')
+        torch.testing.assert_close(moved.t1.cpu(), self.qmri.t1)
+
+
+class TestStorage(unittest.TestCase):
+
+    def setUp(self):
+        generator = torch.Generator().manual_seed(0)
+        self.qmri = QMRIData(
+            t1=torch.rand((16, 32, 32), generator=generator) + 0.1,
+            rho=torch.rand((16, 32, 32), generator=generator) + 0.1)
+
+    def test_memory(self):
+        for dtype, ratio in [(torch.float16, 0.5), (torch.bfloat16, 0.5),
+                             (torch.int16, 0.5), (torch.uint8, 0.25)]:
+            stored = self.qmri.to_storage(dtype)
+            self.assertEqual(stored.nbytes, ratio * self.qmri.nbytes)
+            self.assertEqual(stored.storage_dtypes,
+                             {'t1': dtype, 'rho': dtype})
+
+    def test_accuracy(self):
+        # Documented accuracy of MRData.to_storage
+        mrsig = MRSigFlash()
+        param = MRParamGRE(tr=20e-3, alpha=0.3)
+        reference = mrsig(self.qmri, param).data
+        for dtype, tolerance in [(torch.int16, 1e-4), (torch.float16, 1e-3),
+                                 (torch.bfloat16, 1e-2), (torch.uint8, 3e-2)]:
+            image = mrsig(self.qmri.to_storage(dtype), param)
+            self.assertEqual(image.data.dtype, torch.float32)
+            error = (image.data - reference).abs() / reference.abs()
+            self.assertLess(float(error.max()), tolerance)
+
+    def test_quantized_getters(self):
+        stored = self.qmri.to_storage(torch.uint8)
+        self.assertEqual(stored.t1.dtype, torch.float32)
+        torch.testing.assert_close(stored.t1, self.qmri.t1, atol=3e-3,
+                                   rtol=0.)
+        # Setting a map removes its quantization
+        stored.t1 = self.qmri.t1
+        torch.testing.assert_close(stored.t1, self.qmri.t1)
+        self.assertEqual(stored.storage_dtypes['rho'], torch.uint8)
+
+    def test_default_t1_not_quantized(self):
+        stored = QMRIData(rho=torch.rand((4, 8, 8))).to_storage(torch.int16)
+        self.assertEqual(stored.storage_dtypes,
+                         {'t1': torch.float32, 'rho': torch.int16})
+        self.assertTrue(bool(torch.isinf(stored.t1).all()))
+
+    def test_upcast(self):
+        self.assertIs(self.qmri.upcast(), self.qmri)
+        stored = self.qmri.to_storage(torch.bfloat16)
+        upcast = stored.upcast()
+        self.assertEqual(upcast.storage_dtypes,
+                         {'t1': torch.float32, 'rho': torch.float32})
+        torch.testing.assert_close(upcast.t1, stored.t1.float())
+
+    def test_stack_quantized(self):
+        qmris = [self.qmri.to_storage(torch.uint8),
+                 QMRIData(t1=self.qmri.t1 * 2).to_storage(torch.uint8)]
+        batch = QMRIData.stack(qmris)
+        torch.testing.assert_close(batch.t1[1], qmris[1].t1)
+        items = ImageData.stack([ImageData(self.qmri.t1[None])] * 2
+                                ).to_storage(torch.int16).unstack()
+        torch.testing.assert_close(items[1].data, self.qmri.t1[None],
+                                   atol=1e-4, rtol=0.)
@@ -0,0 +1,133 @@
+"""Tests of the binary QMRIData cache."""
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import nibabel as nib
+import numpy as np
+import torch
+
+from inhomcorr.data_loader.data_loader_nii import QMRIDataLoaderNii
+from inhomcorr.data_loader.qmri_cache import _replace_file
+from inhomcorr.data_loader.qmri_cache import load_qmri_cache
+from inhomcorr.data_loader.qmri_cache import save_qmri_cache
+from inhomcorr.data_loader.qmri_dataset_nii import QMRIDatasetNii
+from inhomcorr.mrdata import QMRIData
+
+
+class TestQMRICache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmp_dir.name)
+        self.nii_file = self.folder / 'sub.nii.gz'
+        dat4d = np.random.rand(6, 5, 4, 3).astype(np.float32)
+        nib.save(nib.Nifti1Image(dat4d, affine=np.eye(4)), self.nii_file)
+        loader = QMRIDataLoaderNii()
+        loader.load_all(self.nii_file)
+        self.qmri = loader.get_data()
+        self.qmri.mask = self.qmri.t1 > 0.5
+        self.cache_dir = self.folder / 'cache'
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_roundtrip(self):
+        save_qmri_cache(self.qmri, self.cache_dir, [self.nii_file])
+        qmri = load_qmri_cache(self.cache_dir, [self.nii_file])
+
+        torch.testing.assert_close(qmri.t1, self.qmri.t1)
+        torch.testing.assert_close(qmri.rho, self.qmri.rho)
+        torch.testing.assert_close(qmri.mask, self.qmri.mask)
+        for key, value in self.qmri.header.items():
+            np.testing.assert_array_equal(qmri.header[key], value)
+            self.assertEqual(np.asarray(qmri.header[key]).dtype,
+                             np.asarray(value).dtype)
+
+        # Maps are memory-mapped copy-on-write
+        qmri.t1.mul_(2)
+        qmri_reload = load_qmri_cache(self.cache_dir, [self.nii_file])
+        torch.testing.assert_close(qmri_reload.t1, self.qmri.t1)
+
+    def test_compact(self):
+        # Constant T1 is broadcast and rho is quantized
+        qmri = QMRIData(t1=torch.ones(1, 1, 1), rho=self.qmri.rho)
+        qmri = qmri.to_storage(torch.uint8)
+        save_qmri_cache(qmri, self.cache_dir, [self.nii_file])
+        self.assertEqual(np.load(self.cache_dir / 't1.npy').shape, (1, 1, 1))
+
+        qmri_cached = load_qmri_cache(self.cache_dir, [self.nii_file])
+        self.assertEqual(qmri_cached.nbytes, qmri.nbytes)
+        self.assertEqual(qmri_cached.shape, qmri.shape)
+        self.assertEqual(qmri_cached.storage_dtypes, qmri.storage_dtypes)
+        torch.testing.assert_close(qmri_cached.t1, qmri.t1)
+        torch.testing.assert_close(qmri_cached.rho, qmri.rho)
+
+    def test_resave(self):
+        save_qmri_cache(self.qmri, self.cache_dir, [self.nii_file])
+        qmri = load_qmri_cache(self.cache_dir, [self.nii_file])
+        t1 = qmri.t1.clone()
+
+        # Saving again must not change maps loaded from the old entry
+        qmri_new = QMRIData(t1=self.qmri.t1 + 1, rho=self.qmri.rho)
+        save_qmri_cache(qmri_new, self.cache_dir, [self.nii_file])
+        torch.testing.assert_close(qmri.t1, t1)
+        torch.testing.assert_close(
+            load_qmri_cache(self.cache_dir, [self.nii_file]).t1, qmri_new.t1)
+
+    def test_concurrent_writers(self):
+        self.cache_dir.mkdir()
+        file = self.cache_dir / 't1.npy'
+        # Interleaved writers use separate temporary files
+        with _replace_file(file) as first:
+            with _replace_file(file) as second:
+                np.save(second, np.zeros(3))
+            np.save(first, np.ones(3))
+        np.testing.assert_array_equal(np.load(file), np.ones(3))
+        self.assertEqual(list(self.cache_dir.glob('*.tmp')), [])
+
+    def test_interrupted_save(self):
+        save_qmri_cache(self.qmri, self.cache_dir, [self.nii_file])
+        with patch('numpy.save', side_effect=OSError), \
+                self.assertRaises(OSError):
+            save_qmri_cache(self.qmri, self.cache_dir, [self.nii_file])
+        # No temporary files remain and the entry is incomplete
+        self.assertEqual(list(self.cache_dir.glob('*.tmp')), [])
+        self.assertIsNone(load_qmri_cache(self.cache_dir, [self.nii_file]))
+
+    def test_invalidation(self):
+        self.assertIsNone(load_qmri_cache(self.cache_dir, [self.nii_file]))
+        save_qmri_cache(self.qmri, self.cache_dir, [self.nii_file])
+
+        stat = os.stat(self.nii_file)
+        os.utime(self.nii_file,
+                 ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertIsNone(load_qmri_cache(self.cache_dir, [self.nii_file]))
+        self.assertIsNone(load_qmri_cache(self.cache_dir, []))
+
+    def test_hash_invalidation(self):
+        save_qmri_cache(self.qmri, self.cache_dir, [self.nii_file],
+                        hash_content=True)
+        stat = os.stat(self.nii_file)
+        with open(self.nii_file, 'r+b') as file:
+            file.seek(-1, os.SEEK_END)
+            last = file.read(1)
+            file.seek(-1, os.SEEK_END)
+            file.write(bytes([last[0] ^ 1]))
+        # Restore the modification time, only the hash detects the change
+        os.utime(self.nii_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertIsNotNone(load_qmri_cache(self.cache_dir, [self.nii_file]))
+        self.assertIsNone(load_qmri_cache(self.cache_dir, [self.nii_file],
+                                          hash_content=True))
+
+    def test_dataset_cache(self):
+        dataset = QMRIDatasetNii.from_directory(self.folder,
+                                                cache_dir=self.cache_dir)
+        qmri = dataset[0]
+        with patch.object(QMRIDatasetNii, '_load_subject') as load_subject:
+            qmri_cached = dataset[0]
+            load_subject.assert_not_called()
+        torch.testing.assert_close(qmri_cached.t1, qmri.t1)
+        torch.testing.assert_close(qmri_cached.rho, qmri.rho)
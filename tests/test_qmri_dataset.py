@@ -0,0 +1,89 @@
+"""Tests of the QMRIData dataset of nifti files."""
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from inhomcorr.data_loader.qmri_dataset_nii import QMRIDatasetNii
+from inhomcorr.data_loader.qmri_dataset_nii import QMRISubjectNii
+from inhomcorr.mrdata import QMRIData
+
+
+class TestQMRIDatasetNii(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmp_dir.name)
+        self.shape = (6, 5, 4, 3)
+        self.data = []
+        for i in range(5):
+            dat4d = np.random.rand(*self.shape).astype(np.float32) + i
+            nib.save(nib.Nifti1Image(dat4d, affine=np.eye(4)),
+                     self.folder / f'sub{i}.nii.gz')
+            self.data.append(dat4d)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_from_directory(self):
+        dataset = QMRIDatasetNii.from_directory(self.folder)
+        self.assertEqual(len(dataset), 5)
+
+        qmri = dataset[3]
+        self.assertIsInstance(qmri, QMRIData)
+        torch.testing.assert_close(
+            qmri.t1, torch.from_numpy(self.data[3][..., 2].T.copy()))
+
+    def test_storage_dtype(self):
+        dataset = QMRIDatasetNii.from_directory(
+            self.folder, storage_dtype=torch.float16)
+        qmri = dataset[3]
+        self.assertEqual(qmri.storage_dtypes,
+                         {'t1': torch.float16, 'rho': torch.float16})
+        torch.testing.assert_close(
+            qmri.t1.float(), torch.from_numpy(self.data[3][..., 2].T.copy()),
+            atol=0., rtol=1e-3)
+
+    def test_from_manifest(self):
+        # T1 and m0 of the second subject are stored in different files
+        manifest = [{'t1_file': 'sub0.nii.gz', 't1_dim': 1},
+                    {'t1_file': 'sub1.nii.gz', 'rho_file': 'sub2.nii.gz',
+                     'm0_dim': 2}]
+        with open(self.folder / 'manifest.json', 'w') as file:
+            json.dump(manifest, file)
+        dataset = QMRIDatasetNii.from_manifest(self.folder / 'manifest.json')
+
+        self.assertEqual(dataset.subjects[0],
+                         QMRISubjectNii(self.folder / 'sub0.nii.gz', t1_dim=1))
+        torch.testing.assert_close(
+            dataset[0].t1, torch.from_numpy(self.data[0][..., 1].T.copy()))
+        m0 = torch.from_numpy(self.data[2][..., 2].T.copy())
+        torch.testing.assert_close(dataset[1].rho, m0 / m0.max())
+
+    def test_prefetch(self):
+        dataset = QMRIDatasetNii.from_directory(self.folder)
+        indices = [4, 0, 2, 2, 1]
+        qmri_list = list(dataset.prefetch(indices, num_threads=2,
+                                          read_ahead=2))
+        self.assertEqual(len(qmri_list), len(indices))
+        for index, qmri in zip(indices, qmri_list):
+            torch.testing.assert_close(qmri.t1, dataset[index].t1)
+
+    def test_prefetch_early_stop(self):
+        dataset = QMRIDatasetNii.from_directory(self.folder)
+        prefetch = dataset.prefetch(read_ahead=3)
+        self.assertIsInstance(next(prefetch), QMRIData)
+        prefetch.close()
+
+    def test_data_loader(self):
+        dataset = QMRIDatasetNii.from_directory(self.folder)
+        loader = DataLoader(dataset, batch_size=2, num_workers=2,
+                            collate_fn=list)
+        batches = list(loader)
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        torch.testing.assert_close(batches[1][1].t1, dataset[3].t1)
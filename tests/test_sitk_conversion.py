@@ -0,0 +1,84 @@
+"""Tests of the conversion between ImageData and SimpleITK images."""
+import unittest
+
+import numpy as np
+import torch
+
+from inhomcorr.mrdata import ImageData
+from inhomcorr.sitk_conversion import image_to_sitk
+from inhomcorr.sitk_conversion import mask_to_sitk
+from inhomcorr.sitk_conversion import sitk_to_image
+from tests.testdata import TestData
+
+
+class TestSitkConversion(unittest.TestCase):
+
+    def setUp(self):
+        self.shape = (1, 4, 6, 8)
+        self.image = TestData(img_shape=self.shape).get_random_image()
+        self.image.header = {'spacing': (0.5, 1., 2.), 'origin': (1, 2, 3)}
+
+    def test_roundtrip(self):
+        sitk_img = image_to_sitk(self.image)
+        self.assertEqual(sitk_img.GetSize(), self.shape[:0:-1])
+        self.assertEqual(sitk_img.GetSpacing(), (0.5, 1., 2.))
+        self.assertEqual(sitk_img.GetOrigin(), (1., 2., 3.))
+
+        image = sitk_to_image(sitk_img, header=self.image.header)
+        self.assertEqual(image.shape, self.shape)
+        torch.testing.assert_close(image.data, self.image.data)
+        self.assertEqual(image.header['spacing'], (0.5, 1., 2.))
+        self.assertEqual(image.header['origin'], (1., 2., 3.))
+
+    def test_roundtrip_2d(self):
+        image = TestData(img_shape=(1, 1, 6, 8)).get_random_image()
+        image.header = {'spacing': (0.5, 1., 2.)}
+        sitk_img = image_to_sitk(image)
+        self.assertEqual(sitk_img.GetSpacing(), (0.5, 1.))
+
+        image_out = sitk_to_image(sitk_img, header=image.header)
+        self.assertEqual(image_out.shape, image.shape)
+        self.assertEqual(image_out.header['spacing'], (0.5, 1., 2.))
+        torch.testing.assert_close(image_out.data, image.data)
+
+    def test_roundtrip_inner_singleton(self):
+        image = TestData(img_shape=(1, 4, 1, 8)).get_random_image()
+        image.header = {'spacing': (0.5, 1., 2.), 'origin': (1., 2., 3.)}
+        sitk_img = image_to_sitk(image)
+        self.assertEqual(sitk_img.GetSpacing(), (0.5, 2.))
+        sitk_img.SetOrigin((-1., -3.))
+
+        image_out = sitk_to_image(sitk_img, header=image.header,
+                                  shape=image.shape)
+        self.assertEqual(image_out.shape, image.shape)
+        torch.testing.assert_close(image_out.data, image.data)
+        self.assertEqual(image_out.header['spacing'], (0.5, 1., 2.))
+        self.assertEqual(image_out.header['origin'], (-1., 2., -3.))
+
+    def test_nifti_header(self):
+        self.image.header = {'pixdim': np.array([1., 3., 2., 1., 0, 0, 0, 0]),
+                             'qoffset_x': np.array(-1.),
+                             'qoffset_y': np.array(-2.),
+                             'qoffset_z': np.array(-3.)}
+        sitk_img = image_to_sitk(self.image)
+        self.assertEqual(sitk_img.GetSpacing(), (3., 2., 1.))
+        self.assertEqual(sitk_img.GetOrigin(), (-1., -2., -3.))
+
+    def test_broadcasted_data(self):
+        image = ImageData(torch.arange(8.).reshape(1, 1, 1, 8))
+        image.mask = torch.ones((1, 1, 6, 1))
+        sitk_img = image_to_sitk(image)
+        self.assertEqual(sitk_img.GetSize(), (8, 6))
+
+        mask_img = mask_to_sitk(image, sitk_img)
+        self.assertEqual(mask_img.GetSize(), (8, 6))
+
+    def test_transform(self):
+        sitk_img = image_to_sitk(self.image)
+        image = sitk_to_image(sitk_img, transform=np.exp)
+        torch.testing.assert_close(image.data, self.image.data.exp())
+
+    def test_multi_channel_exception(self):
+        image = TestData(img_shape=(2, 4, 6, 8)).get_random_image()
+        with self.assertRaises(ValueError):
+            image_to_sitk(image)
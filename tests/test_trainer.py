@@ -0,0 +1,122 @@
+"""Tests of the supervised trainer."""
+import copy
+import tempfile
+import unittest
+from pathlib import Path
+
+import torch
+
+from inhomcorr.bias_creator.torchio_bias import BiasCreatorTorchio
+from inhomcorr.bias_estimator.supervised_training_dataset_flash import (
+    SupervisedTrainingDatasetFlash,
+)
+from inhomcorr.bias_estimator.supervised_training_dataset_interface import (
+    SupervisedTrainingDataset,
+)
+from inhomcorr.bias_estimator.trainer_supervised import SupervisedTrainer
+from inhomcorr.bias_estimator.trainer_supervised import (
+    SupervisedTrainingParameters,
+)
+from tests.testdata import TestData
+
+
+class TensorTrainingDataset(SupervisedTrainingDataset):
+    """Map-style dataset of fixed images and bias fields."""
+
+    def __init__(self, images: torch.Tensor, bias: torch.Tensor) -> None:
+        self.images = images
+        self.bias = bias
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    def __getitem__(self, index: int) -> tuple[torch.Tensor, torch.Tensor]:
+        return self.images[index], self.bias[index]
+
+
+class TestSupervisedTrainer(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = torch.nn.Conv3d(1, 1, 3, padding=1)
+        testdata = TestData(qmri_shape=(4, 8, 8))
+        self.dataset = SupervisedTrainingDatasetFlash(
+            [testdata.get_random_qmri() for _ in range(2)],
+            BiasCreatorTorchio(), chunk_size=4)
+        images = torch.rand(8, 1, 4, 8, 8)
+        self.tensor_dataset = TensorTrainingDataset(images, 2 * images + 1)
+
+    def test_training(self):
+        params = SupervisedTrainingParameters(numberSteps=40, batchSize=4,
+                                              learningRate=1e-2, logEvery=10)
+        trainer = SupervisedTrainer(self.model, params)
+        trainer(self.tensor_dataset)
+
+        self.assertEqual(trainer.step, 40)
+        self.assertEqual([entry['step'] for entry in trainer.history],
+                         [10, 20, 30, 40])
+        self.assertLess(trainer.history[-1]['loss'],
+                        trainer.history[0]['loss'])
+        self.assertTrue(all(entry['samples_per_s'] > 0
+                            for entry in trainer.history))
+        # Two batches per epoch
+        self.assertEqual(trainer.epoch, 19)
+
+    def test_gradient_accumulation(self):
+        models = [copy.deepcopy(self.model) for _ in range(2)]
+        for model, batch_size, accumulation in zip(models, (4, 2), (1, 2)):
+            params = SupervisedTrainingParameters(
+                numberSteps=3, batchSize=batch_size,
+                accumulationSteps=accumulation)
+            optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+            SupervisedTrainer(model, params, optimizer)(self.tensor_dataset)
+
+        for param_full, param_accumulated in zip(models[0].parameters(),
+                                                 models[1].parameters()):
+            torch.testing.assert_close(param_accumulated, param_full)
+
+    def test_bfloat16(self):
+        params = SupervisedTrainingParameters(numberSteps=2, batchSize=2,
+                                              precision='bfloat16')
+        trainer = SupervisedTrainer(self.model, params)
+        trainer(self.dataset)
+
+        self.assertTrue(torch.isfinite(torch.tensor(
+            trainer.history[-1]['loss'])))
+        # Parameters are kept in float32
+        self.assertEqual(self.model.weight.dtype, torch.float32)
+
+    def test_workers(self):
+        params = SupervisedTrainingParameters(numberSteps=2, batchSize=2,
+                                              numberWorkers=2)
+        trainer = SupervisedTrainer(self.model, params)
+        trainer(self.dataset)
+        self.assertEqual(trainer.step, 2)
+
+    def test_checkpoint_resume(self):
+        with tempfile.TemporaryDirectory() as folder:
+            params = SupervisedTrainingParameters(numberSteps=4, batchSize=2,
+                                                  checkpointEvery=2)
+            trainer = SupervisedTrainer(self.model, params,
+                                        checkpoint_dir=folder)
+            trainer(self.dataset)
+            self.assertTrue((Path(folder) / 'checkpoint.pt').exists())
+
+            # Training resumes at step 4
+            model = torch.nn.Conv3d(1, 1, 3, padding=1)
+            params = SupervisedTrainingParameters(numberSteps=6, batchSize=2)
+            resumed = SupervisedTrainer(model, params, checkpoint_dir=folder)
+            resumed.load_checkpoint()
+            torch.testing.assert_close(model.weight, self.model.weight)
+            self.assertEqual(resumed.step, 4)
+            self.assertEqual(resumed.epoch, 1)
+
+            resumed(self.dataset)
+            self.assertEqual(resumed.step, 6)
+            self.assertEqual([entry['step'] for entry in resumed.history],
+                             [6])
+
+    def test_precision_exception(self):
+        with self.assertRaises(ValueError):
+            SupervisedTrainer(self.model, SupervisedTrainingParameters(
+                precision='float8'))
@@ -0,0 +1,64 @@
+"""Tests of the supervised training datasets."""
+import itertools
+import unittest
+
+import torch
+from torch.utils.data import DataLoader
+
+from inhomcorr.bias_creator.torchio_bias import BiasCreatorTorchio
+from inhomcorr.bias_estimator.supervised_training_dataset_flash import (
+    SupervisedTrainingDatasetFlash,
+)
+from inhomcorr.mrsig.flash import MRParamGRE
+from inhomcorr.mrsig.flash import MRSigFlash
+from tests.testdata import TestData
+
+
+class TestSupervisedTrainingDatasetFlash(unittest.TestCase):
+
+    def setUp(self):
+        self.qmri_shape = (2, 8, 6)
+        testdata = TestData(qmri_shape=self.qmri_shape)
+        self.qmri_data = [testdata.get_random_qmri() for _ in range(3)]
+
+    def test_samples(self):
+        dataset = SupervisedTrainingDatasetFlash(
+            self.qmri_data, BiasCreatorTorchio(), chunk_size=4)
+        samples = list(itertools.islice(dataset, 6))
+
+        self.assertEqual(len(samples), 6)
+        image, bias = samples[5]
+        self.assertEqual(image.shape, (1, *self.qmri_shape))
+        self.assertEqual(bias.shape, (1, *self.qmri_shape))
+        self.assertTrue(torch.all(bias > 0))
+
+    def test_simulate(self):
+        dataset = SupervisedTrainingDatasetFlash(
+            self.qmri_data, BiasCreatorTorchio(), chunk_size=2)
+        tr = torch.tensor([10e-3, 50e-3])
+        alpha = torch.tensor([0.1, 0.5])
+        images, bias = dataset.simulate(self.qmri_data[0], tr, alpha)
+
+        # Corrupted images are the FLASH images times the bias fields
+        image_ref = MRSigFlash()(self.qmri_data[0],
+                                 MRParamGRE(tr=50e-3, alpha=0.5))
+        torch.testing.assert_close(images[1], image_ref.data * bias[1])
+
+    def test_reproducible(self):
+        dataset = SupervisedTrainingDatasetFlash(
+            self.qmri_data, BiasCreatorTorchio(), chunk_size=2, seed=3)
+        first = list(itertools.islice(dataset, 3))
+        second = list(itertools.islice(dataset, 3))
+        torch.testing.assert_close(first, second)
+
+    def test_data_loader(self):
+        dataset = SupervisedTrainingDatasetFlash(
+            self.qmri_data, BiasCreatorTorchio(), chunk_size=2)
+        loader = DataLoader(dataset, batch_size=3, num_workers=2)
+        images, bias = next(iter(loader))
+        self.assertEqual(images.shape, (3, 1, *self.qmri_shape))
+        self.assertEqual(bias.shape, (3, 1, *self.qmri_shape))
+
+    def test_empty_exception(self):
+        with self.assertRaises(ValueError):
+            SupervisedTrainingDatasetFlash([], BiasCreatorTorchio())
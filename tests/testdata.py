@@ -1,6 +1,7 @@
 """File containing a test data object."""
 import torch
 
+from inhomcorr.bias_creator.torchio_bias import BiasCreatorTorchio
 from inhomcorr.mrdata import ImageData
 from inhomcorr.mrdata import QMRIData
 from inhomcorr.mrsig.flash import MRParamGRE
@@ -58,6 +59,29 @@ class TestData:
         image = ImageData(torch.rand(self.img_shape, dtype=torch.float))
         return image
 
+    def get_bias_phantom(self, seed: int = 0,
+                         ) -> tuple[ImageData, ImageData, torch.Tensor]:
+        """Generate a sphere phantom corrupted by a random bias field.
+
+        Parameters
+        ----------
+        seed, optional
+            seed of the noise and the bias field, by default 0
+
+        Returns
+        -------
+            Tuple of corrupted image, bias field and mask of the sphere
+        """
+        generator = torch.Generator().manual_seed(seed)
+        grid = torch.meshgrid(
+            *[torch.linspace(-1, 1, size) for size in self.img_shape[-3:]],
+            indexing='ij')
+        mask = (sum(g**2 for g in grid) < 0.8)[None]
+        noise = torch.randn(mask.shape, generator=generator)
+        obj = mask * (1 + 0.02 * noise) + 0.01
+        bias = BiasCreatorTorchio(seed=seed).get_bias_field(ImageData(obj))
+        return ImageData(obj * bias.data), bias, mask
+
     def get_test_data(self) -> tuple[QMRIData, MRParamGRE, ImageData]:
         """Generate Test QMRI and Image Objects.
 